@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Generate thumbnail and preview images for the existing archive.
+
+Walks the storage directory and writes the missing <name>.preview.jpg and
+<name>.thumb.jpg next to every original. Already generated levels are skipped, so
+the job can be stopped and re-run at any time.
+
+Usage:
+    python backfill_thumbnails.py [--limit 500] [--workers 2] [--base-path ./uploads]
+"""
+
+import argparse
+import os
+import time
+
+from src.infrastructure.file_storage import FileStorageService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill thumbnail pyramids for stored images")
+    parser.add_argument("--base-path", default="./uploads")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many images")
+    parser.add_argument("--workers", type=int, default=None, help="Worker threads (default STORAGE_PYRAMID_WORKERS)")
+    args = parser.parse_args()
+
+    if args.workers:
+        os.environ["STORAGE_PYRAMID_WORKERS"] = str(args.workers)
+    storage = FileStorageService(args.base_path)
+
+    start = time.perf_counter()
+    stats = storage.backfill_pyramids(limit=args.limit)
+    elapsed = time.perf_counter() - start
+
+    print(f"scanned {stats['scanned']} images in {elapsed:.1f}s")
+    print(f"  generated: {stats['generated']}")
+    print(f"  failed:    {stats['failed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark bulk test result updates against the per-row path.
+
+Seeds a throwaway SQLite database (or DATABASE_URL, if set to a scratch database)
+and applies the same review to N results twice: once through update_test_result
+per row, as repeated PUT /api/results/{id} calls do, and once through
+bulk_update_test_results. Two workloads: every result gets the same change
+(confirming inconclusives as positive), and every result gets its own note.
+
+Usage:
+    python benchmarks/benchmark_bulk_update.py [--results 2000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk test result updates")
+    parser.add_argument("--results", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bulk-update-bench-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+    os.environ["STORAGE_RETENTION"] = "false"
+
+    from sqlalchemy import insert
+    from src.auth.models import TokenData
+    from src.database.core import Base, SessionLocal, engine
+    from src.entities.clinic import Clinic  # noqa: F401
+    from src.entities.patient import Patient  # noqa: F401
+    from src.entities.user import User  # noqa: F401
+    from src.entities.test_result import SyncStatus, TestResult, TestStatus
+    from src.results import models, service
+
+    Base.metadata.create_all(bind=engine)
+    user = TokenData(user_id=str(uuid.uuid4()))
+    start = datetime(2025, 1, 1)
+
+    def seed():
+        ids = [uuid.uuid4() for _ in range(args.results)]
+        with engine.begin() as connection:
+            connection.execute(insert(TestResult), [
+                {
+                    "id": result_id, "patient_id": uuid.uuid4(), "clinic_id": uuid.uuid4(),
+                    "health_worker_id": uuid.uuid4(), "test_date": start + timedelta(minutes=i),
+                    "result": TestStatus.Inconclusive, "image_path": f"bench/{i}.jpg", "image_filename": f"{i}.jpg",
+                    "sync_status": SyncStatus.Pending, "created_at": start,
+                }
+                for i, result_id in enumerate(ids)
+            ])
+        return ids
+
+    workloads = {
+        "same change": lambda i: {"result": TestStatus.Positive},
+        "per-row notes": lambda i: {"notes": f"Reviewed slide {i}"},
+    }
+    for name, change in workloads.items():
+        ids = seed()
+        db = SessionLocal()
+        started = time.perf_counter()
+        for i, result_id in enumerate(ids):
+            service.update_test_result(user, db, result_id, models.TestResultUpdate(**change(i)))
+        per_row = time.perf_counter() - started
+        db.close()
+
+        ids = seed()
+        db = SessionLocal()
+        request = models.BulkUpdateRequest(updates=[
+            models.BulkUpdateItem(id=result_id, **change(i)) for i, result_id in enumerate(ids)
+        ])
+        started = time.perf_counter()
+        outcome = service.bulk_update_test_results(user, db, request)
+        bulk = time.perf_counter() - started
+        db.close()
+        assert outcome.updated == len(ids)
+
+        print(f"{name:>14}: per-row {len(ids) / per_row:9.0f} results/s ({per_row:6.2f}s)   "
+              f"bulk {len(ids) / bulk:9.0f} results/s ({bulk:6.3f}s)   {per_row / bulk:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
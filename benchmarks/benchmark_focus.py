@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark best-frame capture against the mock camera.
+
+Measures sharpness scoring throughput and how close a lens sweep lands to the
+simulated focus position, so the focus algorithm can be tuned off-device.
+
+Usage:
+    python benchmarks/benchmark_focus.py [--resolution 2304x1296] [--steps 8] [--runs 5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.infrastructure.camera_service import CameraService, compute_sharpness, score_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark best-frame capture")
+    parser.add_argument("--resolution", default="2304x1296")
+    parser.add_argument("--steps", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["CAMERA_STREAM_RESOLUTION"] = args.resolution
+    camera = CameraService(streaming=False)
+    width, height = camera.stream_resolution
+
+    frames = np.random.default_rng(0).integers(0, 255, size=(args.steps, height, width, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    for frame in frames:
+        compute_sharpness(frame)
+    per_frame = (time.perf_counter() - start) / len(frames) * 1000
+    start = time.perf_counter()
+    score_frames(frames)
+    batched = (time.perf_counter() - start) / len(frames) * 1000
+    print(f"Sharpness scoring at {width}x{height}: {per_frame:.2f}ms/frame, batched {batched:.2f}ms/frame")
+
+    errors, timings = [], []
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in range(args.runs):
+            camera.mock_focus_position = float(rng.uniform(*camera.focus_range))
+            start = time.perf_counter()
+            camera.capture_best(os.path.join(tmp, f"best_{run}.jpg"), mode="sweep", steps=args.steps)
+            timings.append((time.perf_counter() - start) * 1000)
+            errors.append(abs(camera.lens_position - camera.mock_focus_position))
+
+    step = (camera.focus_range[1] - camera.focus_range[0]) / max(1, args.steps - 1)
+    print(f"Sweep of {args.steps} steps: {np.mean(timings):.1f}ms mean, {np.max(timings):.1f}ms max")
+    print(f"Focus error: {np.mean(errors):.2f} mean, {np.max(errors):.2f} max (step size {step:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark mock camera captures.
+
+Compares rendering a synthetic smear from scratch (render + JPEG encode) with
+serving captures from the precomputed frame pool.
+
+Usage:
+    python benchmarks/benchmark_mock_camera.py [--resolution 2304x1296] [--captures 50]
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+
+from src.infrastructure.camera_service import CameraService, _parse_resolution
+from src.infrastructure.synthetic_smear import synthesize_smear
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mock camera captures")
+    parser.add_argument("--resolution", default="2304x1296")
+    parser.add_argument("--captures", type=int, default=50)
+    args = parser.parse_args()
+    resolution = _parse_resolution(args.resolution, (2304, 1296))
+
+    start = time.perf_counter()
+    for seed in range(5):
+        frame, _ = synthesize_smear(resolution, seed=seed, parasitemia=0.02)
+        Image.fromarray(frame).save(io.BytesIO(), "JPEG", quality=90)
+    render_ms = (time.perf_counter() - start) / 5 * 1000
+    print(f"Render + encode per frame: {render_ms:.1f}ms")
+
+    camera = CameraService(streaming=False)
+    camera.resolution = resolution
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        camera.capture_image(os.path.join(tmp, "warmup.jpg"))
+        print(f"Pool build (first capture): {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        start = time.perf_counter()
+        for i in range(args.captures):
+            camera.capture_image(os.path.join(tmp, f"capture_{i}.jpg"))
+        pooled_ms = (time.perf_counter() - start) / args.captures * 1000
+    print(f"Pooled capture: {pooled_ms:.2f}ms ({render_ms / pooled_ms:.0f}x faster than rendering)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark loading test results for analysis: paging through the JSON API versus
+reading the Parquet snapshot.
+
+Seeds a throwaway SQLite database with synthetic results across a few districts
+and months, then times (1) fetching every result from GET /api/results/ page by
+page into a list of dicts, (2) writing the snapshot with snapshot_results.py's
+job, and (3) reading the snapshot into pandas, whole and for one district and
+month. Requires pyarrow and pandas.
+
+Usage:
+    python benchmarks/benchmark_parquet_snapshot.py [--results 200000] [--page-size 1000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+DISTRICTS = ["Gulu", "Lira", "Kampala", "Mbarara", "Arua"]
+
+
+def seed(engine, results: int):
+    from sqlalchemy import insert
+    from src.entities.clinic import Clinic
+    from src.entities.test_result import SyncStatus, TestResult, TestStatus
+
+    clinics = [{"id": uuid.uuid4(), "name": f"{d} HC IV", "district": d, "region": "Region"} for d in DISTRICTS]
+    start = datetime(2024, 1, 1)
+    statuses = list(TestStatus)
+    with engine.begin() as connection:
+        connection.execute(insert(Clinic), clinics)
+        for offset in range(0, results, 50000):
+            connection.execute(insert(TestResult), [
+                {
+                    "id": uuid.uuid4(), "patient_id": uuid.uuid4(), "clinic_id": random.choice(clinics)["id"],
+                    "health_worker_id": uuid.uuid4(), "test_date": start + timedelta(minutes=3 * i),
+                    "result": random.choice(statuses), "confidence_score": random.random(),
+                    "image_path": f"bench/{i}.jpg", "image_filename": f"{i}.jpg", "model_version": "yolov11n",
+                    "processing_time_ms": random.uniform(50, 300), "sync_status": SyncStatus.Pending,
+                    "created_at": start,
+                }
+                for i in range(offset, min(offset + 50000, results))
+            ])
+
+
+def timed(label: str, func):
+    started = time.perf_counter()
+    value = func()
+    print(f"{label:>36}: {time.perf_counter() - started:8.2f}s")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Parquet snapshot against the JSON API")
+    parser.add_argument("--results", type=int, default=200000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    workdir = tempfile.mkdtemp(prefix="snapshot-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ["ANALYTICS_SNAPSHOT_DIR"] = f"{workdir}/snapshots"
+    os.environ["STORAGE_RETENTION"] = "false"
+    os.environ["PAGE_SIZE_MAX"] = str(args.page_size)
+
+    from fastapi.testclient import TestClient
+    from src.database.core import engine
+    from src.infrastructure.parquet_snapshots import ParquetSnapshots
+    from src.main import app
+
+    timed(f"seed {args.results} results", lambda: seed(engine, args.results))
+
+    client = TestClient(app)
+    client.post("/auth/", json={"email": "bench@example.com", "password": "benchmark123",
+                                "first_name": "Bench", "last_name": "Mark"})
+    token = client.post("/auth/token", data={"username": "bench@example.com", "password": "benchmark123",
+                                             "grant_type": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def page_api():
+        rows, cursor = [], None
+        while True:
+            params = {"limit": args.page_size, **({"cursor": cursor} if cursor else {})}
+            response = client.get("/api/results/", headers=headers, params=params)
+            rows.extend(response.json())
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                return pd.DataFrame(rows)
+
+    api_frame = timed("JSON API, all pages -> DataFrame", page_api)
+    snapshots = ParquetSnapshots()
+    stats = timed("write snapshot (full)", snapshots.run)
+    timed("incremental run, nothing changed", snapshots.run)
+    frame = timed("read_parquet, everything", lambda: pd.read_parquet(snapshots.root))
+    one = timed("read_parquet, one district and month", lambda: pd.read_parquet(
+        snapshots.root, filters=[("district", "=", "Gulu"), ("month", "=", "2024-06")]
+    ))
+
+    size_mb = sum(p.stat().st_size for p in snapshots.root.rglob("*.parquet")) / (1024 * 1024)
+    print(f"rows: API {len(api_frame)}, snapshot {len(frame)}, one partition {len(one)}; "
+          f"{stats['partitions']} partitions, {size_mb:.1f} MB on disk in {workdir}")
+
+
+if __name__ == "__main__":
+    main()
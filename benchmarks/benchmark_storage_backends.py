@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark image storage backends.
+
+Saves and reads back the same set of images through local disk (dated and cas
+layouts) and, when an endpoint is given, an S3-compatible bucket, reporting
+per-image latency and throughput. Writes run on a thread pool to mimic concurrent
+uploads.
+
+Usage:
+    python benchmarks/benchmark_storage_backends.py [--images 200] [--size-kb 2048] [--threads 4]
+        [--s3-endpoint http://localhost:9000 --s3-bucket introspect-bench]
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.infrastructure.file_storage import FileStorageService
+
+
+def make_images(count: int, size_kb: int):
+    # Random payload behind a JPEG signature: incompressible and never deduplicated
+    return [b"\xff\xd8\xff" + os.urandom(size_kb * 1024 - 3) for _ in range(count)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run(name: str, storage: FileStorageService, images, threads: int):
+    storage.pyramid_enabled = False
+    total_mb = sum(len(i) for i in images) / (1024 * 1024)
+
+    def save(content):
+        staged = storage.stage_upload(io.BytesIO(content), "bench.jpg", max_bytes=len(content))
+        return timed(storage.commit_staged, staged, "bench-clinic")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        saved = list(pool.map(save, images))
+    write_s = time.perf_counter() - start
+    paths = [path for (path, _), _ in saved]
+    write_ms = [ms for _, ms in saved]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        read_ms = [ms for _, ms in pool.map(lambda p: timed(storage.read_image, p), paths)]
+    read_s = time.perf_counter() - start
+
+    for path in paths:
+        storage.delete_image(path)
+
+    print(f"{name:>12}: write {total_mb / write_s:7.1f} MB/s  p50 {statistics.median(write_ms):7.1f}ms  "
+          f"p95 {sorted(write_ms)[int(len(write_ms) * 0.95) - 1]:7.1f}ms | "
+          f"read {total_mb / read_s:7.1f} MB/s  p50 {statistics.median(read_ms):7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image storage backends")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=2048)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--s3-endpoint", default=os.getenv("S3_ENDPOINT_URL"))
+    parser.add_argument("--s3-bucket", default="introspect-bench")
+    args = parser.parse_args()
+
+    images = make_images(args.images, args.size_kb)
+    print(f"{args.images} images of {args.size_kb} KB, {args.threads} threads")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for layout in ("dated", "cas"):
+            run(f"local {layout}", FileStorageService(os.path.join(tmp, layout), layout=layout), images, args.threads)
+
+        if args.s3_endpoint:
+            from src.infrastructure.s3_storage import S3StorageService
+
+            storage = S3StorageService(bucket=args.s3_bucket, endpoint_url=args.s3_endpoint,
+                                       base_path=os.path.join(tmp, "s3"))
+            try:
+                storage.client.create_bucket(Bucket=args.s3_bucket)
+            except storage.client.exceptions.BucketAlreadyOwnedByYou:
+                pass
+            run("s3", storage, images, args.threads)
+
+
+if __name__ == "__main__":
+    main()
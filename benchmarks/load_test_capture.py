@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Load test the /capture-and-analyze pipeline against a running server.
+
+Start the server with the replay camera so captures come from recorded smears:
+
+    CAMERA_BACKEND=replay CAMERA_REPLAY_SOURCE=/path/to/smears \\
+    CAMERA_REPLAY_FPS=30 CAMERA_REPLAY_LATENCY_MS=300 uvicorn src.main:app
+
+then drive it at a fixed request rate:
+
+Usage:
+    python benchmarks/load_test_capture.py --patient-id <uuid> --clinic-id <uuid> \\
+        [--rate 2] [--duration 60] [--concurrency 4] [--base-url http://localhost:8000]
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+
+def login(base_url: str, email: str, password: str) -> str:
+    response = httpx.post(f"{base_url}/auth/token", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/results/capture-and-analyze")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", default="demo@introspect.com")
+    parser.add_argument("--password", default="Demo123!")
+    parser.add_argument("--patient-id", required=True)
+    parser.add_argument("--clinic-id", required=True)
+    parser.add_argument("--rate", type=float, default=2.0, help="Requests per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to run")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    token = login(args.base_url, args.email, args.password)
+    client = httpx.Client(
+        base_url=args.base_url, headers={"Authorization": f"Bearer {token}"}, timeout=60.0
+    )
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def fire():
+        start = time.perf_counter()
+        try:
+            response = client.post(
+                "/api/results/capture-and-analyze",
+                data={"patient_id": args.patient_id, "clinic_id": args.clinic_id},
+            )
+            ok = response.status_code == 201
+        except httpx.HTTPError:
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            (latencies if ok else errors).append(elapsed)
+
+    interval = 1.0 / args.rate
+    run_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        sent = 0
+        while time.perf_counter() - run_start < args.duration:
+            pool.submit(fire)
+            sent += 1
+            time.sleep(max(0.0, run_start + sent * interval - time.perf_counter()))
+    wall = time.perf_counter() - run_start
+
+    print(f"Sent {sent} requests in {wall:.1f}s ({len(latencies) / wall:.2f} successful req/s)")
+    print(f"Errors: {len(errors)}")
+    if latencies:
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+        print(f"Latency ms: p50 {statistics.median(latencies):.0f}, p95 {p95:.0f}, max {latencies[-1]:.0f}")
+
+
+if __name__ == "__main__":
+    main()
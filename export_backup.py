@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Back up images and database changes to removable media.
+
+Copies every image referenced by a test result that the drive does not already
+hold (content-addressed, verified by reading it back), writes a manifest of
+storage path -> SHA-256 and a compressed file of the database rows changed since
+the last export to the same drive. Re-run after an interruption to resume.
+
+Usage:
+    python export_backup.py /media/usb/introspect-backup [--workers 4] [--base-path ./uploads]
+"""
+
+import argparse
+import time
+
+from src.database.core import SessionLocal
+from src.entities.clinic import Clinic
+from src.entities.patient import Patient
+from src.entities.user import User
+from src.entities.test_result import TestResult
+from src.infrastructure.backup import BackupExporter
+from src.infrastructure.file_storage import FileStorageService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally export images and database changes")
+    parser.add_argument("target", help="Directory on the backup drive")
+    parser.add_argument("--base-path", default="./uploads")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    last_printed = [0.0]
+
+    def progress(stats):
+        if time.monotonic() - last_printed[0] >= 5:
+            last_printed[0] = time.monotonic()
+            print(f"  {stats['blobs_copied']} copied, {stats['blobs_skipped']} already on drive, "
+                  f"{stats['bytes_copied'] / (1024 * 1024):.1f} MB at {stats['mb_per_s']} MB/s", flush=True)
+
+    storage = FileStorageService(args.base_path)
+    storage.pyramid_enabled = False
+    exporter = BackupExporter(
+        args.target, storage, session_factory=SessionLocal,
+        workers=args.workers, batch_size=args.batch_size, progress=progress,
+    )
+    stats = exporter.run()
+
+    print(f"exported {stats['images']} images to {args.target} in {stats['elapsed_s']}s")
+    print(f"  copied:      {stats['blobs_copied']} blobs, {stats['bytes_copied'] / (1024 * 1024):.2f} MB "
+          f"({stats['mb_per_s']} MB/s)")
+    print(f"  skipped:     {stats['blobs_skipped']} already on the drive")
+    print(f"  unavailable: {stats['unavailable']} (evicted or missing locally)")
+    rows = ", ".join(f"{count} {table}" for table, count in stats["db_rows"].items())
+    print(f"  database:    {rows} -> {stats['db_delta']}")
+    print(f"  manifest:    {stats['manifest']}")
+
+
+if __name__ == "__main__":
+    main()
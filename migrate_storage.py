@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Migrate stored images to the content-addressed layout.
+
+Hashes every image referenced by a test result, moves it to
+uploads/cas/<ab>/<cd>/<sha256>.<ext>, repoints TestResult.image_path and
+removes duplicates. Set STORAGE_LAYOUT=cas afterwards so new uploads use it too.
+
+Usage:
+    python migrate_storage.py [--dry-run] [--batch-size 200] [--base-path ./uploads]
+"""
+
+import argparse
+
+from src.database.core import SessionLocal
+from src.entities.clinic import Clinic
+from src.entities.patient import Patient
+from src.entities.user import User
+from src.entities.test_result import TestResult
+from src.infrastructure.file_storage import FileStorageService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate images to content-addressed storage")
+    parser.add_argument("--base-path", default="./uploads")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true", help="Report without moving files")
+    args = parser.parse_args()
+
+    storage = FileStorageService(args.base_path, layout="cas")
+    db = SessionLocal()
+    try:
+        stats = storage.migrate_to_content_addressed(db, batch_size=args.batch_size, dry_run=args.dry_run)
+    finally:
+        db.close()
+
+    print(f"{'Dry run: ' if args.dry_run else ''}scanned {stats['results_scanned']} results")
+    print(f"  migrated:   {stats['files_migrated']} files")
+    print(f"  duplicates: {stats['duplicates']} files")
+    print(f"  missing:    {stats['missing']} files")
+    print(f"  reclaimed:  {stats['bytes_reclaimed'] / (1024 * 1024):.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
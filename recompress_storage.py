@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Recompress aged or synced smear images to WebP to free space on the SD card.
+
+Images of test results older than --older-than-days, or already synced to the
+central server, are re-encoded in a low-priority process pool. Each new file is
+decoded again before the original is replaced and TestResult.image_path repointed.
+
+Usage:
+    python recompress_storage.py [--older-than-days 30] [--no-synced] [--lossless]
+                                 [--workers 2] [--dry-run] [--base-path ./uploads]
+"""
+
+import argparse
+
+from src.database.core import SessionLocal
+from src.entities.clinic import Clinic
+from src.entities.patient import Patient
+from src.entities.user import User
+from src.entities.test_result import TestResult
+from src.infrastructure.file_storage import FileStorageService, TIER_LOSSLESS, TIER_QUALITY
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompress aged or synced images to WebP")
+    parser.add_argument("--base-path", default="./uploads")
+    parser.add_argument("--older-than-days", type=float, default=30)
+    parser.add_argument("--no-synced", action="store_true", help="Do not recompress synced results by default")
+    parser.add_argument("--quality", type=int, default=TIER_QUALITY)
+    parser.add_argument("--lossless", action="store_true", default=TIER_LOSSLESS)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--dry-run", action="store_true", help="Report candidates without re-encoding")
+    args = parser.parse_args()
+
+    storage = FileStorageService(args.base_path)
+    db = SessionLocal()
+    try:
+        stats = storage.recompress_aged_images(
+            db,
+            older_than_days=args.older_than_days,
+            include_synced=not args.no_synced,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            quality=args.quality,
+            lossless=args.lossless,
+            dry_run=args.dry_run,
+        )
+    finally:
+        db.close()
+
+    print(f"{'Dry run: ' if args.dry_run else ''}{stats['candidates']} candidate images")
+    print(f"  recompressed: {stats['recompressed']}")
+    print(f"  skipped:      {stats['skipped']} (less than 10% smaller)")
+    print(f"  failed:       {stats['failed']}")
+    print(f"  missing:      {stats['missing']}")
+    print(f"  saved:        {stats['bytes_saved'] / (1024 * 1024):.2f} MB")
+    print(f"  throughput:   {stats['images_per_s']} images/s, {stats['mb_per_s']} MB/s in {stats['elapsed_s']}s")
+
+
+if __name__ == "__main__":
+    main()
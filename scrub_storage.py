@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Check stored images against the database.
+
+Verifies that every image referenced by a test result exists and matches its
+checksum (recording checksums for images that have none yet), and lists files no
+test result references. An interrupted scrub resumes from its last checkpoint.
+Throttle it with --max-mb-per-sec to run it during clinic hours.
+
+Usage:
+    python scrub_storage.py [--workers 4] [--batch-size 200] [--max-mb-per-sec 20]
+        [--no-orphans] [--restart] [--report scrub.json] [--base-path ./uploads]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from src.database.core import SessionLocal
+from src.entities.clinic import Clinic
+from src.entities.patient import Patient
+from src.entities.user import User
+from src.entities.test_result import TestResult
+from src.infrastructure.file_storage import FileStorageService
+from src.infrastructure.integrity import IntegrityScrubber
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrub image storage for missing, corrupt and orphaned files")
+    parser.add_argument("--base-path", default="./uploads")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--max-mb-per-sec", type=float, default=None, help="Limit disk reads (default: unlimited)")
+    parser.add_argument("--min-orphan-age", type=float, default=3600,
+                        help="Ignore files younger than this many seconds when looking for orphans")
+    parser.add_argument("--no-orphans", action="store_true", help="Only check referenced images")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint from an interrupted scrub")
+    parser.add_argument("--nice", type=int, default=10, help="Lower the scrubber's CPU priority by this much")
+    parser.add_argument("--report", help="Write the full report as JSON to this file")
+    args = parser.parse_args()
+
+    if args.nice:
+        os.nice(args.nice)
+
+    storage = FileStorageService(args.base_path)
+    storage.pyramid_enabled = False
+    scrubber = IntegrityScrubber(
+        storage,
+        session_factory=SessionLocal,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        max_mb_per_sec=args.max_mb_per_sec,
+        min_orphan_age=args.min_orphan_age,
+    )
+    report = scrubber.run(resume=not args.restart, check_orphans=not args.no_orphans)
+
+    print(f"checked {report['images_checked']} images in {report['elapsed_s']}s ({report['mb_per_s']} MB/s)")
+    print(f"  verified:  {report['verified']}")
+    print(f"  recorded:  {report['checksums_recorded']} new checksums")
+    print(f"  evicted:   {report['evicted']} (held by the central server)")
+    print(f"  missing:   {len(report['missing'])}")
+    print(f"  corrupt:   {len(report['corrupt'])}")
+    print(f"  orphans:   {len(report['orphans'])} files, {report['orphan_bytes'] / (1024 * 1024):.2f} MB")
+    for item in report["missing"]:
+        print(f"    missing {item['image_path']} (results {', '.join(item['result_ids'])})")
+    for item in report["corrupt"]:
+        print(f"    corrupt {item['image_path']}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    sys.exit(1 if report["missing"] or report["corrupt"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Write Parquet snapshots of test results for analysis.
+
+Results joined with their clinic's district and region are written as one file
+per month and district under ANALYTICS_SNAPSHOT_DIR/test_results/. Only partitions
+with results created or updated since the previous run are rewritten, so it can
+run from cron as often as needed. Requires pyarrow.
+
+Usage:
+    python snapshot_results.py [--dir ./snapshots] [--full]
+"""
+
+import argparse
+
+from src.entities.clinic import Clinic
+from src.entities.patient import Patient
+from src.entities.user import User
+from src.entities.test_result import TestResult
+from src.infrastructure.parquet_snapshots import ParquetSnapshots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally write partitioned Parquet snapshots of test results")
+    parser.add_argument("--dir", default=None, help="Snapshot directory (default: ANALYTICS_SNAPSHOT_DIR or ./snapshots)")
+    parser.add_argument("--full", action="store_true", help="Rewrite every partition")
+    parser.add_argument("--batch-rows", type=int, default=None)
+    args = parser.parse_args()
+
+    snapshots = ParquetSnapshots(args.dir, batch_rows=args.batch_rows)
+    stats = snapshots.run(full=args.full)
+
+    print(f"snapshot in {snapshots.root} updated in {stats['elapsed_s']}s")
+    print(f"  written: {stats['partitions_written']} partitions, {stats['rows_written']} rows")
+    print(f"  removed: {stats['partitions_removed']} empty partitions")
+    print(f"  total:   {stats['partitions']} partitions")
+
+
+if __name__ == "__main__":
+    main()
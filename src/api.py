@@ -6,6 +6,7 @@ from src.results.controller import router as results_router
 from src.dashboard.controller import router as dashboard_router
 from src.clinics.controller import router as clinics_router
 from src.sync.controller import router as sync_router
+from src.camera.controller import router as camera_router
 
 def register_routes(app: FastAPI):
     # Authentication routes
@@ -17,4 +18,5 @@ def register_routes(app: FastAPI):
     app.include_router(patients_router)
     app.include_router(results_router)
     app.include_router(dashboard_router)
-    app.include_router(sync_router)
\ No newline at end of file
+    app.include_router(sync_router)
+    app.include_router(camera_router)
\ No newline at end of file
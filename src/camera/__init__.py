@@ -0,0 +1,2 @@
+# Camera module
+
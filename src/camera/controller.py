@@ -0,0 +1,83 @@
+import asyncio
+
+from fastapi import APIRouter
+from fastapi.responses import Response, StreamingResponse
+
+from ..auth.service import CurrentUser
+from ..infrastructure.camera_service import get_camera_service
+from ..infrastructure.capture_pipeline import get_capture_pipeline
+
+router = APIRouter(
+    prefix="/api/camera",
+    tags=["Camera"]
+)
+
+BOUNDARY = "frame"
+
+
+async def _wait_for_frame(preview, after_sequence: int, timeout: float = 5.0):
+    """Poll the shared preview encoder until a frame newer than `after_sequence` is available."""
+    poll_interval = 0.5 / preview.fps if preview.fps > 0 else 0.05
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        sequence, jpeg = preview.latest()
+        if jpeg is not None and sequence > after_sequence:
+            return sequence, jpeg
+        if loop.time() > deadline:
+            return None, None
+        await asyncio.sleep(poll_interval)
+
+
+async def _mjpeg_frames(preview):
+    """Yield multipart JPEG parts from the shared preview encoder until the client disconnects."""
+    preview.subscribe()
+    try:
+        sequence = -1
+        while True:
+            next_sequence, jpeg = await _wait_for_frame(preview, sequence)
+            if jpeg is None:
+                continue
+            sequence = next_sequence
+            yield (
+                f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode()
+                + jpeg
+                + b"\r\n"
+            )
+    finally:
+        preview.unsubscribe()
+
+
+@router.get("/preview")
+async def preview_stream(current_user: CurrentUser):
+    """
+    Live low-resolution MJPEG preview from the camera.
+    Frames are encoded once on a background thread and shared by all viewers;
+    full-resolution still capture is not affected.
+    """
+    preview = get_camera_service().get_preview()
+    return StreamingResponse(
+        _mjpeg_frames(preview),
+        media_type=f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+@router.get("/preview/frame")
+async def preview_frame(current_user: CurrentUser):
+    """Get the most recent preview frame as a single JPEG."""
+    preview = get_camera_service().get_preview()
+    preview.subscribe()
+    try:
+        _, jpeg = await _wait_for_frame(preview, 0)
+    finally:
+        preview.unsubscribe()
+    if jpeg is None:
+        return Response(status_code=503, content="Camera preview unavailable")
+    return Response(content=jpeg, media_type="image/jpeg", headers={"Cache-Control": "no-store"})
+
+
+@router.get("/pipeline/stats")
+def pipeline_stats(current_user: CurrentUser):
+    """Get throughput, latency and per-stage timings of the capture pipeline."""
+    return get_capture_pipeline().stats()
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, status, Query
+from fastapi import APIRouter, status, Query, Response
 from typing import List, Optional
 from uuid import UUID
 
@@ -6,6 +6,7 @@ from ..database.core import DbSession
 from . import models
 from . import service
 from ..auth.service import CurrentUser
+from ..pagination import MAX_PAGE_SIZE, page_response, page_size, parse_fields
 
 router = APIRouter(
     prefix="/api/clinics",
@@ -20,12 +21,22 @@ def create_clinic(db: DbSession, clinic: models.ClinicCreate, current_user: Curr
 
 @router.get("/", response_model=List[models.ClinicResponse])
 def get_clinics(
+    response: Response,
     db: DbSession,
     current_user: CurrentUser,
-    district: Optional[str] = Query(None, description="Filter by district")
+    district: Optional[str] = Query(None, description="Filter by district"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size (all rows without limit or cursor)"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
 ):
-    """Get all clinics, optionally filtered by district."""
-    return service.get_clinics(current_user, db, district)
+    """
+    Get clinics ordered by name, optionally filtered by district. With `limit` or
+    `cursor` one page is returned and the next page's cursor goes in the X-Next-Cursor header.
+    """
+    fields = parse_fields(fields, models.ClinicResponse)
+    limit = page_size(limit, cursor)
+    page = service.get_clinics(current_user, db, district, cursor, limit, fields)
+    return page_response(page, response)
 
 
 @router.get("/{clinic_id}", response_model=models.ClinicResponse)
@@ -5,6 +5,7 @@ from . import models
 from src.entities.clinic import Clinic
 from src.auth.models import TokenData
 from src.exceptions import ClinicNotFoundError, ClinicCreationError
+from src.pagination import Page, keyset_page
 import logging
 
 def create_clinic(current_user: TokenData, db: Session, clinic: models.ClinicCreate) -> Clinic:
@@ -22,14 +23,21 @@ def create_clinic(current_user: TokenData, db: Session, clinic: models.ClinicCre
         raise ClinicCreationError(str(e))
 
 
-def get_clinics(current_user: TokenData, db: Session, district: Optional[str] = None) -> List[Clinic]:
-    """Get all clinics, optionally filtered by district."""
+def get_clinics(
+    current_user: TokenData,
+    db: Session,
+    district: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+) -> Page:
+    """Get a page of clinics ordered by name, optionally filtered by district."""
     query = db.query(Clinic)
     
     if district:
         query = query.filter(Clinic.district == district)
     
-    clinics = query.all()
+    clinics = keyset_page(query, [(Clinic.name, False), (Clinic.id, False)], cursor, limit, fields)
     logging.info(f"Retrieved {len(clinics)} clinics")
     return clinics
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float
+from sqlalchemy import Column, String, Float, Index
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from ..database.core import Base 
@@ -15,6 +15,9 @@ class Clinic(Base):
     contact_phone = Column(String, nullable=True)
     contact_email = Column(String, nullable=True)
 
+    # Keyset pagination key of the clinic list
+    __table_args__ = (Index("ix_clinics_name_id", "name", "id"),)
+
     def __repr__(self):
         return f"<Clinic(name='{self.name}', district='{self.district}', region='{self.region}')>"
 
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime, timezone
+from ..database.core import Base 
+
+class EvictedImage(Base):
+    """Local image copy removed under disk pressure; the central server still has it."""
+    __tablename__ = 'evicted_images'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    image_path = Column(String, nullable=False, unique=True, index=True)  # TestResult.image_path of the evicted file
+    size_bytes = Column(Integer, nullable=False)
+    evicted_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<EvictedImage(image_path='{self.image_path}', size_bytes={self.size_bytes})>"
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime, timezone
+from ..database.core import Base 
+
+class ImageChecksum(Base):
+    """SHA-256 of a stored image whose path does not already carry its hash."""
+    __tablename__ = 'image_checksums'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    image_path = Column(String, nullable=False, unique=True, index=True)  # TestResult.image_path
+    sha256 = Column(String(64), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    recorded_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    verified_at = Column(DateTime, nullable=True)  # last scrub that found the file intact
+
+    def __repr__(self):
+        return f"<ImageChecksum(image_path='{self.image_path}', sha256='{self.sha256[:12]}')>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Date, ForeignKey, Enum
+from sqlalchemy import Column, String, Integer, Date, ForeignKey, Enum, Index
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 import enum
@@ -24,6 +24,9 @@ class Patient(Base):
     village = Column(String, nullable=True)
     district = Column(String, nullable=True)
 
+    # Keyset pagination key of the patient list
+    __table_args__ = (Index("ix_patients_last_name_id", "last_name", "id"),)
+
     def __repr__(self):
         return f"<Patient(name='{self.first_name} {self.last_name}', id='{self.national_id}')>"
 
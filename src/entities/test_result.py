@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, DateTime, ForeignKey, Enum, Boolean, Text
+from sqlalchemy import Column, String, Float, DateTime, ForeignKey, Enum, Boolean, Text, Index
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 import enum
@@ -48,6 +48,12 @@ class TestResult(Base):
     created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, nullable=True, onupdate=lambda: datetime.now(timezone.utc))
 
+    # Keyset pagination keys of the result lists
+    __table_args__ = (
+        Index("ix_test_results_test_date_id", "test_date", "id"),
+        Index("ix_test_results_sync_status_test_date_id", "sync_status", "test_date", "id"),
+    )
+
     def __repr__(self):
         return f"<TestResult(patient_id='{self.patient_id}', result='{self.result}', confidence={self.confidence_score})>"
 
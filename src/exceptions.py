@@ -62,6 +62,40 @@ class TestResultCreationError(TestResultError):
     def __init__(self, error: str):
         super().__init__(status_code=500, detail=f"Failed to create test result: {error}")
 
+class ImageTooLargeError(TestResultError):
+    def __init__(self, max_bytes: int):
+        super().__init__(status_code=413, detail=f"Image exceeds the maximum upload size of {max_bytes} bytes")
+
+class InvalidImageError(TestResultError):
+    def __init__(self, message: str = "Invalid image file"):
+        super().__init__(status_code=400, detail=message)
+
+class CaptureTimeoutError(TestResultError):
+    def __init__(self, timeout: float):
+        super().__init__(status_code=504, detail=f"Camera capture did not complete within {timeout:g} seconds")
+
+class BatchUploadError(TestResultError):
+    def __init__(self, message: str):
+        super().__init__(status_code=400, detail=message)
+
+class BulkUpdateError(TestResultError):
+    def __init__(self, message: str):
+        super().__init__(status_code=400, detail=message)
+
+class SnapshotNotFoundError(TestResultError):
+    def __init__(self):
+        super().__init__(status_code=404, detail="No Parquet snapshot matches; run snapshot_results.py to create one")
+
+class TestResultImageNotFoundError(TestResultError):
+    def __init__(self, result_id=None):
+        message = "Image not found" if result_id is None else f"Image for test result {result_id} not found"
+        super().__init__(status_code=404, detail=message)
+
+class TestResultImageEvictedError(TestResultError):
+    """The local copy was evicted under disk pressure; redirect to the central server's copy."""
+    def __init__(self, location: str):
+        super().__init__(status_code=307, detail="Image evicted locally", headers={"Location": location})
+
 # Clinic-related exceptions
 class ClinicError(HTTPException):
     """Base exception for clinic-related errors"""
@@ -75,3 +109,8 @@ class ClinicNotFoundError(ClinicError):
 class ClinicCreationError(ClinicError):
     def __init__(self, error: str):
         super().__init__(status_code=500, detail=f"Failed to create clinic: {error}")
+
+# Pagination-related exceptions
+class InvalidPageRequestError(HTTPException):
+    def __init__(self, message: str):
+        super().__init__(status_code=400, detail=message)
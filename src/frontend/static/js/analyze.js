@@ -24,7 +24,9 @@ function selectInputMethod(method) {
         cameraSection.classList.remove('hidden');
         uploadSection.classList.add('hidden');
         imageUpload.removeAttribute('required');
+        startCameraPreview();
     } else {
+        stopCameraPreview();
         uploadBtn.classList.add('active', 'border-cyan-500', 'bg-cyan-50');
         uploadBtn.classList.remove('border-gray-300');
         cameraBtn.classList.remove('active', 'border-cyan-500', 'bg-cyan-50');
@@ -36,6 +38,73 @@ function selectInputMethod(method) {
     }
 }
 
+// Live camera preview (MJPEG stream read through fetch so the auth header is sent)
+let previewAbort = null;
+
+async function startCameraPreview() {
+    if (previewAbort) return;
+    previewAbort = new AbortController();
+
+    const img = document.getElementById('camera-preview');
+    const status = document.getElementById('camera-preview-status');
+    const decoder = new TextDecoder();
+    let buffer = new Uint8Array(0);
+    let frameUrl = null;
+
+    try {
+        const response = await authenticatedFetch('/api/camera/preview', { signal: previewAbort.signal });
+        if (!response.ok || !response.body) {
+            throw new Error('Preview unavailable');
+        }
+        const reader = response.body.getReader();
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+
+            const merged = new Uint8Array(buffer.length + value.length);
+            merged.set(buffer);
+            merged.set(value, buffer.length);
+            buffer = merged;
+
+            // Extract every complete part: headers, blank line, Content-Length bytes of JPEG
+            while (true) {
+                const head = decoder.decode(buffer.subarray(0, Math.min(buffer.length, 200)));
+                const headerEnd = head.indexOf('\r\n\r\n');
+                const match = head.match(/Content-Length: (\d+)/i);
+                if (headerEnd === -1 || !match) break;
+
+                const start = headerEnd + 4;
+                const end = start + parseInt(match[1], 10);
+                if (buffer.length < end + 2) break;
+
+                const blob = new Blob([buffer.slice(start, end)], { type: 'image/jpeg' });
+                if (frameUrl) URL.revokeObjectURL(frameUrl);
+                frameUrl = URL.createObjectURL(blob);
+                img.src = frameUrl;
+                img.classList.remove('hidden');
+                status.classList.add('hidden');
+                buffer = buffer.slice(end + 2);
+            }
+        }
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Camera preview error:', error);
+            status.textContent = 'Live preview unavailable';
+            status.classList.remove('hidden');
+        }
+    } finally {
+        previewAbort = null;
+    }
+}
+
+function stopCameraPreview() {
+    if (previewAbort) {
+        previewAbort.abort();
+        previewAbort = null;
+    }
+}
+
 async function loadUserInfo() {
     try {
         const response = await authenticatedFetch('/users/me');
@@ -48,8 +117,7 @@ async function loadUserInfo() {
 
 async function loadPatients() {
     try {
-        const response = await authenticatedFetch('/api/patients');
-        const patients = await response.json();
+        const patients = await fetchAllPages('/api/patients/?limit=1000&fields=id,first_name,last_name,age,national_id');
         
         const select = document.getElementById('patient-select');
         
@@ -236,6 +304,8 @@ function displayResult(result) {
             </div>
         </div>
         
+        <img id="result-image" class="hidden mt-6 w-full rounded-lg border border-gray-200" alt="Analyzed blood smear">
+        
         <div class="mt-6 p-4 bg-blue-50 border border-blue-200 rounded-lg">
             <p class="text-sm text-blue-800">
                 <strong>Note:</strong> This is a placeholder AI model for demonstration. 
@@ -246,6 +316,30 @@ function displayResult(result) {
     
     container.classList.remove('hidden');
     container.scrollIntoView({ behavior: 'smooth' });
+    loadResultImage(document.getElementById('result-image'), result.test_result_id);
+}
+
+/**
+ * Load a stored smear image into an <img> element.
+ * The image endpoint requires the auth header, so the image is fetched and shown as a blob URL.
+ * @param {HTMLImageElement} img - Target image element
+ * @param {string} resultId - Test result ID
+ * @param {string} level - original, preview or thumb
+ */
+async function loadResultImage(img, resultId, level = 'preview') {
+    try {
+        const response = await authenticatedFetch(`/api/results/${resultId}/image?level=${level}`);
+        if (!response.ok) {
+            return;
+        }
+        if (img.src.startsWith('blob:')) {
+            URL.revokeObjectURL(img.src);
+        }
+        img.src = URL.createObjectURL(await response.blob());
+        img.classList.remove('hidden');
+    } catch (error) {
+        console.error('Failed to load result image:', error);
+    }
 }
 
 function getResultClass(result) {
@@ -178,6 +178,27 @@ async function authenticatedFetch(url, options = {}) {
     return response;
 }
 
+/**
+ * Fetch every page of a paginated list endpoint, following X-Next-Cursor
+ * @param {string} url - The API endpoint (may already have query parameters)
+ * @returns {Promise<Array>} All items
+ */
+async function fetchAllPages(url) {
+    const items = [];
+    let cursor = null;
+    do {
+        const separator = url.includes('?') ? '&' : '?';
+        const pageUrl = cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url;
+        const response = await authenticatedFetch(pageUrl);
+        if (!response.ok) {
+            throw new Error(`Failed to fetch ${url}`);
+        }
+        items.push(...await response.json());
+        cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
+}
+
 /**
  * Protect a page - redirect to signin if not authenticated
  */
@@ -16,8 +16,7 @@ async function loadUserInfo() {
 
 async function loadPatients() {
     try {
-        const response = await authenticatedFetch('/api/patients');
-        allPatients = await response.json();
+        allPatients = await fetchAllPages('/api/patients/?limit=1000');
         
         renderPatients(allPatients);
         
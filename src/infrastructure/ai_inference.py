@@ -35,6 +35,7 @@ class MalariaInferenceService:
         self.confidence_threshold = float(os.getenv("YOLO_CONFIDENCE_THRESHOLD", "0.25"))
         self.iou_threshold = float(os.getenv("YOLO_IOU_THRESHOLD", "0.45"))
         self.image_size = int(os.getenv("YOLO_IMAGE_SIZE", "640"))
+        self.batch_size = int(os.getenv("YOLO_BATCH_SIZE", "8"))
 
         logging.info(f"Initializing Malaria Inference Service with model: {self.model_path}")
 
@@ -107,57 +108,61 @@ class MalariaInferenceService:
                 imgsz=self.image_size,
                 verbose=False
             )
-
-            # Process results
-            detections = []
-            max_confidence = 0.0
-
-            if len(results) > 0:
-                result = results[0]
-                boxes = result.boxes
-
-                for box in boxes:
-                    conf = float(box.conf[0])
-                    cls = int(box.cls[0])
-                    class_name = result.names[cls]
-
-                    detection = {
-                        "class": class_name,
-                        "confidence": conf,
-                        "bbox": box.xyxy[0].tolist()
-                    }
-                    detections.append(detection)
-
-                    if conf > max_confidence:
-                        max_confidence = conf
-
-            # Determine result based on detections
-            # If malaria parasites detected with high confidence -> POSITIVE
-            # If no detections or low confidence -> NEGATIVE
-            # If borderline confidence -> INCONCLUSIVE
-
-            if len(detections) > 0:
-                if max_confidence > 0.7:
-                    inference_result = InferenceResult.POSITIVE
-                elif max_confidence > 0.4:
-                    inference_result = InferenceResult.INCONCLUSIVE
-                else:
-                    inference_result = InferenceResult.NEGATIVE
-            else:
-                inference_result = InferenceResult.NEGATIVE
-                max_confidence = 0.95  # High confidence in negative result
-
             processing_time = (time.time() - start_time) * 1000
-
-            logging.info(f"YOLOv11 inference: {inference_result.value} (confidence: {max_confidence:.2f}, "
-                        f"detections: {len(detections)}, time: {processing_time:.2f}ms)")
-
-            return inference_result, max_confidence, processing_time, detections
+            return self._interpret(results[0] if len(results) > 0 else None, processing_time)
 
         except Exception as e:
             logging.error(f"Error during YOLOv11 inference: {str(e)}")
             raise
 
+    def _interpret(self, result, processing_time: float) -> Tuple[InferenceResult, float, float, Optional[List[Dict]]]:
+        """
+        Turn the YOLOv11 output for one image into a test outcome.
+
+        Returns:
+            Tuple of (result, confidence_score, processing_time_ms, detections)
+        """
+        # Process results
+        detections = []
+        max_confidence = 0.0
+
+        if result is not None:
+            for box in result.boxes:
+                conf = float(box.conf[0])
+                cls = int(box.cls[0])
+                class_name = result.names[cls]
+
+                detection = {
+                    "class": class_name,
+                    "confidence": conf,
+                    "bbox": box.xyxy[0].tolist()
+                }
+                detections.append(detection)
+
+                if conf > max_confidence:
+                    max_confidence = conf
+
+        # Determine result based on detections
+        # If malaria parasites detected with high confidence -> POSITIVE
+        # If no detections or low confidence -> NEGATIVE
+        # If borderline confidence -> INCONCLUSIVE
+
+        if len(detections) > 0:
+            if max_confidence > 0.7:
+                inference_result = InferenceResult.POSITIVE
+            elif max_confidence > 0.4:
+                inference_result = InferenceResult.INCONCLUSIVE
+            else:
+                inference_result = InferenceResult.NEGATIVE
+        else:
+            inference_result = InferenceResult.NEGATIVE
+            max_confidence = 0.95  # High confidence in negative result
+
+        logging.info(f"YOLOv11 inference: {inference_result.value} (confidence: {max_confidence:.2f}, "
+                    f"detections: {len(detections)}, time: {processing_time:.2f}ms)")
+
+        return inference_result, max_confidence, processing_time, detections
+
     def _run_placeholder_inference(self, image_path: str) -> Tuple[InferenceResult, float, float, Optional[List[Dict]]]:
         """
         Placeholder inference for testing when model is not available.
@@ -214,6 +219,46 @@ class MalariaInferenceService:
             logging.error(f"Error during image analysis: {str(e)}")
             raise
     
+    def analyze_batch(self, image_paths: List[str]) -> List[Tuple[InferenceResult, float, float]]:
+        """
+        Analyze several blood smear images, YOLO_BATCH_SIZE at a time per model call.
+
+        Batching amortizes per-call overhead and lets the model run the images through
+        one forward pass. Processing time is reported per image as the batch time
+        divided by the batch size.
+
+        Args:
+            image_paths: Paths to the blood smear images
+
+        Returns:
+            List of (result, confidence_score, processing_time_ms), in input order
+        """
+        if not self.is_loaded:
+            self.load_model()
+        if self.use_placeholder:
+            return [self.analyze_image(path) for path in image_paths]
+
+        outcomes = []
+        for start in range(0, len(image_paths), self.batch_size):
+            batch = image_paths[start:start + self.batch_size]
+            start_time = time.time()
+            try:
+                results = self.model.predict(
+                    source=batch,
+                    conf=self.confidence_threshold,
+                    iou=self.iou_threshold,
+                    imgsz=self.image_size,
+                    verbose=False
+                )
+            except Exception as e:
+                logging.error(f"Error during batched YOLOv11 inference: {str(e)}")
+                raise
+            per_image = (time.time() - start_time) * 1000 / len(batch)
+            for result in results:
+                outcome, confidence, processing_time, _ = self._interpret(result, per_image)
+                outcomes.append((outcome, confidence, processing_time))
+        return outcomes
+    
     def validate_image(self, image_path: str) -> bool:
         """
         Validate that the image is suitable for analysis.
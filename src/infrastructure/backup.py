@@ -0,0 +1,354 @@
+"""
+Incremental export of images and database changes to removable media.
+The target (typically a USB drive) holds a content-addressed copy of every image
+referenced by a test result, one manifest per export mapping storage paths to
+content hashes, and gzip'd JSON Lines files with the rows changed since the
+previous export to that drive. Only blobs the target does not have yet are copied,
+so repeat exports and resumed interrupted ones cost little more than the new images.
+"""
+
+import enum
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from src.database.core import SessionLocal
+from src.entities.clinic import Clinic
+from src.entities.evicted_image import EvictedImage
+from src.entities.patient import Patient
+from src.entities.test_result import TestResult
+from .file_storage import CHUNK_SIZE, FileStorageService, get_storage_service, name_digest
+
+BLOB_DIR = "blobs"
+MANIFEST_DIR = "manifests"
+DB_DIR = "db"
+EXPORT_STATE_FILE = "export-state.json"
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _row_dict(row) -> dict:
+    return {column.name: getattr(row, column.key) for column in row.__table__.columns}
+
+
+def _drop_cache(fd: int):
+    """Ask the kernel to forget cached pages so a read-back really hits the device."""
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+class BackupExporter:
+    """
+    Export a storage directory and its database changes to `target`.
+
+    Blobs are named by SHA-256 (blobs/<ab>/<sha256><ext>). Hashes of source files
+    whose size and mtime match the previous manifest are reused instead of re-read.
+    Copies run on a thread pool: each is hashed while it is read, written to a
+    temporary name, synced, read back from the device and renamed into place only
+    if the read-back hash matches. The database watermark advances only when an
+    export completes, so an interrupted export is simply run again.
+
+    Row timestamps are taken before commit, so each delta reaches back
+    `overlap_seconds` before the previous watermark to catch rows whose transactions
+    were still open during the previous export. Rows in the overlap appear in two
+    deltas; applying deltas in order keeps the later copy.
+    """
+
+    def __init__(
+        self,
+        target: Path,
+        storage: Optional[FileStorageService] = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        workers: int = 4,
+        batch_size: int = 500,
+        progress: Optional[Callable[[Dict], None]] = None,
+        overlap_seconds: Optional[float] = None,
+    ):
+        self.target = Path(target)
+        self.storage = storage or get_storage_service()
+        self.session_factory = session_factory
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.progress = progress
+        if overlap_seconds is None:
+            overlap_seconds = float(os.getenv("BACKUP_EXPORT_OVERLAP_SECONDS", "300"))
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self._stats_lock = threading.Lock()
+
+    # Target state
+
+    def _load_json(self, path: Path) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_json(self, path: Path, data: dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(data, f, default=_json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def _existing_blobs(self) -> set:
+        """Names of blobs already on the target; leftovers of interrupted copies are removed."""
+        names = set()
+        root = self.target / BLOB_DIR
+        if not root.exists():
+            return names
+        for fan_out in os.scandir(root):
+            if fan_out.name.endswith(".tmp"):
+                os.unlink(fan_out.path)
+            if not fan_out.is_dir():
+                continue
+            for entry in os.scandir(fan_out.path):
+                if entry.name.endswith(".tmp"):
+                    os.unlink(entry.path)
+                else:
+                    names.add(entry.name)
+        return names
+
+    def blob_path(self, digest: str, extension: str) -> Path:
+        return self.target / BLOB_DIR / digest[:2] / f"{digest}{extension}"
+
+    # Source images
+
+    def _image_paths(self, db: Session) -> Iterator[str]:
+        """Distinct referenced image paths, in keyset pages."""
+        last = None
+        while True:
+            query = db.query(TestResult.image_path).distinct()
+            if last is not None:
+                query = query.filter(TestResult.image_path > last)
+            page = [p for (p,) in query.order_by(TestResult.image_path).limit(self.batch_size)]
+            if not page:
+                return
+            yield from page
+            last = page[-1]
+
+    def _describe(self, relative_path: str, previous: Dict[str, dict]) -> Optional[dict]:
+        """Manifest entry for a source image, or None if it is not available locally."""
+        entry = {"size": None, "mtime_ns": None, "sha256": name_digest(relative_path)}
+        if self.storage.stores_files(relative_path):
+            try:
+                stat = self.storage.get_image_path(relative_path).stat()
+            except FileNotFoundError:
+                return None
+            entry["size"], entry["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+            known = previous.get(relative_path)
+            if entry["sha256"] is None and known and (known["size"], known["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                entry["sha256"] = known["sha256"]
+        elif not self.storage.image_exists(relative_path):
+            return None
+        return entry
+
+    # Copies
+
+    def _read_chunks(self, relative_path: str) -> Iterator[bytes]:
+        if not self.storage.stores_files(relative_path):
+            yield self.storage.read_image(relative_path)
+            return
+        with open(self.storage.get_image_path(relative_path), "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _hash_source(self, relative_path: str) -> str:
+        digest = hashlib.sha256()
+        for chunk in self._read_chunks(relative_path):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def _export_image(self, relative_path: str, entry: dict, existing: set, stats: Dict):
+        """Make sure the target holds an image's blob, copying it if needed. Fills in the entry."""
+        extension = Path(relative_path).suffix.lower()
+        if entry["sha256"] is None:
+            # Reading the source is much cheaper than writing the drive, so check before copying
+            entry["sha256"] = self._hash_source(relative_path)
+        if f"{entry['sha256']}{extension}" in existing:
+            entry["blob"] = str(self.blob_path(entry["sha256"], extension).relative_to(self.target))
+            with self._stats_lock:
+                stats["blobs_skipped"] += 1
+            return
+        self._copy(relative_path, entry, stats)
+        with self._stats_lock:
+            existing.add(f"{entry['sha256']}{extension}")
+
+    def _copy(self, relative_path: str, entry: dict, stats: Dict):
+        """Copy one image to its blob, verifying the written bytes."""
+        extension = Path(relative_path).suffix.lower()
+        temp_path = self.target / BLOB_DIR / f".{uuid.uuid4().hex}.tmp"
+        temp_path.parent.mkdir(parents=True, exist_ok=True)
+        digest, size = hashlib.sha256(), 0
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in self._read_chunks(relative_path):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+                _drop_cache(f.fileno())
+
+            source_digest = digest.hexdigest()
+            if entry["sha256"] != source_digest:
+                raise IOError(f"{relative_path} does not match its recorded hash")
+            check = hashlib.sha256()
+            with open(temp_path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    check.update(chunk)
+            if check.hexdigest() != source_digest:
+                raise IOError(f"Read-back of {relative_path} from {self.target} does not match")
+
+            final_path = self.blob_path(source_digest, extension)
+            final_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_path, final_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        entry.update(size=size, blob=str(final_path.relative_to(self.target)))
+        with self._stats_lock:
+            stats["blobs_copied"] += 1
+            stats["bytes_copied"] += size
+
+    # Database delta
+
+    def _export_db(
+        self, db: Session, since: Optional[datetime], until: datetime, stamp: str
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        Write test results and evictions changed in (since - overlap, until], and
+        every patient and clinic, to a gzip'd JSON Lines file.
+        Returns its path and row counts.
+        """
+        changed = func.coalesce(TestResult.updated_at, TestResult.created_at)
+        results = db.query(TestResult).filter(changed <= until)
+        evicted = db.query(EvictedImage).filter(EvictedImage.evicted_at <= until)
+        if since is not None:
+            results = results.filter(changed > since - self.overlap)
+            evicted = evicted.filter(EvictedImage.evicted_at > since - self.overlap)
+
+        counts = {"test_results": 0, "patients": 0, "clinics": 0, "evicted_images": 0}
+        relative_path = f"{DB_DIR}/delta-{stamp}.jsonl.gz"
+        path = self.target / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.tmp")
+
+        def write(table: str, row):
+            f.write(json.dumps({"table": table, "row": _row_dict(row)}, default=_json_default) + "\n")
+            counts[table] += 1
+
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            for result in results.order_by(TestResult.id).yield_per(self.batch_size):
+                write("test_results", result)
+            # Patients and clinics carry no change timestamp and are small, so they are
+            # exported in full and edits without new results still reach the drive
+            for patient in db.query(Patient).order_by(Patient.id).yield_per(self.batch_size):
+                write("patients", patient)
+            for clinic in db.query(Clinic).order_by(Clinic.id).yield_per(self.batch_size):
+                write("clinics", clinic)
+            for row in evicted.yield_per(self.batch_size):
+                write("evicted_images", row)
+        os.replace(temp_path, path)
+        return relative_path, counts
+
+    # Entry point
+
+    def _report(self, stats: Dict, started: float):
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            stats["elapsed_s"] = round(elapsed, 2)
+            stats["mb_per_s"] = round(stats["bytes_copied"] / (1024 * 1024) / elapsed, 2) if elapsed > 0 else 0.0
+            snapshot = dict(stats)
+        if self.progress is not None:
+            self.progress(snapshot)
+
+    def run(self) -> Dict:
+        """
+        Export new images and database changes to the target.
+
+        Returns:
+            Dictionary with images exported, blobs copied and skipped, bytes copied,
+            throughput, the manifest and database delta written and their row counts
+        """
+        started = time.perf_counter()
+        until = datetime.now(timezone.utc).replace(tzinfo=None)
+        # Sorts in export order; the suffix keeps exports within one microsecond apart
+        stamp = f"{until.strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+        state = self._load_json(self.target / EXPORT_STATE_FILE) or {}
+        previous = {}
+        if state.get("last_manifest"):
+            previous = (self._load_json(self.target / state["last_manifest"]) or {}).get("images", {})
+        since = datetime.fromisoformat(state["last_export_until"]) if state.get("last_export_until") else None
+
+        existing = self._existing_blobs()
+        stats = {"images": 0, "unavailable": 0, "blobs_copied": 0, "blobs_skipped": 0, "bytes_copied": 0}
+        images: Dict[str, dict] = {}
+        db = self.session_factory()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backup-export") as pool:
+                pending: List = []
+                for relative_path in self._image_paths(db):
+                    entry = self._describe(relative_path, previous)
+                    if entry is None:
+                        stats["unavailable"] += 1
+                        continue
+                    stats["images"] += 1
+                    images[relative_path] = entry
+                    pending.append(pool.submit(self._export_image, relative_path, entry, existing, stats))
+                    if len(pending) >= self.workers * 4:
+                        pending.pop(0).result()
+                        self._report(stats, started)
+                for future in pending:
+                    future.result()
+
+            delta_path, delta_counts = self._export_db(db, since, until, stamp)
+        finally:
+            db.close()
+
+        manifest = {
+            "created_at": until.isoformat(),
+            "source": str(self.storage.base_path),
+            "since": since.isoformat() if since else None,
+            "db_delta": delta_path,
+            "db_rows": delta_counts,
+            "images": images,
+        }
+        manifest_path = f"{MANIFEST_DIR}/manifest-{stamp}.json"
+        self._write_json(self.target / manifest_path, manifest)
+        self._write_json(self.target / EXPORT_STATE_FILE, {
+            "last_export_until": until.isoformat(),
+            "last_manifest": manifest_path,
+        })
+
+        self._report(stats, started)
+        stats.update(manifest=manifest_path, db_delta=delta_path, db_rows=delta_counts)
+        logging.info(f"Exported {stats['images']} images to {self.target}: {stats['blobs_copied']} copied, "
+                     f"{stats['blobs_skipped']} already present, {stats['mb_per_s']} MB/s")
+        return stats
@@ -6,44 +6,311 @@ Handles image capture from the Raspberry Pi camera for malaria diagnostics.
 import logging
 import tempfile
 import os
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Tuple, Optional
 from datetime import datetime
 
+import numpy as np
+
+from .synthetic_smear import synthesize_smear, get_mock_frame_pool
+
+
+def _parse_resolution(value: str, default: Tuple[int, int]) -> Tuple[int, int]:
+    """Parse a WIDTHxHEIGHT string such as "1920x1080"."""
+    try:
+        width, height = value.lower().split("x")
+        return int(width), int(height)
+    except (AttributeError, ValueError):
+        return default
+
+
+def score_frames(frames: np.ndarray, downscale: int = 4) -> np.ndarray:
+    """
+    Score the sharpness of a stack of frames as the variance of the Laplacian of
+    their downscaled luminance channel. Higher is sharper.
+
+    Args:
+        frames: NxHxWx3 RGB uint8 array
+        downscale: Stride used to subsample the frames before scoring
+
+    Returns:
+        Array of N sharpness scores
+    """
+    small = frames[:, ::downscale, ::downscale].astype(np.float32)
+    luma = small @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    laplacian = (
+        luma[:, 1:-1, :-2] + luma[:, 1:-1, 2:] + luma[:, :-2, 1:-1] + luma[:, 2:, 1:-1]
+        - 4.0 * luma[:, 1:-1, 1:-1]
+    )
+    return laplacian.reshape(len(frames), -1).var(axis=1)
+
+
+def compute_sharpness(frame: np.ndarray, downscale: int = 4) -> float:
+    """Score the sharpness of a single HxWx3 RGB frame. See score_frames."""
+    return float(score_frames(frame[np.newaxis], downscale)[0])
+
+
+class FrameRingBuffer:
+    """
+    Fixed-size ring of preallocated RGB frames filled by a background capture thread.
+    Memory use is fixed at capacity * width * height * 3 bytes for the lifetime of the buffer.
+    """
+
+    def __init__(self, capacity: int, resolution: Tuple[int, int]):
+        width, height = resolution
+        self.capacity = capacity
+        self.resolution = resolution
+        self.frames = np.zeros((capacity, height, width, 3), dtype=np.uint8)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.sharpness = np.zeros(capacity, dtype=np.float64)
+        self.count = 0  # total frames ever written
+        self._condition = threading.Condition()
+
+    @property
+    def nbytes(self) -> int:
+        return self.frames.nbytes
+
+    def write(self, frame: np.ndarray, sharpness: float = 0.0):
+        """Copy a frame into the next slot, overwriting the oldest one."""
+        with self._condition:
+            slot = self.count % self.capacity
+            np.copyto(self.frames[slot], frame)
+            self.timestamps[slot] = time.time()
+            self.sharpness[slot] = sharpness
+            self.count += 1
+            self._condition.notify_all()
+
+    def wait_for_frame(self, timeout: float) -> bool:
+        """Block until at least one frame has been written."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.count > 0, timeout=timeout)
+
+    def wait_for_count(self, count: int, timeout: float) -> bool:
+        """Block until the total number of frames written reaches `count`."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.count >= count, timeout=timeout)
+
+    def latest(self) -> Optional[np.ndarray]:
+        """Return a copy of the newest frame, or None if the buffer is empty."""
+        with self._condition:
+            if self.count == 0:
+                return None
+            return self.frames[(self.count - 1) % self.capacity].copy()
+
+    def sharpest(self, window: int) -> Optional[np.ndarray]:
+        """Return a copy of the sharpest of the last `window` frames."""
+        with self._condition:
+            if self.count == 0:
+                return None
+            window = max(1, min(window, self.capacity, self.count))
+            slots = [(self.count - 1 - i) % self.capacity for i in range(window)]
+            best = max(slots, key=lambda slot: self.sharpness[slot])
+            return self.frames[best].copy()
+
+
+def yuv420_to_rgb(yuv: np.ndarray, resolution: Tuple[int, int]) -> np.ndarray:
+    """
+    Convert a planar YUV420 array as returned by picamera2's lores stream
+    (shape height*3/2 x width) to an HxWx3 RGB uint8 array.
+    """
+    width, height = resolution
+    y = yuv[:height, :width].astype(np.float32)
+    u = yuv[height:height + height // 4].reshape(height // 2, width // 2).astype(np.float32) - 128.0
+    v = yuv[height + height // 4:height + height // 2].reshape(height // 2, width // 2).astype(np.float32) - 128.0
+    u = u.repeat(2, axis=0).repeat(2, axis=1)
+    v = v.repeat(2, axis=0).repeat(2, axis=1)
+    rgb = np.stack((y + 1.402 * v, y - 0.344136 * u - 0.714136 * v, y + 1.772 * u), axis=-1)
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+class PreviewBroadcaster:
+    """
+    Encodes low-resolution preview frames to JPEG on a single background thread
+    and shares the latest encoded frame with any number of viewers.
+    The encoder only runs while there are viewers (plus a short idle grace period).
+    """
+
+    def __init__(self, camera_service: "CameraService", fps: float, quality: int, idle_timeout: float = 2.0):
+        self.camera_service = camera_service
+        self.fps = fps
+        self.quality = quality
+        self.idle_timeout = idle_timeout
+        self.viewers = 0
+        self.sequence = 0
+        self._latest_jpeg: Optional[bytes] = None
+        self._last_viewer_left = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self):
+        """Register a viewer, starting the encoder thread if needed."""
+        with self._lock:
+            self.viewers += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="camera-preview", daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self):
+        """Unregister a viewer."""
+        with self._lock:
+            self.viewers = max(0, self.viewers - 1)
+            if self.viewers == 0:
+                self._last_viewer_left = time.monotonic()
+
+    def stop(self):
+        """Stop the encoder thread regardless of remaining viewers."""
+        with self._lock:
+            self.viewers = 0
+            self.idle_timeout = 0
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def latest(self) -> Tuple[int, Optional[bytes]]:
+        """Return the sequence number and bytes of the newest encoded frame."""
+        with self._lock:
+            return self.sequence, self._latest_jpeg
+
+    def _should_run(self) -> bool:
+        with self._lock:
+            if self.viewers > 0:
+                return True
+            if time.monotonic() - self._last_viewer_left < self.idle_timeout:
+                return True
+            self._thread = None
+            return False
+
+    def _run(self):
+        from PIL import Image
+        import io
+
+        interval = 1.0 / self.fps if self.fps > 0 else 0
+        logging.info(f"Camera preview started at {self.fps} fps")
+        while self._should_run():
+            started = time.monotonic()
+            try:
+                frame = self.camera_service.capture_preview_frame()
+                buffer = io.BytesIO()
+                Image.fromarray(frame).save(buffer, "JPEG", quality=self.quality)
+                with self._lock:
+                    self._latest_jpeg = buffer.getvalue()
+                    self.sequence += 1
+            except Exception as e:
+                logging.error(f"Error producing preview frame: {str(e)}")
+                time.sleep(1.0)
+                continue
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        logging.info("Camera preview stopped")
+
+
 class CameraService:
     """
     Service for capturing images from Raspberry Pi Camera Module 3.
     Falls back to mock mode if camera is not available (for development).
     """
     
-    def __init__(self):
+    def __init__(self, streaming: Optional[bool] = None):
         self.camera = None
         self.is_available = False
         self.use_mock = False
+
+        # Camera backend: "auto" (picamera2, falling back to mock), "mock" or "replay"
+        self.backend = os.getenv("CAMERA_BACKEND", "auto").lower()
+        self.replay_source = os.getenv("CAMERA_REPLAY_SOURCE", "")
+        self.replay_fps = float(os.getenv("CAMERA_REPLAY_FPS", "30"))
+        self.replay_latency_ms = float(os.getenv("CAMERA_REPLAY_LATENCY_MS", "0"))
         
         # Camera configuration
-        self.resolution = (2304, 1296)  # Camera Module 3 default resolution
+        self.resolution = _parse_resolution(
+            os.getenv("CAMERA_RESOLUTION", ""), (2304, 1296)  # Camera Module 3 default resolution
+        )
         self.format = "jpeg"
+
+        # Streaming mode configuration (background capture into a ring buffer)
+        if streaming is None:
+            streaming = os.getenv("CAMERA_STREAMING", "false").lower() in ("1", "true", "yes")
+        self.streaming = streaming
+        self.stream_resolution = _parse_resolution(os.getenv("CAMERA_STREAM_RESOLUTION", ""), self.resolution)
+        self.stream_buffer_size = int(os.getenv("CAMERA_STREAM_BUFFER_SIZE", "4"))
+        self.stream_max_buffer_mb = int(os.getenv("CAMERA_STREAM_MAX_BUFFER_MB", "128"))
+        self.stream_fps = float(os.getenv("CAMERA_STREAM_FPS", "10"))
+        self.sharpest_window = int(os.getenv("CAMERA_SHARPEST_WINDOW", "0"))  # 0 = newest frame
+        self.frame_buffer: Optional[FrameRingBuffer] = None
+
+        # Live preview configuration (picamera2 lores stream)
+        self.preview_resolution = _parse_resolution(os.getenv("CAMERA_PREVIEW_RESOLUTION", ""), (640, 360))
+        self.preview_fps = float(os.getenv("CAMERA_PREVIEW_FPS", "5"))
+        self.preview_quality = int(os.getenv("CAMERA_PREVIEW_QUALITY", "70"))
+        self._preview: Optional[PreviewBroadcaster] = None
+
+        # Best-frame capture configuration (lens sweep or burst)
+        self.capture_best_enabled = os.getenv("CAMERA_CAPTURE_BEST", "false").lower() in ("1", "true", "yes")
+        self.capture_best_mode = os.getenv("CAMERA_CAPTURE_BEST_MODE", "sweep")
+        self.focus_steps = int(os.getenv("CAMERA_FOCUS_STEPS", "8"))
+        focus_range = os.getenv("CAMERA_FOCUS_RANGE", "0.0:10.0").split(":")
+        self.focus_range = (float(focus_range[0]), float(focus_range[1]))
+        self.focus_settle_frames = int(os.getenv("CAMERA_FOCUS_SETTLE_FRAMES", "2"))
+        self.lens_position: Optional[float] = None
+        # Mock optics: lens position at which the synthetic smear is in focus
+        self.mock_focus_position = float(os.getenv("CAMERA_MOCK_FOCUS_POSITION", "6.0"))
+        # Mock smear synthesis: seed for determinism, pool of pre-encoded frames
+        self.mock_seed = int(os.getenv("CAMERA_MOCK_SEED", "0"))
+        self.mock_pool_size = int(os.getenv("CAMERA_MOCK_POOL_SIZE", "8"))
+        self.mock_parasitemia = float(os.getenv("CAMERA_MOCK_PARASITEMIA", "0.02"))
+        self.last_mock_ground_truth: Optional[dict] = None
+        self._stream_thread: Optional[threading.Thread] = None
+        self._stream_stop = threading.Event()
+        # Serializes access to the camera hardware (start/stop, captures, lens moves)
+        self._session_lock = threading.RLock()
+        self._mock_base_frame: Optional[np.ndarray] = None
+        self._mock_frame_index = 0
         
         logging.info("Initializing Camera Service for Raspberry Pi Camera Module 3")
         self._initialize_camera()
+
+        if self.streaming:
+            self.start_streaming()
     
     def _initialize_camera(self):
         """
-        Initialize the Raspberry Pi camera.
+        Initialize the Raspberry Pi camera, or the replay device when CAMERA_BACKEND=replay.
         Falls back to mock mode if camera is not available.
         """
+        if self.backend == "mock":
+            logging.info("Camera backend set to mock")
+            self.use_mock = True
+            self.is_available = False
+            return
+
         try:
-            # Try to import picamera2
-            from picamera2 import Picamera2
-            
-            # Initialize camera
-            self.camera = Picamera2()
+            if self.backend == "replay":
+                # Replay recorded frames through the Picamera2 interface
+                from .replay_camera import ReplayCamera
+
+                self.camera = ReplayCamera(
+                    self.replay_source, fps=self.replay_fps, latency_ms=self.replay_latency_ms
+                )
+            else:
+                # Try to import picamera2
+                from picamera2 import Picamera2
+
+                # Initialize camera
+                self.camera = Picamera2()
             
-            # Configure camera for still capture
-            config = self.camera.create_still_configuration(
-                main={"size": self.resolution, "format": "RGB888"}
-            )
+            # Configure camera for still capture, or continuous capture when streaming.
+            # The lores stream feeds the live preview without touching the main stream.
+            lores = {"size": self.preview_resolution, "format": "YUV420"}
+            if self.streaming:
+                config = self.camera.create_video_configuration(
+                    main={"size": self.stream_resolution, "format": "RGB888"}, lores=lores
+                )
+            else:
+                config = self.camera.create_still_configuration(
+                    main={"size": self.resolution, "format": "RGB888"}, lores=lores
+                )
             self.camera.configure(config)
             
             self.is_available = True
@@ -59,35 +326,306 @@ class CameraService:
             self.use_mock = True
             self.is_available = False
     
-    def capture_image(self, output_path: Optional[str] = None) -> str:
+    @contextmanager
+    def session(self):
+        """
+        Exclusive camera session: holds the hardware lock and makes sure the camera
+        is started. Re-entrant, so capture methods can be nested inside a session.
+        In streaming mode the background thread owns frame capture and does not
+        take this lock; sessions then only serialize lens control.
+        """
+        with self._session_lock:
+            if self.camera is not None and not self.use_mock and not self.camera.started:
+                self.camera.start()
+            yield self
+
+    def start_streaming(self):
+        """
+        Start the background capture thread that keeps the ring buffer filled.
+        The buffer is preallocated once; its size is capped by CAMERA_STREAM_MAX_BUFFER_MB.
+        """
+        if self._stream_thread is not None and self._stream_thread.is_alive():
+            return
+
+        width, height = self.stream_resolution
+        frame_bytes = width * height * 3
+        max_frames = max(1, (self.stream_max_buffer_mb * 1024 * 1024) // frame_bytes)
+        capacity = max(1, min(self.stream_buffer_size, max_frames))
+        if capacity < self.stream_buffer_size:
+            logging.warning(
+                f"Frame buffer of {self.stream_buffer_size} frames exceeds {self.stream_max_buffer_mb}MB; "
+                f"using {capacity} frames"
+            )
+
+        self.frame_buffer = FrameRingBuffer(capacity, self.stream_resolution)
+        self.streaming = True
+        self._stream_stop.clear()
+
+        with self.session():
+            pass  # starts the camera
+
+        self._stream_thread = threading.Thread(target=self._stream_loop, name="camera-stream", daemon=True)
+        self._stream_thread.start()
+        logging.info(
+            f"Camera streaming started: {capacity} frames at {self.stream_resolution} "
+            f"({self.frame_buffer.nbytes / (1024 * 1024):.1f}MB)"
+        )
+
+    def stop_streaming(self):
+        """Stop the background capture thread."""
+        self._stream_stop.set()
+        if self._stream_thread is not None:
+            self._stream_thread.join(timeout=5)
+            self._stream_thread = None
+        self.streaming = False
+
+    def _stream_loop(self):
+        """Capture frames continuously into the ring buffer until stopped."""
+        interval = 1.0 / self.stream_fps if self.stream_fps > 0 else 0
+        while not self._stream_stop.is_set():
+            started = time.monotonic()
+            try:
+                frame = self._grab_frame()
+                self.frame_buffer.write(frame, compute_sharpness(frame))
+            except Exception as e:
+                logging.error(f"Error in camera stream: {str(e)}")
+                self._stream_stop.wait(1.0)
+                continue
+            if self.use_mock:
+                # The real camera paces itself; the mock has to be throttled
+                self._stream_stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+    def _grab_frame(self) -> np.ndarray:
+        """Grab one RGB frame at the stream resolution."""
+        if self.use_mock:
+            return self._mock_frame()
+        # picamera2's RGB888 arrays are laid out as BGR
+        return self.camera.capture_array("main")[..., ::-1]
+
+    def _mock_frame(self, size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """
+        Produce a synthetic frame that changes slightly between calls. With `size`,
+        the frame is subsampled to roughly that size before the defocus blur.
+        """
+        # The preview thread and captures share the mock state
+        with self._session_lock:
+            if self._mock_base_frame is None:
+                self._mock_base_frame, self.last_mock_ground_truth = synthesize_smear(
+                    self.stream_resolution, seed=self.mock_seed, parasitemia=self.mock_parasitemia
+                )
+            self._mock_frame_index += 1
+            base, index = self._mock_base_frame, self._mock_frame_index
+        step = 1
+        if size is not None:
+            step = max(1, min(base.shape[1] // size[0], base.shape[0] // size[1]))
+            base = base[::step, ::step]
+        frame = np.roll(base, (index % 16) // step, axis=1)
+        return self._apply_mock_focus(frame, scale=step)
+
+    def _apply_mock_focus(self, frame: np.ndarray, scale: int = 1) -> np.ndarray:
+        """
+        Simulate defocus on a mock frame. Blur grows with the distance between the
+        lens position and the mock focus position; with no lens position set (burst
+        captures) a small random jitter stands in for hand movement and vibration.
+        `scale` is how many full-resolution pixels one pixel of `frame` covers.
+        """
+        from PIL import Image, ImageFilter
+
+        if self.lens_position is None:
+            defocus = abs(np.random.normal(0.0, 1.0))
+        else:
+            defocus = abs(self.lens_position - self.mock_focus_position)
+        radius = 1.5 * defocus / scale
+        if radius < 0.25:
+            return frame
+        return np.asarray(Image.fromarray(frame).filter(ImageFilter.GaussianBlur(radius)))
+
+    def _capture_from_buffer(self, output_path: Optional[str] = None, sharpest_window: Optional[int] = None) -> str:
+        """
+        Write the newest buffered frame, or the sharpest of the last N, to a JPEG file.
+
+        Args:
+            output_path: Optional path to save the image. If None, uses temp file.
+            sharpest_window: Number of recent frames to pick the sharpest from (0 = newest)
+
+        Returns:
+            Path to the captured image file
+        """
+        from PIL import Image
+
+        if not self.frame_buffer.wait_for_frame(timeout=5.0):
+            raise RuntimeError("No frames available from camera stream")
+
+        window = self.sharpest_window if sharpest_window is None else sharpest_window
+        frame = self.frame_buffer.sharpest(window) if window > 0 else self.frame_buffer.latest()
+
+        if output_path is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            output_path = os.path.join(tempfile.gettempdir(), f"camera_capture_{timestamp}.jpg")
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+
+        Image.fromarray(frame).save(output_path, "JPEG", quality=95)
+        logging.info(f"Image captured from stream buffer: {output_path}")
+        return output_path
+
+    def get_preview(self) -> PreviewBroadcaster:
+        """Get the shared live preview broadcaster."""
+        with self._session_lock:
+            if self._preview is None:
+                self._preview = PreviewBroadcaster(self, self.preview_fps, self.preview_quality)
+            return self._preview
+
+    def capture_preview_frame(self) -> np.ndarray:
+        """
+        Grab one low-resolution RGB frame for the live preview.
+        Reads the lores stream (or the ring buffer when streaming) so full-resolution
+        still capture is never reconfigured or interrupted.
+        """
+        width, height = self.preview_resolution
+        if self.streaming and self.frame_buffer is not None:
+            frame = self.frame_buffer.latest()
+            if frame is None:
+                raise RuntimeError("No frames available from camera stream")
+        elif self.use_mock:
+            # Downscale before the simulated defocus rather than blurring a full frame
+            return self._mock_frame(self.preview_resolution)
+        else:
+            with self.session():
+                lores = self.camera.capture_array("lores")
+            return yuv420_to_rgb(lores, self.preview_resolution)
+
+        # Subsample the full frame down to roughly the preview size
+        step = max(1, min(frame.shape[1] // width, frame.shape[0] // height))
+        return np.ascontiguousarray(frame[::step, ::step])
+
+    def set_lens_position(self, position: Optional[float]):
+        """
+        Move the lens to a fixed position in dioptres, or hand focus back to
+        continuous autofocus when position is None.
+        """
+        self.lens_position = position
+        if self.use_mock:
+            return
+        try:
+            from libcamera import controls
+            manual, continuous = controls.AfModeEnum.Manual, controls.AfModeEnum.Continuous
+        except ImportError:
+            # Replay device: libcamera's enum values
+            manual, continuous = 0, 2
+
+        if position is None:
+            self.camera.set_controls({"AfMode": continuous})
+        else:
+            self.camera.set_controls({"AfMode": manual, "LensPosition": position})
+
+    def _next_frame(self, settle_frames: int = 0) -> np.ndarray:
+        """Grab the next frame, skipping `settle_frames` frames after a lens move."""
+        if self.streaming and self.frame_buffer is not None:
+            target = self.frame_buffer.count + settle_frames + 1
+            if not self.frame_buffer.wait_for_count(target, timeout=5.0):
+                raise RuntimeError("Timed out waiting for camera stream frame")
+            return self.frame_buffer.latest()
+
+        with self.session():
+            if self.use_mock:
+                return self._grab_frame()
+            for _ in range(settle_frames):
+                self.camera.capture_metadata()
+            return self._grab_frame()
+
+    def capture_best(
+        self,
+        output_path: Optional[str] = None,
+        mode: Optional[str] = None,
+        steps: Optional[int] = None,
+    ) -> str:
+        """
+        Capture several frames and keep only the sharpest one.
+
+        In "sweep" mode the lens is stepped across CAMERA_FOCUS_RANGE and one frame is
+        taken per position; the lens is left at the best position afterwards. In "burst"
+        mode frames are taken back to back at the current focus. Each frame is scored on
+        its downscaled luminance channel and only the running best is kept in memory.
+
+        Args:
+            output_path: Optional path to save the image. If None, uses temp file.
+            mode: "sweep" or "burst". Defaults to CAMERA_CAPTURE_BEST_MODE.
+            steps: Number of frames to score. Defaults to CAMERA_FOCUS_STEPS.
+
+        Returns:
+            Path to the sharpest captured image file
+        """
+        from PIL import Image
+
+        mode = mode or self.capture_best_mode
+        steps = max(1, steps or self.focus_steps)
+        if mode not in ("sweep", "burst"):
+            raise ValueError(f"Unknown capture mode: {mode}")
+
+        if mode == "sweep":
+            positions = list(np.linspace(self.focus_range[0], self.focus_range[1], steps))
+        else:
+            positions = [self.lens_position] * steps
+
+        best_frame, best_score, best_position = None, -1.0, None
+        scores = []
+        # Hold the session for the whole sweep so concurrent captures cannot move the lens
+        with self.session():
+            for position in positions:
+                if mode == "sweep":
+                    self.set_lens_position(float(position))
+                frame = self._next_frame(self.focus_settle_frames if mode == "sweep" else 0)
+                score = compute_sharpness(frame)
+                scores.append(score)
+                if score > best_score:
+                    best_frame, best_score, best_position = frame, score, position
+
+            if mode == "sweep":
+                self.set_lens_position(float(best_position))
+
+        if output_path is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            output_path = os.path.join(tempfile.gettempdir(), f"camera_capture_{timestamp}.jpg")
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        Image.fromarray(best_frame).save(output_path, "JPEG", quality=95)
+
+        logging.info(
+            f"Best-frame capture ({mode}, {steps} frames): score {best_score:.1f} "
+            f"(min {min(scores):.1f}), lens position {best_position}"
+        )
+        return output_path
+
+    def capture_image(self, output_path: Optional[str] = None, sharpest_window: Optional[int] = None) -> str:
         """
         Capture an image from the camera.
         
         Args:
             output_path: Optional path to save the image. If None, uses temp file.
+            sharpest_window: In streaming mode, pick the sharpest of this many recent
+                frames instead of the newest one. Defaults to CAMERA_SHARPEST_WINDOW.
             
         Returns:
             Path to the captured image file
         """
+        if self.streaming and self.frame_buffer is not None:
+            return self._capture_from_buffer(output_path, sharpest_window)
+
         if self.use_mock:
             return self._capture_mock_image(output_path)
         
         try:
             # Generate output path if not provided
             if output_path is None:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
                 temp_dir = tempfile.gettempdir()
                 output_path = os.path.join(temp_dir, f"camera_capture_{timestamp}.jpg")
             
             # Ensure directory exists
             Path(output_path).parent.mkdir(parents=True, exist_ok=True)
             
-            # Start camera if not already started
-            if not self.camera.started:
-                self.camera.start()
-            
-            # Capture image
-            self.camera.capture_file(output_path)
+            # Capture image with exclusive access to the camera (starts it if needed)
+            with self.session():
+                self.camera.capture_file(output_path)
             
             logging.info(f"Image captured successfully: {output_path}")
             return output_path
@@ -98,7 +636,8 @@ class CameraService:
     
     def _capture_mock_image(self, output_path: Optional[str] = None) -> str:
         """
-        Create a mock image for testing when camera is not available.
+        Write a synthetic smear image for testing when camera is not available.
+        Frames come from a precomputed pool, so this costs little more than a file write.
         
         Args:
             output_path: Optional path to save the image
@@ -106,49 +645,38 @@ class CameraService:
         Returns:
             Path to the mock image file
         """
-        from PIL import Image, ImageDraw, ImageFont
-        import random
-        
         # Generate output path if not provided
         if output_path is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
             temp_dir = tempfile.gettempdir()
             output_path = os.path.join(temp_dir, f"mock_capture_{timestamp}.jpg")
         
         # Ensure directory exists
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
         
-        # Create a mock blood smear image
-        img = Image.new('RGB', self.resolution, color=(240, 220, 220))
-        draw = ImageDraw.Draw(img)
-        
-        # Draw some random circles to simulate cells
-        for _ in range(50):
-            x = random.randint(0, self.resolution[0])
-            y = random.randint(0, self.resolution[1])
-            r = random.randint(20, 50)
-            color = (random.randint(200, 255), random.randint(180, 220), random.randint(180, 220))
-            draw.ellipse([x-r, y-r, x+r, y+r], fill=color, outline=(150, 150, 150))
-        
-        # Add text overlay
-        try:
-            draw.text((50, 50), "MOCK CAMERA IMAGE", fill=(255, 0, 0))
-        except:
-            pass
-        
-        # Save image
-        img.save(output_path, "JPEG", quality=95)
+        # Serve the next pre-encoded synthetic smear from the shared pool
+        pool = get_mock_frame_pool(
+            self.resolution, size=self.mock_pool_size, seed=self.mock_seed, parasitemia=self.mock_parasitemia
+        )
+        frame, self.last_mock_ground_truth = pool.next_frame()
+        with open(output_path, "wb") as f:
+            f.write(frame)
         
         logging.info(f"Mock image created: {output_path}")
         return output_path
     
     def close(self):
         """Close the camera and release resources."""
+        if self._preview is not None:
+            self._preview.stop()
+        if self.streaming:
+            self.stop_streaming()
         if self.camera and not self.use_mock:
             try:
-                if self.camera.started:
-                    self.camera.stop()
-                self.camera.close()
+                with self._session_lock:
+                    if self.camera.started:
+                        self.camera.stop()
+                    self.camera.close()
                 logging.info("Camera closed successfully")
             except Exception as e:
                 logging.error(f"Error closing camera: {str(e)}")
@@ -156,11 +684,14 @@ class CameraService:
 
 # Singleton instance
 _camera_service = None
+_camera_service_lock = threading.Lock()
 
 def get_camera_service() -> CameraService:
     """Get or create the singleton camera service instance."""
     global _camera_service
     if _camera_service is None:
-        _camera_service = CameraService()
+        with _camera_service_lock:
+            if _camera_service is None:
+                _camera_service = CameraService()
     return _camera_service
 
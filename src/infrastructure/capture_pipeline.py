@@ -0,0 +1,195 @@
+"""
+Pipelined capture -> inference -> storage for camera tests.
+Each stage runs on its own worker thread with a bounded queue in between, so the
+capture of test N+1 overlaps inference and storage of test N. Captured images go
+through the same staging and commit path as uploads.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .ai_inference import get_inference_service
+from .camera_service import get_camera_service
+from .file_storage import get_storage_service
+
+_STOP = object()
+
+
+class CaptureJob:
+    """A single camera test moving through the pipeline."""
+
+    def __init__(self, clinic_id: str):
+        self.clinic_id = clinic_id
+        self.future: Future = Future()
+        self.submitted_at = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.temp_image_path: Optional[str] = None
+        self.inference: Optional[Tuple] = None
+
+
+class CapturePipeline:
+    """
+    Three-stage pipeline: capture, infer (validate + analyze) and store.
+
+    Jobs are submitted from request threads and resolved through a Future holding a
+    dict with the stored image path, its StagedUpload (hash and size, and the pin
+    the caller releases with discard_staged), the inference outcome and per-stage
+    timings. Database writes stay with the caller, which owns the request's session.
+    """
+
+    def __init__(self, camera_service=None, inference_service=None, storage_service=None, queue_size: int = 2):
+        self.camera_service = camera_service or get_camera_service()
+        self.inference_service = inference_service or get_inference_service()
+        self.storage_service = storage_service or get_storage_service()
+
+        self._capture_queue: "queue.Queue" = queue.Queue()
+        self._infer_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._store_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+
+        self._stats_lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self._stage_totals: Dict[str, float] = {"capture": 0.0, "infer": 0.0, "store": 0.0}
+        self._latency_total = 0.0
+        self._first_submit: Optional[float] = None
+        self._last_complete: Optional[float] = None
+
+        self._threads: List[threading.Thread] = [
+            self._start_stage("capture", self._capture_queue, self._infer_queue, self._capture),
+            self._start_stage("infer", self._infer_queue, self._store_queue, self._infer),
+            self._start_stage("store", self._store_queue, None, self._store),
+        ]
+
+    def _start_stage(self, name: str, inbox: "queue.Queue", outbox: Optional["queue.Queue"], work: Callable):
+        thread = threading.Thread(
+            target=self._run_stage, args=(name, inbox, outbox, work), name=f"capture-pipeline-{name}", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _run_stage(self, name: str, inbox: "queue.Queue", outbox: Optional["queue.Queue"], work: Callable):
+        while True:
+            job = inbox.get()
+            if job is _STOP:
+                if outbox is not None:
+                    outbox.put(_STOP)
+                return
+            started = time.perf_counter()
+            try:
+                work(job)
+            except Exception as e:
+                logging.error(f"Capture pipeline {name} stage failed: {str(e)}")
+                self._cleanup(job)
+                with self._stats_lock:
+                    self.failed += 1
+                job.future.set_exception(e)
+                continue
+            job.timings[f"{name}_ms"] = (time.perf_counter() - started) * 1000
+            with self._stats_lock:
+                self._stage_totals[name] += job.timings[f"{name}_ms"]
+            if outbox is not None:
+                outbox.put(job)
+
+    # Stages
+
+    def _capture(self, job: CaptureJob):
+        camera = self.camera_service
+        if camera.capture_best_enabled:
+            job.temp_image_path = camera.capture_best()
+        else:
+            job.temp_image_path = camera.capture_image()
+
+    def _infer(self, job: CaptureJob):
+        if not self.inference_service.validate_image(job.temp_image_path):
+            raise ValueError("Invalid image captured from camera")
+        job.inference = self.inference_service.analyze_image(job.temp_image_path)
+
+    def _store(self, job: CaptureJob):
+        staged = None
+        try:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            with open(job.temp_image_path, "rb") as f:
+                staged = self.storage_service.stage_upload(f, f"camera_capture_{timestamp}.jpg")
+            image_path, image_filename = self.storage_service.commit_staged(staged, job.clinic_id)
+        except BaseException:
+            self.storage_service.discard_staged(staged)
+            raise
+        finally:
+            self._cleanup(job)
+
+        inference_result, confidence, processing_time = job.inference
+        job.timings["total_ms"] = (time.perf_counter() - job.submitted_at) * 1000
+        with self._stats_lock:
+            self.completed += 1
+            self._latency_total += job.timings["total_ms"]
+            self._last_complete = time.perf_counter()
+        job.future.set_result({
+            "image_path": image_path,
+            "image_filename": image_filename,
+            "staged": staged,
+            "inference_result": inference_result,
+            "confidence": confidence,
+            "processing_time_ms": processing_time,
+            "timings": job.timings,
+        })
+
+    def _cleanup(self, job: CaptureJob):
+        if job.temp_image_path and os.path.exists(job.temp_image_path):
+            os.unlink(job.temp_image_path)
+
+    # Public API
+
+    def submit(self, clinic_id: str) -> Future:
+        """Queue a camera test for the given clinic and return its Future."""
+        job = CaptureJob(clinic_id)
+        with self._stats_lock:
+            if self._first_submit is None:
+                self._first_submit = job.submitted_at
+        self._capture_queue.put(job)
+        return job.future
+
+    def stats(self) -> Dict:
+        """End-to-end throughput, mean latency and mean time per stage."""
+        with self._stats_lock:
+            done = self.completed
+            elapsed = (
+                self._last_complete - self._first_submit
+                if self._first_submit is not None and self._last_complete is not None
+                else 0.0
+            )
+            return {
+                "completed": done,
+                "failed": self.failed,
+                "in_flight": self._capture_queue.qsize() + self._infer_queue.qsize() + self._store_queue.qsize(),
+                "throughput_per_min": round(done / elapsed * 60, 2) if elapsed > 0 else 0.0,
+                "mean_latency_ms": round(self._latency_total / done, 1) if done else 0.0,
+                "mean_stage_ms": {
+                    name: round(total / done, 1) if done else 0.0 for name, total in self._stage_totals.items()
+                },
+            }
+
+    def close(self, timeout: float = 5.0):
+        """Drain queued jobs and stop the stage threads."""
+        self._capture_queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+
+# Singleton instance
+_capture_pipeline = None
+_capture_pipeline_lock = threading.Lock()
+
+def get_capture_pipeline() -> CapturePipeline:
+    """Get or create the singleton capture pipeline instance."""
+    global _capture_pipeline
+    if _capture_pipeline is None:
+        with _capture_pipeline_lock:
+            if _capture_pipeline is None:
+                _capture_pipeline = CapturePipeline()
+    return _capture_pipeline
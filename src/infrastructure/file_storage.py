@@ -2,21 +2,349 @@
 File Storage Service for blood smear images
 """
 
+import asyncio
+import io
 import os
 import uuid
+import hashlib
 from pathlib import Path
-from typing import Tuple
+from typing import AsyncIterator, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
 import shutil
 import logging
-from datetime import datetime
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+import aiofiles
+import aiofiles.os
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from src.entities.test_result import TestResult, SyncStatus
+from src.entities.image_checksum import ImageChecksum
+from src.exceptions import ImageTooLargeError, InvalidImageError
+from .group_commit import GroupCommitSyncer
+from .pack_store import PACK_DIR, PackStore
+from .storage_stats import CAS_DIR, StatsReconciler, StorageStatsIndex
+
+STAGING_DIR = ".staging"
+CHUNK_SIZE = 256 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Whole request body of a batch upload (many images, or one ZIP of them)
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("BATCH_MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+BLOB_LOCK_STRIPES = 256
+
+# Reduced-resolution copies stored next to each original: level -> longest side in pixels
+PYRAMID_LEVELS = {"preview": 1024, "thumb": 256}
+PYRAMID_QUALITY = 80
+
+
+def is_derivative(filename: str) -> bool:
+    """Whether a stored file is a pyramid level rather than an original."""
+    return any(filename.endswith(f".{level}.jpg") for level in PYRAMID_LEVELS)
+
+
+# Recompression tiering for aged or synced images
+TIER_EXTENSION = ".webp"
+TIER_QUALITY = int(os.getenv("STORAGE_TIER_QUALITY", "90"))
+TIER_LOSSLESS = os.getenv("STORAGE_TIER_LOSSLESS", "false").lower() in ("1", "true", "yes")
+TIER_MIN_SAVINGS = 0.1  # keep the original unless re-encoding saves at least 10%
+
+
+def _lower_priority():
+    """Process pool initializer: run recompression below the web server's priority."""
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def _recompress_file(source: str, temp_target: str, quality: int, lossless: bool) -> Optional[Tuple[int, int, str]]:
+    """
+    Re-encode an image as WebP into `temp_target` and check that the result decodes
+    to the same dimensions. Runs in a worker process.
+
+    Returns:
+        Tuple of (original bytes, new bytes, SHA-256 of new file), or None if the new
+        file is not worth keeping (it is removed)
+    """
+    from PIL import Image
+
+    with Image.open(source) as image:
+        size = image.size
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        image.save(temp_target, "WEBP", quality=quality, lossless=lossless, method=6)
+
+    try:
+        with Image.open(temp_target) as check:
+            check.load()
+            if check.format != "WEBP" or check.size != size:
+                raise ValueError(f"Re-encoded image does not match original {size}")
+        old_size = os.path.getsize(source)
+        new_size = os.path.getsize(temp_target)
+        if new_size > old_size * (1 - TIER_MIN_SAVINGS):
+            os.unlink(temp_target)
+            return None
+        digest = hashlib.sha256()
+        with open(temp_target, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return old_size, new_size, digest.hexdigest()
+    except Exception:
+        if os.path.exists(temp_target):
+            os.unlink(temp_target)
+        raise
+
+
+@lru_cache(maxsize=4096)
+def _file_sha256(path: str, mtime_ns: int, size: int) -> str:
+    """SHA-256 of a file, cached per (path, mtime, size) so unchanged files are hashed once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Leading bytes of the image formats we accept, mapped to a canonical extension
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": ".jpg",
+    b"\x89PNG\r\n\x1a\n": ".png",
+}
+
+
+def name_digest(relative_path: str) -> Optional[str]:
+    """SHA-256 carried in a content-addressed file name, or None for other names."""
+    name = Path(relative_path).name.split(".", 1)[0]
+    if len(name) == 64 and all(c in "0123456789abcdef" for c in name):
+        return name
+    return None
+
+
+def sniff_extension(header: bytes, fallback: str = "") -> str:
+    """Return the canonical extension for the image format in `header`, or `fallback`."""
+    for signature, extension in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return extension
+    return fallback.lower()
+
+
+class _AsyncBytesReader:
+    """Async read() over an image already held in memory (packed or remote blobs)."""
+
+    def __init__(self, content: bytes):
+        self._buffer = io.BytesIO(content)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+class StagedUpload:
+    """An upload streamed into the staging area, with its hash and size computed on the way in."""
+
+    def __init__(self, path: Path, sha256: str, size: int, extension: str):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.extension = extension
+        self.committed = False
+        self.pinned: Optional[str] = None  # blob this upload holds a pin on
+
 
 class FileStorageService:
-    """Service for storing and managing blood smear images."""
+    """
+    Service for storing and managing blood smear images.
+
+    Two layouts are supported, selected with STORAGE_LAYOUT:
+    - "dated" (default): uploads/<clinic_id>/<YYYY-MM>/<uuid>.<ext>
+    - "cas": content-addressed, uploads/cas/<ab>/<cd>/<sha256>.<ext>. Identical
+      images are stored once; a blob is only deleted when no TestResult.image_path
+      references it any more.
+    - "pack": content-addressed blobs appended to segment files under uploads/pack/,
+      for flash media where one file per image exhausts inodes. Stored paths look like
+      pack/<sha256>.<ext> but have no file of their own; use read_image().
+    """
+
+    # Whether evict_original() can free local space (the retention engine's precondition)
+    evicts_originals = True
     
-    def __init__(self, base_path: str = "./uploads"):
+    def __init__(self, base_path: str = "./uploads", layout: Optional[str] = None):
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
-        logging.info(f"File storage initialized at: {self.base_path}")
+        self.layout = (layout or os.getenv("STORAGE_LAYOUT", "dated")).lower()
+        if self.layout not in ("dated", "cas", "pack"):
+            raise ValueError(f"Unknown storage layout: {self.layout}")
+
+        # Thumbnail pyramid generation runs on a small background pool
+        self.pyramid_enabled = os.getenv("STORAGE_PYRAMID", "true").lower() in ("1", "true", "yes")
+        self.pyramid_workers = int(os.getenv("STORAGE_PYRAMID_WORKERS", "2"))
+        self._pyramid_pool: Optional[ThreadPoolExecutor] = None
+        self._pyramid_pool_lock = threading.Lock()
+
+        # Per-clinic/per-month counters kept in step with every write and delete
+        self.stats = StorageStatsIndex(self.base_path)
+        self._stats_reconciler: Optional[StatsReconciler] = None
+
+        # Every write goes to a temp file and is renamed into place; the fsyncs around the
+        # rename are batched across concurrent writers (STORAGE_FSYNC=group|immediate|off)
+        self.syncer = GroupCommitSyncer(
+            mode=os.getenv("STORAGE_FSYNC", "group").lower(),
+            window=float(os.getenv("STORAGE_FSYNC_WINDOW_MS", "2")) / 1000,
+        )
+
+        # Deduplicated blobs are shared: releasing one checks its references under the
+        # blob's lock, and uploads committed onto a blob pin it until discard_staged, so
+        # a blob cannot be deleted between an upload deduplicating against it and the
+        # upload's result row being committed
+        self._blob_locks = [threading.Lock() for _ in range(BLOB_LOCK_STRIPES)]
+        self._blob_pins: Counter = Counter()
+
+        self._pack: Optional[PackStore] = None
+        self._pack_lock = threading.Lock()
+        if self.layout == "pack":
+            self._open_pack()
+        logging.info(f"File storage initialized at: {self.base_path} ({self.layout} layout)")
+
+    @property
+    def content_addressed(self) -> bool:
+        return self.layout == "cas"
+
+    def _open_pack(self) -> PackStore:
+        with self._pack_lock:
+            if self._pack is None:
+                self._pack = PackStore(
+                    self.base_path / PACK_DIR,
+                    segment_size=int(os.getenv("STORAGE_PACK_SEGMENT_MB", "256")) * 1024 * 1024,
+                    fsync=os.getenv("STORAGE_PACK_FSYNC", "true").lower() in ("1", "true", "yes"),
+                )
+            return self._pack
+
+    @property
+    def pack(self) -> PackStore:
+        """Pack store, opened on first use so packed paths stay readable after a layout change."""
+        return self._pack or self._open_pack()
+
+    @staticmethod
+    def is_packed(relative_path: str) -> bool:
+        return relative_path.startswith(f"{PACK_DIR}/")
+
+    @staticmethod
+    def _blob_id(relative_path: str) -> str:
+        return relative_path[len(PACK_DIR) + 1:]
+
+    def stores_files(self, relative_path: str) -> bool:
+        """Whether an image is a file of its own under base_path (not a packed or remote blob)."""
+        return not self.is_packed(relative_path)
+
+    def _write_blob(self, relative_path: str, content: bytes):
+        """Store an image that does not live in a file of its own."""
+        self.pack.put(self._blob_id(relative_path), content)
+
+    def image_exists(self, relative_path: str) -> bool:
+        if self.is_packed(relative_path):
+            return self._blob_id(relative_path) in self.pack
+        return self.get_image_path(relative_path).exists()
+
+    def read_image(self, relative_path: str) -> bytes:
+        """
+        Read a stored image, wherever it lives.
+
+        Raises:
+            FileNotFoundError: If the image does not exist
+        """
+        if self.is_packed(relative_path):
+            try:
+                return self.pack.get(self._blob_id(relative_path))
+            except KeyError:
+                raise FileNotFoundError(relative_path)
+        return self.get_image_path(relative_path).read_bytes()
+
+    def _save_packed(self, file_content: bytes, original_filename: str) -> Tuple[str, str]:
+        digest = hashlib.sha256(file_content).hexdigest()
+        extension = sniff_extension(file_content[:16], Path(original_filename).suffix)
+        relative_path = f"{PACK_DIR}/{digest}{extension}"
+        if self._blob_id(relative_path) in self.pack:
+            logging.info(f"Image deduplicated: {relative_path}")
+        else:
+            self.pack.put(self._blob_id(relative_path), file_content)
+            logging.info(f"Image packed: {relative_path}")
+            self.schedule_pyramid(relative_path)
+        return relative_path, Path(relative_path).name
+
+    @staticmethod
+    def blob_relative_path(digest: str, extension: str) -> str:
+        """Relative path of a content-addressed blob, fanned out over two directory levels."""
+        return f"{CAS_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    def _track_added(self, file_path: Path):
+        """Count a file that was just written into storage."""
+        stat = file_path.stat()
+        self.stats.record(str(file_path.relative_to(self.base_path)), stat.st_size, stat.st_mtime)
+
+    def _remove_file(self, file_path: Path) -> bool:
+        """Delete a stored file and uncount it. Returns False if it did not exist."""
+        try:
+            stat = file_path.stat()
+            file_path.unlink()
+        except FileNotFoundError:
+            return False
+        self.stats.record(str(file_path.relative_to(self.base_path)), stat.st_size, stat.st_mtime, files=-1)
+        return True
+
+    @staticmethod
+    def _make_parent(file_path: Path) -> List[Path]:
+        """Create the directories above file_path. Returns the directories that gained entries."""
+        created = []
+        parent = file_path.parent
+        while not parent.exists():
+            created.append(parent.parent)
+            parent = parent.parent
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        return created
+
+    def _commit_file(self, temp_path: Path, file_path: Path, new_dirs: List[Path] = ()):
+        """
+        Durably rename a fully written temporary file into place.
+
+        The file is synced before the rename and its directory (plus any directories
+        created for it) after, so after a crash the path holds either nothing or the
+        complete file, and it is on disk before a database row can reference it.
+        """
+        try:
+            self.syncer.sync(temp_path)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        self.syncer.sync(file_path.parent, *new_dirs)
+
+    def _write_atomic(self, file_path: Path, file_content: bytes):
+        """Write to a temporary name and durably rename into place, so readers never see a partial file."""
+        new_dirs = self._make_parent(file_path)
+        temp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(file_content)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        self._commit_file(temp_path, file_path, new_dirs)
+        self._track_added(file_path)
+
+    def _save_content_addressed(self, file_content: bytes, original_filename: str) -> Tuple[str, str]:
+        digest = hashlib.sha256(file_content).hexdigest()
+        extension = sniff_extension(file_content[:16], Path(original_filename).suffix)
+        relative_path = self.blob_relative_path(digest, extension)
+        file_path = self.base_path / relative_path
+
+        if file_path.exists():
+            logging.info(f"Image deduplicated: {file_path}")
+        else:
+            self._write_atomic(file_path, file_content)
+            logging.info(f"Image saved: {file_path}")
+            self.schedule_pyramid(relative_path)
+        return relative_path, file_path.name
     
     def save_image(self, file_content: bytes, original_filename: str, clinic_id: str) -> Tuple[str, str]:
         """
@@ -30,10 +358,14 @@ class FileStorageService:
         Returns:
             Tuple of (file_path, stored_filename)
         """
+        if self.content_addressed:
+            return self._save_content_addressed(file_content, original_filename)
+        if self.layout == "pack":
+            return self._save_packed(file_content, original_filename)
+
         # Create directory structure: uploads/clinic_id/YYYY-MM/
         date_path = datetime.now().strftime("%Y-%m")
         clinic_dir = self.base_path / str(clinic_id) / date_path
-        clinic_dir.mkdir(parents=True, exist_ok=True)
         
         # Generate unique filename
         file_extension = Path(original_filename).suffix
@@ -41,15 +373,444 @@ class FileStorageService:
         file_path = clinic_dir / unique_filename
         
         # Save file
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
+        self._write_atomic(file_path, file_content)
         
         logging.info(f"Image saved: {file_path}")
         
         # Return relative path from base
         relative_path = str(file_path.relative_to(self.base_path))
+        self.schedule_pyramid(relative_path)
         return relative_path, unique_filename
     
+    def stage_upload(
+        self,
+        stream: BinaryIO,
+        original_filename: str,
+        max_bytes: int = MAX_UPLOAD_BYTES,
+    ) -> StagedUpload:
+        """
+        Stream an upload into the staging area in fixed-size chunks.
+
+        The SHA-256 is computed and the magic bytes sniffed as the data arrives, and
+        the upload is abandoned as soon as it exceeds `max_bytes`, so memory use is
+        constant regardless of file size.
+
+        Args:
+            stream: File-like object to read from
+            original_filename: Original filename from upload
+            max_bytes: Maximum accepted size
+
+        Returns:
+            StagedUpload to pass to commit_staged (or discard_staged)
+        """
+        staging_dir = self.base_path / STAGING_DIR
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+
+        # The staged file is named after the sniffed format: inference picks its
+        # loader by suffix, so the first chunk is checked before the file exists
+        chunk = stream.read(CHUNK_SIZE)
+        extension, size = self._check_chunk(chunk, None, 0, max_bytes)
+        staging_path = staging_dir / f"{uuid.uuid4().hex}{extension}"
+
+        try:
+            with open(staging_path, 'wb') as f:
+                while chunk:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    chunk = stream.read(CHUNK_SIZE)
+                    if chunk:
+                        extension, size = self._check_chunk(chunk, extension, size, max_bytes)
+        except Exception:
+            staging_path.unlink(missing_ok=True)
+            raise
+
+        logging.info(f"Staged upload {original_filename}: {size} bytes")
+        return StagedUpload(staging_path, digest.hexdigest(), size, extension)
+
+    @staticmethod
+    def _check_chunk(chunk: bytes, extension: Optional[str], size: int, max_bytes: int) -> Tuple[str, int]:
+        """Sniff the format from the first chunk and enforce the size limit. Returns (extension, new size)."""
+        if not chunk and extension is None:
+            raise InvalidImageError("Empty image upload")
+        if extension is None:
+            extension = sniff_extension(chunk[:16])
+            if not extension:
+                raise InvalidImageError("Unsupported image format; expected JPEG or PNG")
+        size += len(chunk)
+        if size > max_bytes:
+            raise ImageTooLargeError(max_bytes)
+        return extension, size
+
+    # Async variants for async routes: file I/O goes through aiofiles' threads so
+    # the event loop stays free while slow flash storage is read or written.
+
+    async def stage_upload_async(
+        self,
+        upload,
+        original_filename: str,
+        max_bytes: int = MAX_UPLOAD_BYTES,
+    ) -> StagedUpload:
+        """
+        Async counterpart of stage_upload.
+
+        Args:
+            upload: Object with an async read(size), such as FastAPI's UploadFile
+            original_filename: Original filename from upload
+            max_bytes: Maximum accepted size
+        """
+        staging_dir = self.base_path / STAGING_DIR
+        await aiofiles.os.makedirs(staging_dir, exist_ok=True)
+        digest = hashlib.sha256()
+
+        chunk = await upload.read(CHUNK_SIZE)
+        extension, size = self._check_chunk(chunk, None, 0, max_bytes)
+        staging_path = staging_dir / f"{uuid.uuid4().hex}{extension}"
+
+        try:
+            async with aiofiles.open(staging_path, 'wb') as f:
+                while chunk:
+                    digest.update(chunk)
+                    await f.write(chunk)
+                    chunk = await upload.read(CHUNK_SIZE)
+                    if chunk:
+                        extension, size = self._check_chunk(chunk, extension, size, max_bytes)
+        except BaseException:
+            staging_path.unlink(missing_ok=True)
+            raise
+
+        logging.info(f"Staged upload {original_filename}: {size} bytes")
+        return StagedUpload(staging_path, digest.hexdigest(), size, extension)
+
+    async def commit_staged_async(self, staged: StagedUpload, clinic_id: str, keep_staged: bool = False) -> Tuple[str, str]:
+        """Async counterpart of commit_staged (a rename locally, an upload for remote backends)."""
+        return await asyncio.to_thread(self.commit_staged, staged, clinic_id, keep_staged)
+
+    async def save_image_async(self, file_content: bytes, original_filename: str, clinic_id: str) -> Tuple[str, str]:
+        """
+        Async counterpart of save_image. The bytes are written to the staging area
+        through aiofiles and committed like a staged upload.
+
+        Returns:
+            Tuple of (file_path, stored_filename)
+        """
+        if self.layout == "pack" or not self.stores_files(""):
+            return await asyncio.to_thread(self.save_image, file_content, original_filename, clinic_id)
+
+        staging_dir = self.base_path / STAGING_DIR
+        await aiofiles.os.makedirs(staging_dir, exist_ok=True)
+        extension = sniff_extension(file_content[:16], Path(original_filename).suffix)
+        staged = StagedUpload(
+            staging_dir / f"{uuid.uuid4().hex}{extension}",
+            hashlib.sha256(file_content).hexdigest(),
+            len(file_content),
+            extension,
+        )
+        try:
+            async with aiofiles.open(staged.path, 'wb') as f:
+                await f.write(file_content)
+            return await self.commit_staged_async(staged, clinic_id)
+        finally:
+            self.discard_staged(staged)
+
+    @asynccontextmanager
+    async def open_image_async(self, relative_path: str) -> AsyncIterator:
+        """
+        Open a stored image for async reading: `async with storage.open_image_async(path) as f:
+        data = await f.read()`.
+
+        Raises:
+            FileNotFoundError: If the image does not exist
+        """
+        if self.stores_files(relative_path):
+            async with aiofiles.open(self.get_image_path(relative_path), 'rb') as f:
+                yield f
+        else:
+            content = await asyncio.to_thread(self.read_image, relative_path)
+            yield _AsyncBytesReader(content)
+
+    async def resolve_image_async(
+        self, relative_path: str, level: str = "original"
+    ) -> Tuple[Union[Path, bytes, Iterator[bytes]], str]:
+        """
+        Async counterpart of resolve_image. The lookups, content hash and any
+        on-demand pyramid generation run in a worker thread; a returned Path is
+        meant for FileResponse, which reads it off the event loop as well.
+        """
+        return await asyncio.to_thread(self.resolve_image, relative_path, level)
+
+    def _blob_lock(self, digest: str) -> threading.Lock:
+        return self._blob_locks[hash(digest) % BLOB_LOCK_STRIPES]
+
+    def commit_staged(self, staged: StagedUpload, clinic_id: str, keep_staged: bool = False) -> Tuple[str, str]:
+        """
+        Move a staged upload into permanent storage without re-reading it.
+
+        A deduplicated blob stays pinned until discard_staged(), which callers run
+        once the referencing result is committed (or abandoned).
+
+        Args:
+            staged: The staged upload
+            clinic_id: ID of the clinic for organization
+            keep_staged: Leave the staged file in place (for readers still using it);
+                discard_staged() removes it afterwards
+
+        Returns:
+            Tuple of (file_path, stored_filename)
+        """
+        if self.layout == "dated":
+            return self._commit_staged(staged, clinic_id, keep_staged)
+        with self._blob_lock(staged.sha256):
+            relative_path, filename = self._commit_staged(staged, clinic_id, keep_staged)
+            self._blob_pins[relative_path] += 1
+        staged.pinned = relative_path
+        return relative_path, filename
+
+    def _commit_staged(self, staged: StagedUpload, clinic_id: str, keep_staged: bool) -> Tuple[str, str]:
+        if self.layout == "pack":
+            relative_path = f"{PACK_DIR}/{staged.sha256}{staged.extension}"
+            if self._blob_id(relative_path) in self.pack:
+                logging.info(f"Image deduplicated: {relative_path}")
+            else:
+                with open(staged.path, 'rb') as f:
+                    self.pack.put_stream(self._blob_id(relative_path), f, staged.size)
+                logging.info(f"Image packed: {relative_path}")
+                self.schedule_pyramid(relative_path)
+            if not keep_staged:
+                staged.path.unlink(missing_ok=True)
+                staged.committed = True
+            return relative_path, Path(relative_path).name
+
+        if self.content_addressed:
+            relative_path = self.blob_relative_path(staged.sha256, staged.extension)
+            file_path = self.base_path / relative_path
+            if file_path.exists():
+                logging.info(f"Image deduplicated: {file_path}")
+                if not keep_staged:
+                    staged.path.unlink(missing_ok=True)
+            else:
+                new_dirs = self._make_parent(file_path)
+                self._commit_file(self._staged_source(staged, file_path, keep_staged), file_path, new_dirs)
+                self._track_added(file_path)
+                logging.info(f"Image saved: {file_path}")
+        else:
+            date_path = datetime.now().strftime("%Y-%m")
+            file_path = self.base_path / str(clinic_id) / date_path / f"{uuid.uuid4()}{staged.extension}"
+            new_dirs = self._make_parent(file_path)
+            self._commit_file(self._staged_source(staged, file_path, keep_staged), file_path, new_dirs)
+            self._track_added(file_path)
+            logging.info(f"Image saved: {file_path}")
+
+        staged.committed = not keep_staged
+        relative_path = str(file_path.relative_to(self.base_path))
+        self.schedule_pyramid(relative_path)
+        return relative_path, file_path.name
+
+    @staticmethod
+    def _staged_source(staged: StagedUpload, file_path: Path, keep_staged: bool) -> Path:
+        """File to rename into file_path: the staged file, or a hard link to it if it must stay."""
+        if not keep_staged:
+            return staged.path
+        return FileStorageService._link_beside(staged.path, file_path)
+
+    @staticmethod
+    def _link_beside(source: Path, file_path: Path) -> Path:
+        """Hard-link source to a temporary name next to file_path, for _commit_file to rename."""
+        link = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(source, link)
+        except OSError:
+            # Filesystems without hard links (FAT-formatted cards) get a copy
+            shutil.copyfile(source, link)
+        return link
+
+    def discard_staged(self, staged: Optional[StagedUpload]):
+        """Remove a staged upload that was not committed, and release its pin."""
+        if staged is None:
+            return
+        if staged.pinned is not None:
+            with self._blob_lock(Path(staged.pinned).stem):
+                self._blob_pins[staged.pinned] -= 1
+                if self._blob_pins[staged.pinned] <= 0:
+                    del self._blob_pins[staged.pinned]
+            staged.pinned = None
+        if not staged.committed:
+            staged.path.unlink(missing_ok=True)
+
+    @staticmethod
+    def pyramid_path(relative_path: str, level: str) -> str:
+        """Relative path of a pyramid level, stored next to the original."""
+        if level not in PYRAMID_LEVELS:
+            raise ValueError(f"Unknown pyramid level: {level}")
+        original = Path(relative_path)
+        return str(original.with_name(f"{original.stem}.{level}.jpg"))
+
+    def generate_pyramid(self, relative_path: str) -> Dict[str, str]:
+        """
+        Generate any missing pyramid levels for an image.
+
+        JPEGs are decoded at reduced resolution (DCT scaling via Image.draft) just
+        large enough for the biggest level, and each smaller level is resized from
+        the previous one rather than from the original.
+
+        Returns:
+            Dictionary of level -> relative path
+        """
+        from PIL import Image
+
+        levels = {level: self.pyramid_path(relative_path, level) for level in PYRAMID_LEVELS}
+        missing = [level for level, path in levels.items() if not self.image_exists(path)]
+        if not missing:
+            return levels
+
+        in_files = self.stores_files(relative_path)
+        source = self.get_image_path(relative_path) if in_files else io.BytesIO(self.read_image(relative_path))
+        with Image.open(source) as image:
+            largest = max(PYRAMID_LEVELS[level] for level in missing)
+            image.draft("RGB", (largest, largest))
+            current = image.convert("RGB")
+
+        for level, max_side in sorted(PYRAMID_LEVELS.items(), key=lambda item: -item[1]):
+            current.thumbnail((max_side, max_side), Image.BILINEAR)
+            if level in missing and not in_files:
+                buffer = io.BytesIO()
+                current.save(buffer, "JPEG", quality=PYRAMID_QUALITY)
+                self._write_blob(levels[level], buffer.getvalue())
+            elif level in missing:
+                target = self.get_image_path(levels[level])
+                temp_path = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+                current.save(temp_path, "JPEG", quality=PYRAMID_QUALITY)
+                self._commit_file(temp_path, target)
+                self._track_added(target)
+
+        logging.info(f"Generated pyramid levels {missing} for {relative_path}")
+        return levels
+
+    def _get_pyramid_pool(self) -> ThreadPoolExecutor:
+        with self._pyramid_pool_lock:
+            if self._pyramid_pool is None:
+                self._pyramid_pool = ThreadPoolExecutor(
+                    max_workers=self.pyramid_workers, thread_name_prefix="storage-pyramid"
+                )
+            return self._pyramid_pool
+
+    def schedule_pyramid(self, relative_path: str) -> Optional[Future]:
+        """Queue pyramid generation for an image on the background pool."""
+        if not self.pyramid_enabled:
+            return None
+
+        def generate():
+            try:
+                return self.generate_pyramid(relative_path)
+            except Exception as e:
+                logging.error(f"Failed to generate pyramid for {relative_path}: {str(e)}")
+                return None
+
+        return self._get_pyramid_pool().submit(generate)
+
+    def iter_originals(self) -> Iterator[str]:
+        """Yield the relative path of every stored original image (not derivatives or temp files)."""
+        for directory, subdirs, filenames in os.walk(self.base_path):
+            subdirs[:] = [d for d in subdirs if not d.startswith(".")]
+            for filename in filenames:
+                if filename.startswith(".") or is_derivative(filename):
+                    continue
+                if Path(filename).suffix.lower() not in (".jpg", ".jpeg", ".png", ".webp"):
+                    continue
+                yield str((Path(directory) / filename).relative_to(self.base_path))
+
+    def backfill_pyramids(self, limit: Optional[int] = None, max_in_flight: int = 16) -> dict:
+        """
+        Generate missing pyramid levels for the existing archive on the background pool.
+
+        Args:
+            limit: Stop after queueing this many images (None = whole archive)
+            max_in_flight: Maximum number of queued images at a time
+
+        Returns:
+            Dictionary with backfill stats
+        """
+        pool = self._get_pyramid_pool()
+        stats = {"scanned": 0, "generated": 0, "failed": 0}
+        in_flight = []
+
+        def drain(keep: int):
+            while len(in_flight) > keep:
+                future = in_flight.pop(0)
+                try:
+                    future.result()
+                    stats["generated"] += 1
+                except Exception as e:
+                    logging.error(f"Pyramid backfill failed: {str(e)}")
+                    stats["failed"] += 1
+
+        for relative_path in self.iter_originals():
+            stats["scanned"] += 1
+            if all(self.get_image_path(self.pyramid_path(relative_path, level)).exists() for level in PYRAMID_LEVELS):
+                continue
+            if limit is not None and stats["generated"] + stats["failed"] + len(in_flight) >= limit:
+                break
+            in_flight.append(pool.submit(self.generate_pyramid, relative_path))
+            drain(max_in_flight)
+        drain(0)
+
+        logging.info(f"Pyramid backfill: {stats}")
+        return stats
+
+    def content_hash(self, relative_path: str) -> str:
+        """
+        SHA-256 of a stored file.
+
+        Content-addressed blobs carry their hash in the file name; other files are
+        hashed once and cached until they change on disk.
+        """
+        digest = name_digest(relative_path)
+        if digest is not None:
+            return digest
+        stat = self.get_image_path(relative_path).stat()
+        return _file_sha256(str(self.get_image_path(relative_path)), stat.st_mtime_ns, stat.st_size)
+
+    def resolve_image(self, relative_path: str, level: str = "original") -> Tuple[Union[Path, bytes], str]:
+        """
+        Locate an original or one of its pyramid levels for serving.
+
+        Missing pyramid levels are generated synchronously.
+
+        Returns:
+            Tuple of (full path, or the content itself for images without a file of their own,
+            content hash of the original)
+        Raises:
+            FileNotFoundError: If the original image is missing
+        """
+        if not self.stores_files(relative_path):
+            digest = self.content_hash(relative_path)
+            if level != "original" and self.image_exists(self.pyramid_path(relative_path, level)):
+                return self.read_image(self.pyramid_path(relative_path, level)), digest
+            if not self.image_exists(relative_path):
+                raise FileNotFoundError(relative_path)
+            if level == "original":
+                return self.read_image(relative_path), digest
+            self.generate_pyramid(relative_path)
+            return self.read_image(self.pyramid_path(relative_path, level)), digest
+
+        original = self.get_image_path(relative_path)
+        if level != "original":
+            # Pyramid levels outlive an evicted original, so check them first
+            derivative = self.get_image_path(self.pyramid_path(relative_path, level))
+            if derivative.exists():
+                try:
+                    return derivative, self.content_hash(relative_path)
+                except FileNotFoundError:
+                    return derivative, self.content_hash(self.pyramid_path(relative_path, level))
+        if not original.exists():
+            raise FileNotFoundError(str(original))
+        digest = self.content_hash(relative_path)
+        if level == "original":
+            return original, digest
+
+        self.generate_pyramid(relative_path)
+        return derivative, digest
+
     def get_image_path(self, relative_path: str) -> Path:
         """
         Get the full path to an image.
@@ -73,9 +834,19 @@ class FileStorageService:
             True if deleted successfully, False otherwise
         """
         try:
+            if self.is_packed(relative_path):
+                if not self.pack.delete(self._blob_id(relative_path)):
+                    logging.warning(f"Image not found for deletion: {relative_path}")
+                    return False
+                for level in PYRAMID_LEVELS:
+                    self.pack.delete(self._blob_id(self.pyramid_path(relative_path, level)))
+                logging.info(f"Image deleted: {relative_path}")
+                return True
+
             file_path = self.get_image_path(relative_path)
-            if file_path.exists():
-                file_path.unlink()
+            if self._remove_file(file_path):
+                for level in PYRAMID_LEVELS:
+                    self._remove_file(self.get_image_path(self.pyramid_path(relative_path, level)))
                 logging.info(f"Image deleted: {file_path}")
                 return True
             else:
@@ -85,36 +856,365 @@ class FileStorageService:
             logging.error(f"Error deleting image: {str(e)}")
             return False
     
+    def evict_original(self, relative_path: str, is_protected: Optional[Callable[[], bool]] = None) -> int:
+        """
+        Remove the local copy of an original image under disk pressure, keeping its
+        pyramid levels so previews still load.
+
+        The blob is kept while an upload that deduplicated onto it is in flight (pinned),
+        or if `is_protected()` - evaluated under the blob lock, so no upload can commit a
+        new reference in between - returns True.
+
+        Returns:
+            Bytes freed (0 if the image was not stored locally or is still needed)
+        """
+        with self._blob_lock(Path(relative_path).stem):
+            if self._blob_pins[relative_path] > 0 or (is_protected is not None and is_protected()):
+                logging.info(f"Image {relative_path} gained a reference; not evicting it")
+                return 0
+            if self.is_packed(relative_path):
+                blob_id = self._blob_id(relative_path)
+                location = self.pack.location(blob_id)
+                # Packed bytes are only returned to the filesystem by compact_pack()
+                return location[2] if location is not None and self.pack.delete(blob_id) else 0
+            file_path = self.get_image_path(relative_path)
+            try:
+                size = file_path.stat().st_size
+            except FileNotFoundError:
+                return 0
+            return size if self._remove_file(file_path) else 0
+
+    def count_references(self, db: Session, relative_path: str) -> int:
+        """Count the test results whose image_path points at this image."""
+        return db.query(TestResult).filter(TestResult.image_path == relative_path).count()
+
+    def release_image(
+        self, db: Session, relative_path: str, staged: Optional[StagedUpload] = None, keep_pyramid: bool = False
+    ) -> bool:
+        """
+        Delete an image once nothing references it any more. Call after the owning
+        test result has been removed or repointed (and the change flushed).
+
+        Args:
+            db: Database session
+            relative_path: Image to release
+            staged: The upload that stored it, whose own pin does not count as a reference
+            keep_pyramid: Leave the pyramid levels (shared with a re-encode of the same name)
+
+        Returns:
+            True if the file was deleted, False if it is still referenced or missing
+        """
+        with self._blob_lock(Path(relative_path).stem):
+            references = self.count_references(db, relative_path) + self._blob_pins[relative_path]
+            if staged is not None and staged.pinned == relative_path:
+                references -= 1
+            if references > 0:
+                logging.info(f"Image {relative_path} still has {references} references; keeping it")
+                return False
+            if keep_pyramid:
+                return self._remove_file(self.get_image_path(relative_path))
+            return self.delete_image(relative_path)
+
+    def migrate_to_content_addressed(self, db: Session, batch_size: int = 200, dry_run: bool = False) -> dict:
+        """
+        Move existing dated-layout images into the content-addressed store and repoint
+        the test results that reference them. Duplicate images collapse into one blob.
+
+        Args:
+            db: Database session
+            batch_size: Number of test results updated per commit
+            dry_run: Only report what would happen
+
+        Returns:
+            Dictionary with migration stats, including bytes reclaimed by deduplication
+        """
+        stats = {"results_scanned": 0, "files_migrated": 0, "duplicates": 0, "missing": 0, "bytes_reclaimed": 0}
+        moved = {}  # old relative path -> new relative path, for images shared by several results
+        seen_blobs = set()
+        retired = set()  # old relative paths to delete once no committed row references them
+        last_id = None
+        while True:
+            query = db.query(TestResult).filter(
+                ~TestResult.image_path.startswith(f"{CAS_DIR}/"), ~TestResult.image_path.startswith(f"{PACK_DIR}/")
+            )
+            if last_id is not None:
+                query = query.filter(TestResult.id > last_id)
+            batch = query.order_by(TestResult.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            for result in batch:
+                stats["results_scanned"] += 1
+                if result.image_path in moved:
+                    if not dry_run:
+                        result.image_path = moved[result.image_path]
+                        result.image_filename = Path(result.image_path).name
+                    continue
+                old_relative = result.image_path
+                old_path = self.get_image_path(old_relative)
+                if not old_path.exists():
+                    stats["missing"] += 1
+                    continue
+
+                digest = hashlib.sha256()
+                with open(old_path, 'rb') as f:
+                    header = f.read(16)
+                    digest.update(header)
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        digest.update(chunk)
+                extension = sniff_extension(header, old_path.suffix)
+                new_relative = self.blob_relative_path(digest.hexdigest(), extension)
+                new_path = self.base_path / new_relative
+                size = old_path.stat().st_size
+
+                moved[old_relative] = new_relative
+                if new_path.exists() or new_relative in seen_blobs:
+                    stats["duplicates"] += 1
+                    stats["bytes_reclaimed"] += size
+                else:
+                    stats["files_migrated"] += 1
+                seen_blobs.add(new_relative)
+                if dry_run:
+                    continue
+
+                # The blob is linked in before the rows move to it, and the old file is
+                # only deleted after they have, so a crash never leaves a dangling path
+                if not new_path.exists():
+                    new_dirs = self._make_parent(new_path)
+                    self._commit_file(self._link_beside(old_path, new_path), new_path, new_dirs)
+                # Content-addressed names carry their own checksum
+                db.query(ImageChecksum).filter(ImageChecksum.image_path == old_relative).delete(
+                    synchronize_session=False
+                )
+                result.image_path = new_relative
+                result.image_filename = new_path.name
+                retired.add(old_relative)
+
+            if not dry_run:
+                db.commit()
+                for old_relative in [p for p in retired if self.count_references(db, p) == 0]:
+                    retired.discard(old_relative)
+                    self.get_image_path(old_relative).unlink(missing_ok=True)
+                    for level in PYRAMID_LEVELS:
+                        # Derivatives are regenerated next to the blob on demand
+                        self.get_image_path(self.pyramid_path(old_relative, level)).unlink(missing_ok=True)
+
+        if dry_run:
+            db.rollback()
+        else:
+            # Files moved between buckets wholesale; recount rather than track each move
+            self.stats.reconcile()
+        logging.info(f"Content-addressed migration{' (dry run)' if dry_run else ''}: {stats}")
+        return stats
+
+    def recompress_aged_images(
+        self,
+        db: Session,
+        older_than_days: Optional[float] = 30,
+        include_synced: bool = True,
+        workers: int = 2,
+        batch_size: int = 50,
+        quality: int = TIER_QUALITY,
+        lossless: bool = TIER_LOSSLESS,
+        dry_run: bool = False,
+    ) -> dict:
+        """
+        Re-encode images of old or already synced test results as WebP.
+
+        Work runs in a low-priority process pool. Each re-encoded file is decoded
+        again before anything is replaced; the originals are only deleted once every
+        test result referencing them has been repointed and committed. Images whose
+        re-encode does not save at least 10% are left alone.
+
+        Args:
+            db: Database session
+            older_than_days: Recompress results older than this (None = no age criterion)
+            include_synced: Also recompress results already synced to the central server
+            workers: Worker processes
+            batch_size: Test results per batch/commit
+            quality: WebP quality for lossy re-encoding
+            lossless: Use lossless WebP instead
+            dry_run: Only count candidate images and their size
+
+        Returns:
+            Dictionary with bytes saved and throughput
+        """
+        stats = {"candidates": 0, "recompressed": 0, "skipped": 0, "failed": 0, "missing": 0,
+                 "bytes_before": 0, "bytes_after": 0}
+        criteria = []
+        if older_than_days is not None:
+            criteria.append(TestResult.test_date < datetime.now(timezone.utc) - timedelta(days=older_than_days))
+        if include_synced:
+            criteria.append(TestResult.sync_status == SyncStatus.Synced)
+        if not criteria:
+            raise ValueError("Recompression needs an age limit or include_synced")
+
+        started = time.perf_counter()
+        seen = set()
+        last_id = None
+        pool = None if dry_run else ProcessPoolExecutor(max_workers=workers, initializer=_lower_priority)
+        try:
+            while True:
+                query = db.query(TestResult).filter(
+                    or_(*criteria),
+                    ~TestResult.image_path.endswith(TIER_EXTENSION),
+                    ~TestResult.image_path.startswith(f"{PACK_DIR}/"),
+                )
+                if last_id is not None:
+                    query = query.filter(TestResult.id > last_id)
+                batch = query.order_by(TestResult.id).limit(batch_size).all()
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                jobs = {}
+                for result in batch:
+                    if result.image_path in seen:
+                        continue
+                    seen.add(result.image_path)
+                    source = self.get_image_path(result.image_path)
+                    if not source.exists():
+                        stats["missing"] += 1
+                        continue
+                    stats["candidates"] += 1
+                    if dry_run:
+                        stats["bytes_before"] += source.stat().st_size
+                        continue
+                    temp_target = source.with_name(f".{source.stem}.{uuid.uuid4().hex}{TIER_EXTENSION}.tmp")
+                    jobs[result.image_path] = (
+                        temp_target,
+                        pool.submit(_recompress_file, str(source), str(temp_target), quality, lossless),
+                    )
+
+                for old_relative, (temp_target, future) in jobs.items():
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        logging.error(f"Recompression failed for {old_relative}: {str(e)}")
+                        stats["failed"] += 1
+                        continue
+                    if outcome is None:
+                        stats["skipped"] += 1
+                        continue
+                    old_size, new_size, digest = outcome
+                    self._replace_with_recompressed(db, old_relative, temp_target, digest)
+                    stats["recompressed"] += 1
+                    stats["bytes_before"] += old_size
+                    stats["bytes_after"] += new_size
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+
+        elapsed = time.perf_counter() - started
+        stats["bytes_saved"] = stats["bytes_before"] - stats["bytes_after"]
+        stats["elapsed_s"] = round(elapsed, 2)
+        stats["images_per_s"] = round(stats["recompressed"] / elapsed, 2) if elapsed > 0 else 0.0
+        stats["mb_per_s"] = round(stats["bytes_before"] / (1024 * 1024) / elapsed, 2) if elapsed > 0 else 0.0
+        logging.info(f"Recompression{' (dry run)' if dry_run else ''}: {stats}")
+        return stats
+
+    def _replace_with_recompressed(self, db: Session, old_relative: str, temp_target: Path, digest: str):
+        """Move a verified re-encode into place, repoint its test results, then drop the original."""
+        old_path = self.get_image_path(old_relative)
+        if old_relative.startswith(f"{CAS_DIR}/"):
+            new_relative = self.blob_relative_path(digest, TIER_EXTENSION)
+        else:
+            new_relative = str(Path(old_relative).with_suffix(TIER_EXTENSION))
+        new_path = self.get_image_path(new_relative)
+        content_addressed = new_relative.startswith(f"{CAS_DIR}/")
+
+        with self._blob_lock(Path(new_relative).stem):
+            created = not new_path.exists()
+            if created:
+                self._commit_file(temp_target, new_path, self._make_parent(new_path))
+                self._track_added(new_path)
+            else:
+                # Another result's re-encode produced the same blob; it is not ours to remove
+                temp_target.unlink(missing_ok=True)
+
+        try:
+            db.query(TestResult).filter(TestResult.image_path == old_relative).update(
+                {TestResult.image_path: new_relative, TestResult.image_filename: new_path.name},
+                synchronize_session="fetch",
+            )
+            checksum = db.query(ImageChecksum).filter(ImageChecksum.image_path == old_relative)
+            if name_digest(new_relative) is None:
+                checksum.update(
+                    {ImageChecksum.image_path: new_relative, ImageChecksum.sha256: digest,
+                     ImageChecksum.size_bytes: new_path.stat().st_size},
+                    synchronize_session=False,
+                )
+            else:
+                checksum.delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            if created:
+                self.release_image(db, new_relative, keep_pyramid=not content_addressed)
+            raise
+
+        if content_addressed:
+            # Pyramid levels are named after the blob, so the new blob gets its own links
+            for level in PYRAMID_LEVELS:
+                old_level = self.get_image_path(self.pyramid_path(old_relative, level))
+                new_level = self.get_image_path(self.pyramid_path(new_relative, level))
+                if old_level.exists() and not new_level.exists():
+                    os.replace(self._link_beside(old_level, new_level), new_level)
+        # An upload may have deduplicated onto the original while it was re-encoded
+        self.release_image(db, old_relative, keep_pyramid=not content_addressed)
+
     def get_storage_stats(self) -> dict:
         """
-        Get storage statistics.
+        Get storage statistics from the incrementally maintained counters.
         
         Returns:
-            Dictionary with storage stats
+            Dictionary with storage stats, including a per-clinic/per-month breakdown
         """
-        total_size = 0
-        file_count = 0
-        
-        for file_path in self.base_path.rglob("*"):
-            if file_path.is_file():
-                total_size += file_path.stat().st_size
-                file_count += 1
-        
-        return {
-            "total_files": file_count,
-            "total_size_bytes": total_size,
-            "total_size_mb": round(total_size / (1024 * 1024), 2),
-            "base_path": str(self.base_path)
-        }
+        stats = self.stats.snapshot()
+        if self._pack is not None or (self.base_path / PACK_DIR).exists():
+            stats["pack"] = self.pack.stats()
+            stats["total_files"] += stats["pack"]["blobs"]
+            stats["total_size_bytes"] += stats["pack"]["segment_bytes"]
+        stats["total_size_mb"] = round(stats["total_size_bytes"] / (1024 * 1024), 2)
+        stats["fsync"] = self.syncer.stats()
+        stats["base_path"] = str(self.base_path)
+        return stats
+
+    def compact_pack(self, min_dead_ratio: float = 0.5, target_bytes: Optional[int] = None) -> dict:
+        """
+        Reclaim space held by deleted blobs in the pack store. Safe while other
+        processes use the store; the retention engine calls it on every check.
+        """
+        return self.pack.compact(min_dead_ratio, target_bytes)
+
+    def start_stats_reconciler(self, interval: Optional[float] = None, workers: Optional[int] = None):
+        """
+        Periodically rebuild the storage counters from disk in the background.
+        Runs immediately when no counters have been persisted yet.
+        """
+        interval = interval if interval is not None else float(os.getenv("STORAGE_STATS_RECONCILE_SECONDS", "21600"))
+        workers = workers or int(os.getenv("STORAGE_STATS_WORKERS", "4"))
+        if interval > 0 and self._stats_reconciler is None:
+            self._stats_reconciler = StatsReconciler(self.stats, interval, workers)
 
 
 # Singleton instance
 _storage_service = None
 
 def get_storage_service() -> FileStorageService:
-    """Get or create the singleton storage service instance."""
+    """Get or create the singleton storage service instance for STORAGE_BACKEND (local or s3)."""
     global _storage_service
     if _storage_service is None:
-        _storage_service = FileStorageService()
+        backend = os.getenv("STORAGE_BACKEND", "local").lower()
+        if backend == "s3":
+            from .s3_storage import S3StorageService
+
+            _storage_service = S3StorageService()
+        elif backend == "local":
+            _storage_service = FileStorageService()
+        else:
+            raise ValueError(f"Unknown storage backend: {backend}")
+        _storage_service.start_stats_reconciler()
     return _storage_service
 
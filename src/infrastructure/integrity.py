@@ -0,0 +1,307 @@
+"""
+Storage integrity scrubber.
+Checks that every image referenced by a test result exists and still matches its
+checksum, and finds stored files that no test result references. Database reads
+are keyset-paginated, file checks run on a thread pool, and reads can be throttled
+so a scrub can run alongside clinic traffic. Progress is checkpointed to a state
+file so an interrupted scrub picks up where it stopped.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from src.database.core import SessionLocal
+from src.entities.evicted_image import EvictedImage
+from src.entities.image_checksum import ImageChecksum
+from src.entities.test_result import TestResult
+from .file_storage import CHUNK_SIZE, FileStorageService, get_storage_service, is_derivative, name_digest
+from .pack_store import PACK_DIR
+from .storage_stats import CAS_DIR
+
+SCRUB_STATE_FILE = ".scrub-state.json"
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+
+
+class RateLimiter:
+    """Token bucket over bytes read, shared by all scrub threads."""
+
+    def __init__(self, bytes_per_second: Optional[float]):
+        self.rate = bytes_per_second
+        self._allowance = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, size: int):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Allow at most one second of burst
+            self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate) - size
+            self._last = now
+            wait = -self._allowance / self.rate if self._allowance < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+def _empty_report() -> Dict:
+    return {
+        "images_checked": 0,
+        "verified": 0,
+        "checksums_recorded": 0,
+        "evicted": 0,
+        "missing": [],
+        "corrupt": [],
+        "orphans": [],
+        "files_scanned": 0,
+        "bytes_read": 0,
+    }
+
+
+class IntegrityScrubber:
+    """
+    Scrub a storage directory against the test results referencing it.
+
+    Phase one pages through the distinct TestResult.image_path values in order. Each
+    image is hashed and compared with the hash in its name (content-addressed and
+    packed blobs) or its ImageChecksum row. Images without either get a checksum
+    recorded, so they are verified from the next scrub on. Phase two scans the tree
+    with os.scandir, one top-level directory per thread, and reports originals that
+    no result references, plus pyramid levels whose original is unreferenced.
+    Files younger than `min_orphan_age` seconds are skipped, because an upload in
+    progress is on disk before its result row is.
+    """
+
+    def __init__(
+        self,
+        storage: Optional[FileStorageService] = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        workers: int = 4,
+        batch_size: int = 200,
+        max_mb_per_sec: Optional[float] = None,
+        min_orphan_age: float = 3600,
+        state_path: Optional[Path] = None,
+    ):
+        self.storage = storage or get_storage_service()
+        self.session_factory = session_factory
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(max_mb_per_sec * 1024 * 1024 if max_mb_per_sec else None)
+        self.min_orphan_age = min_orphan_age
+        self.state_path = Path(state_path) if state_path else self.storage.base_path / SCRUB_STATE_FILE
+
+    # Checkpoints
+
+    def _load_state(self) -> Optional[Dict]:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError) as e:
+            logging.warning(f"Ignoring unreadable scrub state at {self.state_path}: {str(e)}")
+            return None
+
+    def _save_state(self, state: Dict):
+        temp_path = self.state_path.with_name(f"{self.state_path.name}.{uuid.uuid4().hex}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    # Phase one: referenced images
+
+    def _hash(self, relative_path: str) -> Tuple[str, int]:
+        """Hash a stored image, throttled. Raises FileNotFoundError if it is missing."""
+        digest = hashlib.sha256()
+        if not self.storage.stores_files(relative_path):
+            content = self.storage.read_image(relative_path)
+            self.limiter.acquire(len(content))
+            digest.update(content)
+            return digest.hexdigest(), len(content)
+
+        size = 0
+        with open(self.storage.get_image_path(relative_path), "rb") as f:
+            while True:
+                self.limiter.acquire(CHUNK_SIZE)
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
+
+    def _verify(self, relative_path: str, expected: Optional[str]) -> Tuple[str, Optional[str], int]:
+        """Returns (outcome, actual digest, size) with outcome "ok", "unrecorded", "corrupt" or "missing"."""
+        try:
+            actual, size = self._hash(relative_path)
+        except FileNotFoundError:
+            return "missing", None, 0
+        if expected is None:
+            return "unrecorded", actual, size
+        return ("ok" if actual == expected else "corrupt"), actual, size
+
+    def _check_batch(self, db: Session, pool: ThreadPoolExecutor, paths: List[str], report: Dict):
+        stored = {c.image_path: c for c in db.query(ImageChecksum).filter(ImageChecksum.image_path.in_(paths))}
+        evicted = {p for (p,) in db.query(EvictedImage.image_path).filter(EvictedImage.image_path.in_(paths))}
+        expected = [name_digest(p) or (stored[p].sha256 if p in stored else None) for p in paths]
+
+        now = datetime.now(timezone.utc)
+        for path, wanted, (outcome, actual, size) in zip(paths, expected, pool.map(self._verify, paths, expected)):
+            report["images_checked"] += 1
+            report["bytes_read"] += size
+            if outcome == "missing":
+                if path in evicted:
+                    report["evicted"] += 1
+                    continue
+                result_ids = [str(r) for (r,) in db.query(TestResult.id).filter(TestResult.image_path == path)]
+                report["missing"].append({"image_path": path, "result_ids": result_ids})
+            elif outcome == "corrupt":
+                report["corrupt"].append({"image_path": path, "expected": wanted, "actual": actual})
+            elif outcome == "unrecorded":
+                db.add(ImageChecksum(image_path=path, sha256=actual, size_bytes=size, verified_at=now))
+                report["checksums_recorded"] += 1
+            else:
+                report["verified"] += 1
+                if path in stored:
+                    stored[path].verified_at = now
+        db.commit()
+
+    def _scrub_referenced(self, db: Session, pool: ThreadPoolExecutor, state: Dict):
+        while True:
+            query = db.query(TestResult.image_path).distinct()
+            if state["cursor"] is not None:
+                query = query.filter(TestResult.image_path > state["cursor"])
+            paths = [p for (p,) in query.order_by(TestResult.image_path).limit(self.batch_size)]
+            if not paths:
+                return
+            self._check_batch(db, pool, paths, state["report"])
+            state["cursor"] = paths[-1]
+            self._save_state(state)
+
+    # Phase two: orphans
+
+    def _roots(self) -> List[str]:
+        """Directories scanned in parallel: top-level clinic directories and the cas fan-out."""
+        roots = []
+        for entry in os.scandir(self.storage.base_path):
+            if entry.name.startswith(".") or entry.name == PACK_DIR or not entry.is_dir(follow_symlinks=False):
+                continue
+            if entry.name == CAS_DIR:
+                roots.extend(e.path for e in os.scandir(entry.path) if e.is_dir(follow_symlinks=False))
+            else:
+                roots.append(entry.path)
+        return sorted(roots)
+
+    def _scan(self, directory: str) -> List[Tuple[str, int]]:
+        """(relative path, size) of every image file below `directory` old enough to judge."""
+        cutoff = time.time() - self.min_orphan_age
+        found = []
+        pending = [directory]
+        while pending:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and entry.name.lower().endswith(IMAGE_SUFFIXES):
+                        stat = entry.stat(follow_symlinks=False)
+                        if stat.st_mtime <= cutoff:
+                            found.append((os.path.relpath(entry.path, self.storage.base_path), stat.st_size))
+        return found
+
+    @staticmethod
+    def _owners(relative_path: str) -> List[str]:
+        """Image paths that would claim a file: itself, or for a pyramid level its possible originals."""
+        path = Path(relative_path)
+        if not is_derivative(path.name):
+            return [relative_path]
+        stem = path.name.rsplit(".", 2)[0]
+        return [str(path.with_name(stem + suffix)) for suffix in IMAGE_SUFFIXES]
+
+    def _find_orphans(self, db: Session, files: List[Tuple[str, int]], report: Dict):
+        for start in range(0, len(files), self.batch_size):
+            batch = files[start:start + self.batch_size]
+            owners = {path: self._owners(path) for path, _ in batch}
+            candidates = sorted({o for claims in owners.values() for o in claims})
+            referenced = {p for (p,) in db.query(TestResult.image_path).filter(TestResult.image_path.in_(candidates))}
+            for path, size in batch:
+                if not referenced.intersection(owners[path]):
+                    report["orphans"].append({"path": path, "size_bytes": size})
+        report["files_scanned"] += len(files)
+
+    def _scrub_orphans(self, db: Session, pool: ThreadPoolExecutor, state: Dict):
+        roots = [r for r in self._roots() if r not in set(state["roots_done"])]
+        for start in range(0, len(roots), self.workers):
+            chunk = roots[start:start + self.workers]
+            for root, files in zip(chunk, pool.map(self._scan, chunk)):
+                self._find_orphans(db, files, state["report"])
+                state["roots_done"].append(root)
+            self._save_state(state)
+
+        if not state.get("pack_done") and (self.storage.base_path / PACK_DIR).exists():
+            blobs = [(f"{PACK_DIR}/{blob_id}", 0) for blob_id in self.storage.pack.ids()]
+            self._find_orphans(db, blobs, state["report"])
+            state["pack_done"] = True
+            self._save_state(state)
+
+    # Entry point
+
+    def run(self, resume: bool = True, check_orphans: bool = True) -> Dict:
+        """
+        Scrub the storage directory.
+
+        Args:
+            resume: Continue from the last checkpoint if an earlier scrub was interrupted
+            check_orphans: Also scan the tree for unreferenced files
+
+        Returns:
+            Report with counts and the missing, corrupt and orphaned images
+        """
+        state = self._load_state() if resume else None
+        if state is None:
+            state = {
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "phase": "referenced",
+                "cursor": None,
+                "roots_done": [],
+                "report": _empty_report(),
+            }
+        else:
+            logging.info(f"Resuming scrub of {self.storage.base_path} from {state['phase']} phase")
+
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="storage-scrub") as pool:
+                if state["phase"] == "referenced":
+                    self._scrub_referenced(db, pool, state)
+                    state["phase"] = "orphans"
+                    self._save_state(state)
+                if check_orphans:
+                    self._scrub_orphans(db, pool, state)
+        finally:
+            db.close()
+
+        self.state_path.unlink(missing_ok=True)
+        report = state["report"]
+        elapsed = time.perf_counter() - started
+        report["started_at"] = state["started_at"]
+        report["elapsed_s"] = round(elapsed, 2)
+        report["mb_per_s"] = round(report["bytes_read"] / (1024 * 1024) / elapsed, 2) if elapsed > 0 else 0.0
+        report["orphan_bytes"] = sum(o["size_bytes"] for o in report["orphans"])
+        logging.info(f"Scrub of {self.storage.base_path}: {report['images_checked']} checked, "
+                     f"{len(report['missing'])} missing, {len(report['corrupt'])} corrupt, "
+                     f"{len(report['orphans'])} orphans")
+        return report
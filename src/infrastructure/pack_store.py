@@ -0,0 +1,414 @@
+"""
+Append-only pack-file store for small images.
+Blobs are appended to large segment files and located through an index of
+blob id -> (segment, offset, length), so the archive costs a handful of inodes
+instead of one per image. Reads go through mmap; deletes only mark blobs dead and
+compaction rewrites segments that are mostly garbage.
+
+Several processes may open the same store (uvicorn workers, the CLI scripts).
+Every operation holds a lock file in the directory, shared for reads and exclusive
+for appends, deletes and compaction, and first catches up with the index records
+other processes have written since.
+"""
+
+import fcntl
+import io
+import logging
+import mmap
+import os
+import shutil
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+PACK_DIR = "pack"
+INDEX_FILE = "index.log"
+LOCK_FILE = ".lock"
+SEGMENT_SUFFIX = ".pack"
+
+# Segment record: magic, id length, data length, then the id and the data
+RECORD_MAGIC = b"PKB1"
+RECORD_HEADER = struct.Struct("<4sHQ")
+# Index log record: op (P=put, D=delete, C=checkpoint), id length, segment, offset, length, then the id
+INDEX_RECORD = struct.Struct("<cHIQQ")
+
+Location = Tuple[int, int, int]  # (segment, offset of data, length)
+
+
+class PackStore:
+    """
+    Segment files plus an append-only index log in one directory.
+
+    The index log is replayed into memory on open and tailed under the lock before
+    each operation; compaction replaces it, which other processes notice by its inode
+    and reload. A blob is durable once its index record is written; data appended to
+    a segment without one (a crash in between) is recovered by scanning the tail of
+    the newest segment before the next append.
+    """
+
+    def __init__(self, directory: Path, segment_size: int = 256 * 1024 * 1024, fsync: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.index: Dict[str, Location] = {}
+        self.live_bytes: Dict[int, int] = {}
+        self._logged_end: Dict[int, int] = {}  # per segment, end of the last blob the index log knows about
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._lock = threading.RLock()
+        self._lock_file = open(self.directory / LOCK_FILE, "a+b")
+        self._lock_depth = 0
+        self._index_inode: Optional[int] = None
+        self._index_position = 0
+        self.active_segment = 0
+        self._index_file = None
+        self._segment_file = None
+
+        with self._lock, self._file_lock(exclusive=True):
+            pass
+
+    # Cross-process locking
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """
+        Hold the directory lock, shared or exclusive, and catch up with other
+        processes' changes. Caller holds self._lock; nested use keeps the outer lock.
+        """
+        if self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        self._lock_depth = 1
+        try:
+            self._refresh(exclusive)
+            yield
+        finally:
+            self._lock_depth = 0
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self, exclusive: bool):
+        """Replay index records written since the last operation and follow the newest segment."""
+        path = self.directory / INDEX_FILE
+        try:
+            inode = path.stat().st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self._index_inode:
+            # First open, or another process compacted and replaced the log
+            self.index.clear()
+            self.live_bytes.clear()
+            self._logged_end.clear()
+            self._index_position = 0
+            self._index_inode = inode
+            if self._index_file is not None:
+                self._index_file.close()
+                self._index_file = None
+        if inode is not None:
+            self._load_index(truncate=exclusive)
+
+        segments = self._segment_numbers()
+        for segment in [s for s in self._maps if s not in segments]:
+            self._maps.pop(segment).close()
+        newest = segments[-1] if segments else 1
+        if newest != self.active_segment or self._segment_file is None:
+            if self._segment_file is not None:
+                self._segment_file.close()
+            self.active_segment = newest
+            self._segment_file = open(self._segment_path(self.active_segment), "ab")
+        if exclusive:
+            self._recover_tail()
+        if self._index_file is None:
+            self._index_file = open(path, "ab")
+            self._index_inode = os.fstat(self._index_file.fileno()).st_ino
+
+    # Files
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f"seg-{segment:06d}{SEGMENT_SUFFIX}"
+
+    def _segment_numbers(self):
+        return sorted(int(p.stem.split("-")[1]) for p in self.directory.glob(f"seg-*{SEGMENT_SUFFIX}"))
+
+    def _load_index(self, truncate: bool):
+        """Apply index records past the last position read. A partial record at the end
+        is a crashed writer's; it is cut off when holding the lock exclusively."""
+        path = self.directory / INDEX_FILE
+        with open(path, "rb") as f:
+            f.seek(self._index_position)
+            data = f.read()
+        position = 0
+        while position + INDEX_RECORD.size <= len(data):
+            op, id_length, segment, offset, length = INDEX_RECORD.unpack_from(data, position)
+            end = position + INDEX_RECORD.size + id_length
+            if end > len(data):
+                break
+            blob_id = data[position + INDEX_RECORD.size:end].decode()
+            self._apply(op, blob_id, (segment, offset, length))
+            position = end
+        self._index_position += position
+        if position < len(data) and truncate:
+            logging.warning(f"Truncating {len(data) - position} bytes of partial index record in {path}")
+            with open(path, "r+b") as f:
+                f.truncate(self._index_position)
+
+    def _apply(self, op: bytes, blob_id: str, location: Location):
+        segment, offset, length = location
+        self._logged_end[segment] = max(self._logged_end.get(segment, 0), offset + length)
+        if op == b"C":
+            return
+        # Live bytes count whole records, so a segment of live blobs has no dead bytes
+        record = RECORD_HEADER.size + len(blob_id.encode())
+        previous = self.index.pop(blob_id, None)
+        if previous is not None:
+            self.live_bytes[previous[0]] -= previous[2] + record
+        if op == b"P":
+            self.index[blob_id] = location
+            self.live_bytes[location[0]] = self.live_bytes.get(location[0], 0) + location[2] + record
+
+    def _recover_tail(self):
+        """Index blobs that reached the newest segment but not the index log. Caller holds the lock exclusively."""
+        path = self._segment_path(self.active_segment)
+        self._segment_file.flush()
+        position = self._logged_end.get(self.active_segment, 0)
+        if path.stat().st_size <= position:
+            return
+        with open(path, "rb") as f:
+            f.seek(position)
+            data = f.read()
+        consumed = 0
+        recovered = []
+        while consumed + RECORD_HEADER.size <= len(data):
+            magic, id_length, length = RECORD_HEADER.unpack_from(data, consumed)
+            start = consumed + RECORD_HEADER.size + id_length
+            if magic != RECORD_MAGIC or start + length > len(data):
+                break
+            blob_id = data[consumed + RECORD_HEADER.size:start].decode()
+            recovered.append((blob_id, (self.active_segment, position + start, length)))
+            consumed = start + length
+        if recovered:
+            with open(self.directory / INDEX_FILE, "ab") as index_file:
+                for blob_id, location in recovered:
+                    index_file.write(self._index_record(b"P", blob_id, location))
+            # Read back through the log, like any other process would
+            self._load_index(truncate=True)
+            logging.info(f"Recovered {len(recovered)} unindexed blobs from {path}")
+        if consumed < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(position + consumed)
+
+    @staticmethod
+    def _index_record(op: bytes, blob_id: str, location: Location) -> bytes:
+        encoded = blob_id.encode()
+        return INDEX_RECORD.pack(op, len(encoded), *location) + encoded
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    # Writes
+
+    def _roll_segment(self, incoming: int):
+        end = self._segment_end()
+        if end > 0 and end + incoming > self.segment_size:
+            self._seal_active_segment()
+
+    def _segment_end(self) -> int:
+        """Position the active segment at its end, which other processes may have moved."""
+        self._segment_file.flush()
+        return self._segment_file.seek(0, os.SEEK_END)
+
+    def _log(self, op: bytes, blob_id: str, location: Location):
+        """Append an index record and apply it. Caller holds the lock exclusively."""
+        self._index_file.write(self._index_record(op, blob_id, location))
+        self._sync(self._index_file)
+        self._index_position = self._index_file.tell()
+        self._apply(op, blob_id, location)
+
+    def put(self, blob_id: str, content: bytes) -> Location:
+        """Append a blob. An existing blob with the same id is superseded."""
+        return self.put_stream(blob_id, io.BytesIO(content), len(content))
+
+    def put_stream(self, blob_id: str, stream: BinaryIO, length: int, chunk_size: int = 256 * 1024) -> Location:
+        """Append `length` bytes read from `stream` without holding them in memory."""
+        encoded = blob_id.encode()
+        with self._lock, self._file_lock(exclusive=True):
+            self._roll_segment(RECORD_HEADER.size + len(encoded) + length)
+            f = self._segment_file
+            f.write(RECORD_HEADER.pack(RECORD_MAGIC, len(encoded), length) + encoded)
+            offset = f.tell()
+            remaining = length
+            while remaining:
+                chunk = stream.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f"Stream ended {remaining} bytes early while packing {blob_id}")
+                f.write(chunk)
+                remaining -= len(chunk)
+            self._sync(f)
+
+            location = (self.active_segment, offset, length)
+            self._log(b"P", blob_id, location)
+            return location
+
+    def delete(self, blob_id: str) -> bool:
+        """Mark a blob dead. Its bytes are reclaimed by compaction."""
+        with self._lock, self._file_lock(exclusive=True):
+            location = self.index.get(blob_id)
+            if location is None:
+                return False
+            self._log(b"D", blob_id, location)
+            return True
+
+    # Reads
+
+    def __contains__(self, blob_id: str) -> bool:
+        with self._lock, self._file_lock(exclusive=False):
+            return blob_id in self.index
+
+    def location(self, blob_id: str) -> Optional[Location]:
+        """Where a blob is stored, or None."""
+        with self._lock, self._file_lock(exclusive=False):
+            return self.index.get(blob_id)
+
+    def ids(self) -> Iterator[str]:
+        with self._lock, self._file_lock(exclusive=False):
+            return iter(list(self.index))
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        """Map a segment, remapping if it has grown past the current mapping."""
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            if segment == self.active_segment:
+                self._segment_file.flush()
+            with open(self._segment_path(segment), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def get(self, blob_id: str) -> bytes:
+        """Read a blob. Raises KeyError if it does not exist."""
+        with self._lock, self._file_lock(exclusive=False):
+            segment, offset, length = self.index[blob_id]
+            return self._map(segment, offset + length)[offset:offset + length]
+
+    # Maintenance
+
+    def stats(self) -> dict:
+        with self._lock, self._file_lock(exclusive=False):
+            self._segment_file.flush()
+            segment_bytes = {s: self._segment_path(s).stat().st_size for s in self._segment_numbers()}
+            live = sum(self.live_bytes.get(s, 0) for s in segment_bytes)
+            return {
+                "blobs": len(self.index),
+                "segments": len(segment_bytes),
+                "live_bytes": live,
+                "segment_bytes": sum(segment_bytes.values()),
+            }
+
+    def compact(self, min_dead_ratio: float = 0.5, target_bytes: Optional[int] = None) -> dict:
+        """
+        Rewrite sealed segments whose dead fraction is at least `min_dead_ratio`,
+        most dead bytes first.
+
+        Live blobs are copied to the active segment, the old segment is deleted and the
+        index log is rewritten without superseded or deleted records. A segment whose
+        live bytes do not fit in the free space left on the volume is skipped. The lock
+        is held exclusively one segment at a time, so other processes' uploads only
+        wait for the segment being rewritten.
+
+        Args:
+            min_dead_ratio: Dead fraction a segment needs to be rewritten
+            target_bytes: Stop once this much has been reclaimed. The active segment is
+                sealed first if it holds dead blobs, so they can be reclaimed too.
+
+        Returns:
+            Dictionary with segments compacted and skipped for space, and bytes reclaimed
+        """
+        stats = {"segments_compacted": 0, "segments_skipped": 0, "blobs_moved": 0, "bytes_reclaimed": 0}
+        with self._lock:
+            with self._file_lock(exclusive=True):
+                if target_bytes is not None and self._dead_bytes(self.active_segment) > 0:
+                    self._seal_active_segment()
+                candidates = []
+                for segment in self._segment_numbers():
+                    if segment == self.active_segment:
+                        continue
+                    size = self._segment_path(segment).stat().st_size
+                    dead = self._dead_bytes(segment)
+                    if size and dead and dead / size >= min_dead_ratio:
+                        candidates.append((dead, segment))
+
+            for _, segment in sorted(candidates, reverse=True):
+                if target_bytes is not None and stats["bytes_reclaimed"] >= target_bytes:
+                    break
+                with self._file_lock(exclusive=True):
+                    if segment not in self._segment_numbers():
+                        # Compacted by another process meanwhile
+                        continue
+                    dead = self._dead_bytes(segment)
+                    live = self.live_bytes.get(segment, 0)
+                    if live > shutil.disk_usage(self.directory).free:
+                        stats["segments_skipped"] += 1
+                        continue
+
+                    for blob_id in [b for b, location in self.index.items() if location[0] == segment]:
+                        self.put(blob_id, self.get(blob_id))
+                        stats["blobs_moved"] += 1
+                    mapped = self._maps.pop(segment, None)
+                    if mapped is not None:
+                        mapped.close()
+                    self._segment_path(segment).unlink()
+                    self.live_bytes.pop(segment, None)
+                    self._rewrite_index()
+                    stats["segments_compacted"] += 1
+                    stats["bytes_reclaimed"] += dead
+        logging.info(f"Pack compaction in {self.directory}: {stats}")
+        return stats
+
+    def _dead_bytes(self, segment: int) -> int:
+        if segment == self.active_segment:
+            self._segment_file.flush()
+        path = self._segment_path(segment)
+        size = path.stat().st_size if path.exists() else 0
+        return size - self.live_bytes.get(segment, 0)
+
+    def _seal_active_segment(self):
+        """Start a new segment; other processes follow on their next operation. Caller holds the lock exclusively."""
+        self._segment_file.close()
+        self.active_segment += 1
+        self._segment_file = open(self._segment_path(self.active_segment), "ab")
+
+    def _rewrite_index(self):
+        """Replace the index log with one put record per live blob. Caller holds the lock exclusively."""
+        path = self.directory / INDEX_FILE
+        temp_path = path.with_name(f"{INDEX_FILE}.tmp")
+        with open(temp_path, "wb") as f:
+            for blob_id, location in self.index.items():
+                f.write(self._index_record(b"P", blob_id, location))
+            # Keeps tail recovery from resurrecting deleted blobs at the end of the active segment
+            f.write(self._index_record(b"C", "", (self.active_segment, self._segment_end(), 0)))
+            f.flush()
+            os.fsync(f.fileno())
+        self._index_file.close()
+        os.replace(temp_path, path)
+        self._index_file = open(path, "ab")
+        self._index_inode = os.fstat(self._index_file.fileno()).st_ino
+        self._index_position = self._index_file.tell()
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            self._segment_file.close()
+            self._index_file.close()
+            self._lock_file.close()
@@ -0,0 +1,375 @@
+"""
+Partitioned Parquet snapshots of test results for analysis.
+Results joined with their clinic's name and region are written as one Parquet file
+per month and district, in a Hive-style tree that pandas, pyarrow, DuckDB and
+Spark read directly:
+
+    snapshots/test_results/month=2025-03/district=Gulu/data.parquet
+
+Runs are incremental: only partitions holding results created or updated since
+the previous run, or results of a clinic whose name, district or region changed,
+are rewritten, everything else is left as it is. Writing
+requires pyarrow; listing and downloading existing snapshots does not.
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from src.database.core import SessionLocal
+from src.entities.clinic import Clinic
+from src.entities.test_result import TestResult
+from .file_storage import CHUNK_SIZE
+from .group_commit import fsync_path
+
+SNAPSHOT_DATASET = "test_results"
+SNAPSHOT_STATE_FILE = "_snapshot_state.json"
+SNAPSHOT_FILE = "data.parquet"
+# Hive's name for a NULL partition value (results whose clinic is unknown)
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# Columns stored in each file; month and district are encoded in the path
+SNAPSHOT_COLUMNS = [
+    ("id", TestResult.id),
+    ("patient_id", TestResult.patient_id),
+    ("clinic_id", TestResult.clinic_id),
+    ("health_worker_id", TestResult.health_worker_id),
+    ("test_date", TestResult.test_date),
+    ("result", TestResult.result),
+    ("confidence_score", TestResult.confidence_score),
+    ("model_version", TestResult.model_version),
+    ("processing_time_ms", TestResult.processing_time_ms),
+    ("symptoms", TestResult.symptoms),
+    ("sync_status", TestResult.sync_status),
+    ("synced_at", TestResult.synced_at),
+    ("created_at", TestResult.created_at),
+    ("updated_at", TestResult.updated_at),
+    ("clinic_name", Clinic.name),
+    ("region", Clinic.region),
+]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet snapshots require pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+
+def _schema(pa):
+    uuid_column, timestamp = pa.string(), pa.timestamp("us")
+    types = {
+        "id": uuid_column, "patient_id": uuid_column, "clinic_id": uuid_column, "health_worker_id": uuid_column,
+        "test_date": timestamp, "synced_at": timestamp, "created_at": timestamp, "updated_at": timestamp,
+        "confidence_score": pa.float64(), "processing_time_ms": pa.float64(),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name, _ in SNAPSHOT_COLUMNS])
+
+
+def _snapshot_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _month_bounds(month: str) -> Tuple[datetime, datetime]:
+    start = datetime.strptime(month, "%Y-%m")
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+class _ZipSink:
+    """Write-only file object that collects what zipfile writes so it can be streamed out."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ParquetSnapshots:
+    """
+    Writes and indexes the Parquet snapshot tree under `base_path`.
+
+    The state file records a watermark (the latest created/updated time already
+    written), the clinic values denormalized into the rows and the row count and
+    size of every partition. A run first finds the partitions touched since the
+    watermark or holding results of a clinic edited since the last run (under
+    both its old and new district), then rewrites each of them from the
+    database through a server-side cursor, `batch_rows` at a time, into a temporary
+    file that replaces the old one only once complete. Rewriting whole partitions
+    keeps edited results from appearing twice.
+    """
+
+    def __init__(
+        self,
+        base_path: Optional[str] = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        batch_rows: Optional[int] = None,
+        compression: Optional[str] = None,
+        overlap_seconds: Optional[float] = None,
+    ):
+        self.base_path = Path(base_path or os.getenv("ANALYTICS_SNAPSHOT_DIR", "./snapshots"))
+        self.root = self.base_path / SNAPSHOT_DATASET
+        self.session_factory = session_factory
+        self.batch_rows = batch_rows or int(os.getenv("ANALYTICS_SNAPSHOT_BATCH_ROWS", "50000"))
+        self.compression = compression or os.getenv("ANALYTICS_SNAPSHOT_COMPRESSION", "zstd")
+        if overlap_seconds is None:
+            overlap_seconds = float(os.getenv("ANALYTICS_SNAPSHOT_OVERLAP_SECONDS", "300"))
+        self.overlap = timedelta(seconds=overlap_seconds)
+
+    # State
+
+    def load_state(self) -> dict:
+        try:
+            with open(self.root / SNAPSHOT_STATE_FILE) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"watermark": None, "generated_at": None, "clinics": {}, "partitions": {}}
+
+    def _write_state(self, state: dict):
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / SNAPSHOT_STATE_FILE
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(state, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def partition_key(month: str, district: Optional[str]) -> str:
+        return f"{month}/{NULL_PARTITION if district is None else district}"
+
+    @staticmethod
+    def split_key(key: str) -> Tuple[str, Optional[str]]:
+        month, district = key.split("/", 1)
+        return month, None if district == NULL_PARTITION else district
+
+    def partition_path(self, month: str, district: Optional[str]) -> Path:
+        """Relative path of a partition's file (district values are URI-encoded, as Hive does)."""
+        district_dir = NULL_PARTITION if district is None else quote(district, safe="")
+        return Path(SNAPSHOT_DATASET) / f"month={month}" / f"district={district_dir}" / SNAPSHOT_FILE
+
+    # Listing
+
+    def partitions(
+        self,
+        month_from: Optional[str] = None,
+        month_to: Optional[str] = None,
+        district: Optional[str] = None,
+    ) -> List[Dict]:
+        """Written partitions, optionally filtered, ordered by month and district."""
+        selected = []
+        for key, info in sorted(self.load_state()["partitions"].items()):
+            month, district_value = self.split_key(key)
+            if month_from and month < month_from or month_to and month > month_to:
+                continue
+            if district and district_value != district:
+                continue
+            selected.append({"month": month, "district": district_value, **info})
+        return selected
+
+    def archive(self, partitions: List[Dict]) -> Iterator[bytes]:
+        """
+        Stream a ZIP of the given partitions' files, keeping their Hive-style paths
+        so the extracted directory reads as one dataset. Parquet is already
+        compressed, so files are stored as they are, chunk by chunk.
+        """
+        sink = _ZipSink()
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+            for partition in partitions:
+                path = self.base_path / partition["path"]
+                with open(path, "rb") as source, zf.open(
+                    partition["path"], "w", force_zip64=path.stat().st_size >= zipfile.ZIP64_LIMIT
+                ) as target:
+                    while chunk := source.read(CHUNK_SIZE):
+                        target.write(chunk)
+                        yield sink.drain()
+        yield sink.drain()
+
+    # Writing
+
+    def _changed_partitions(self, db: Session, watermark: Optional[datetime]) -> Tuple[set, Optional[datetime]]:
+        """(month, district) of every result changed at or after the watermark, and the new watermark."""
+        changed_at = func.coalesce(TestResult.updated_at, TestResult.created_at)
+        statement = select(TestResult.test_date, Clinic.district, changed_at).outerjoin(
+            Clinic, Clinic.id == TestResult.clinic_id
+        )
+        if watermark is not None:
+            # Timestamps are taken before commit, so look back far enough to catch
+            # results whose transactions were still open during the previous run
+            statement = statement.where(changed_at > watermark - self.overlap)
+        partitions, latest = set(), watermark
+        for batch in db.execute(statement.execution_options(yield_per=self.batch_rows)).partitions():
+            for test_date, district, changed in batch:
+                partitions.add((test_date.strftime("%Y-%m"), district))
+                if changed is not None and (latest is None or changed > latest):
+                    latest = changed
+        return partitions, latest
+
+    def _changed_clinic_partitions(self, db: Session, previous: Dict[str, list]) -> Tuple[set, Dict[str, list]]:
+        """
+        (month, district) partitions holding results of clinics added, removed or
+        edited since `previous` was recorded, and the current clinic values.
+        Clinics have no change time, so their denormalized values are compared instead.
+        """
+        current = {
+            str(clinic_id): [name, district, region]
+            for clinic_id, name, district, region in db.execute(
+                select(Clinic.id, Clinic.name, Clinic.district, Clinic.region)
+            )
+        }
+        districts: Dict[str, set] = {}
+        for clinic_id in previous.keys() | current.keys():
+            before, after = previous.get(clinic_id), current.get(clinic_id)
+            if before != after:
+                # A clinic that does not exist (yet) leaves its results in the NULL partition
+                districts[clinic_id] = {before[1] if before else None, after[1] if after else None}
+        partitions = set()
+        if not districts:
+            return partitions, current
+
+        statement = select(TestResult.clinic_id, TestResult.test_date).where(
+            TestResult.clinic_id.in_([uuid.UUID(clinic_id) for clinic_id in districts])
+        )
+        for batch in db.execute(statement.execution_options(yield_per=self.batch_rows)).partitions():
+            for clinic_id, test_date in batch:
+                month = test_date.strftime("%Y-%m")
+                partitions.update((month, district) for district in districts[str(clinic_id)])
+        return partitions, current
+
+    def _partition_rows(self, db: Session, month: str, district: Optional[str]) -> Iterator[list]:
+        start, end = _month_bounds(month)
+        statement = (
+            select(*(column for _, column in SNAPSHOT_COLUMNS))
+            .outerjoin(Clinic, Clinic.id == TestResult.clinic_id)
+            .where(
+                and_(
+                    TestResult.test_date >= start,
+                    TestResult.test_date < end,
+                    Clinic.district.is_(None) if district is None else Clinic.district == district,
+                )
+            )
+            .order_by(TestResult.test_date, TestResult.id)
+            .execution_options(yield_per=self.batch_rows)
+        )
+        yield from db.execute(statement).partitions()
+
+    def _write_partition(self, db: Session, month: str, district: Optional[str]) -> Optional[Dict]:
+        """Rewrite one partition. Returns its index entry, or None if it no longer has rows."""
+        pa, pq = _require_pyarrow()
+        schema = _schema(pa)
+        path = self.base_path / self.partition_path(month, district)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        rows = 0
+        try:
+            writer = pq.ParquetWriter(str(temp_path), schema, compression=self.compression)
+            try:
+                for batch in self._partition_rows(db, month, district):
+                    columns = {
+                        name: [_snapshot_value(row[i]) for row in batch] for i, (name, _) in enumerate(SNAPSHOT_COLUMNS)
+                    }
+                    writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+                    rows += len(batch)
+            finally:
+                writer.close()
+            if rows == 0:
+                temp_path.unlink()
+                path.unlink(missing_ok=True)
+                return None
+            fsync_path(temp_path)
+            os.replace(temp_path, path)
+            fsync_path(path.parent)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        return {
+            "path": str(self.partition_path(month, district)),
+            "rows": rows,
+            "bytes": path.stat().st_size,
+            "written_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def run(self, full: bool = False) -> Dict:
+        """
+        Bring the snapshot up to date.
+
+        Args:
+            full: Rewrite every partition instead of only those changed since the last run
+
+        Returns:
+            Dictionary with the partitions written and removed, rows written and elapsed time
+        """
+        _require_pyarrow()
+        started = time.monotonic()
+        state = self.load_state()
+        watermark = None if full or not state["watermark"] else datetime.fromisoformat(state["watermark"])
+        stats = {"partitions_written": 0, "partitions_removed": 0, "rows_written": 0}
+
+        db = self.session_factory()
+        try:
+            changed, latest = self._changed_partitions(db, watermark)
+            clinic_changes, clinics = self._changed_clinic_partitions(db, state.get("clinics", {}))
+            changed |= clinic_changes
+            if full:
+                # Partitions with no rows left are dropped below
+                changed |= {self.split_key(key) for key in state["partitions"]}
+            for month, district in sorted(changed, key=lambda p: (p[0], p[1] or "")):
+                entry = self._write_partition(db, month, district)
+                key = self.partition_key(month, district)
+                if entry is None:
+                    if state["partitions"].pop(key, None) is not None:
+                        stats["partitions_removed"] += 1
+                    continue
+                state["partitions"][key] = entry
+                stats["partitions_written"] += 1
+                stats["rows_written"] += entry["rows"]
+        finally:
+            db.close()
+
+        # The watermark only advances once every changed partition is written
+        state["watermark"] = latest.isoformat() if latest is not None else None
+        state["clinics"] = clinics
+        state["generated_at"] = datetime.now().isoformat(timespec="seconds")
+        self._write_state(state)
+        stats["partitions"] = len(state["partitions"])
+        stats["elapsed_s"] = round(time.monotonic() - started, 2)
+        logging.info(f"Parquet snapshot updated: {stats}")
+        return stats
+
+
+_parquet_snapshots = None
+
+def get_parquet_snapshots() -> ParquetSnapshots:
+    """Get or create the singleton snapshot store in ANALYTICS_SNAPSHOT_DIR."""
+    global _parquet_snapshots
+    if _parquet_snapshots is None:
+        _parquet_snapshots = ParquetSnapshots()
+    return _parquet_snapshots
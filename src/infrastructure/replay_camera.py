@@ -0,0 +1,207 @@
+"""
+Replay camera device for load testing.
+Plays a directory of recorded smear images, or a video file, through the subset of
+the Picamera2 interface that CameraService uses, so the capture pipeline can be
+driven at production-like rates on hardware without a camera.
+"""
+
+import logging
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+# Image format written for a capture_file() suffix, as Picamera2 picks it
+FILE_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG"}
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mkv", ".mov", ".h264"}
+# Decoded frames kept per camera, so the lores and main streams of one frame decode once
+DECODED_FRAME_CACHE = 16
+
+
+def rgb_to_yuv420(rgb: np.ndarray) -> np.ndarray:
+    """Convert an HxWx3 RGB array to a planar YUV420 array (height*3/2 x width)."""
+    height, width = rgb.shape[:2]
+    rgb = rgb.astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    y = 0.299 * r + 0.587 * g + 0.114 * b
+    u = (b - y) * 0.564 + 128.0
+    v = (r - y) * 0.713 + 128.0
+    u = u[::2, ::2].reshape(-1, width)
+    v = v[::2, ::2].reshape(-1, width)
+    return np.clip(np.concatenate([y, u, v]), 0, 255).astype(np.uint8)
+
+
+class ReplayCamera:
+    """
+    Stand-in for Picamera2 that replays recorded frames.
+
+    Frames are released at `fps` like a free-running sensor, and every still capture
+    additionally takes `latency_ms`, the time a real still capture spends on mode
+    switching and encoding.
+    """
+
+    def __init__(self, source: str, fps: float = 30.0, latency_ms: float = 0.0, loop: bool = True):
+        self.source = Path(source)
+        self.fps = fps
+        self.latency_ms = latency_ms
+        self.loop = loop
+        self.started = False
+        self.controls = {}
+        self._main_size: Optional[Tuple[int, int]] = None
+        self._lores_size: Optional[Tuple[int, int]] = None
+        self._index = 0
+        self._next_frame_time = 0.0
+        self._lock = threading.Lock()
+        self._frames: "OrderedDict[Tuple[int, Optional[Tuple[int, int]]], np.ndarray]" = OrderedDict()
+        self._file_sizes: Dict[int, Tuple[int, int]] = {}
+
+        self._files: List[Path] = []
+        self._video = None
+        if self.source.is_dir():
+            self._files = sorted(p for p in self.source.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+            if not self._files:
+                raise ValueError(f"No images found in replay directory {self.source}")
+            self.frame_count = len(self._files)
+        elif self.source.suffix.lower() in VIDEO_EXTENSIONS:
+            import cv2
+
+            self._video = cv2.VideoCapture(str(self.source))
+            if not self._video.isOpened():
+                raise ValueError(f"Could not open replay video {self.source}")
+            self.frame_count = int(self._video.get(cv2.CAP_PROP_FRAME_COUNT))
+        else:
+            raise ValueError(f"Replay source must be an image directory or video file: {self.source}")
+
+        logging.info(f"Replay camera using {self.frame_count} frames from {self.source} "
+                     f"at {self.fps} fps, {self.latency_ms}ms capture latency")
+
+    # Configuration (mirrors Picamera2)
+
+    def create_still_configuration(self, main=None, lores=None, **kwargs) -> dict:
+        return {"main": main or {}, "lores": lores}
+
+    def create_video_configuration(self, main=None, lores=None, **kwargs) -> dict:
+        return {"main": main or {}, "lores": lores}
+
+    def configure(self, config: dict):
+        self._main_size = tuple(config["main"].get("size")) if config["main"].get("size") else None
+        self._lores_size = tuple(config["lores"]["size"]) if config.get("lores") else None
+
+    def set_controls(self, controls: dict):
+        self.controls.update(controls)
+
+    def start(self):
+        self.started = True
+        self._next_frame_time = time.monotonic()
+
+    def stop(self):
+        self.started = False
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._frames.clear()
+            self._file_sizes.clear()
+            if self._video is not None:
+                self._video.release()
+
+    # Frame access
+
+    def _advance(self) -> int:
+        """Wait for the next frame slot at the replay frame rate and return its index."""
+        with self._lock:
+            now = time.monotonic()
+            if self.fps > 0:
+                if now < self._next_frame_time:
+                    time.sleep(self._next_frame_time - now)
+                self._next_frame_time = max(now, self._next_frame_time) + 1.0 / self.fps
+            index = self._index
+            self._index += 1
+            if self._index >= self.frame_count:
+                if not self.loop:
+                    raise EOFError("Replay source exhausted")
+                self._index = 0
+            return index
+
+    def _decode(self, index: int, size: Optional[Tuple[int, int]]) -> np.ndarray:
+        """Decode frame `index` to RGB, resized to `size` if given. Safe to call from any thread."""
+        from PIL import Image
+
+        key = (index, size)
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                return frame
+            if self._video is not None:
+                import cv2
+
+                # Seek and read share the capture's position
+                self._video.set(cv2.CAP_PROP_POS_FRAMES, index)
+                ok, bgr = self._video.read()
+                if not ok:
+                    raise EOFError(f"Could not read frame {index} from {self.source}")
+
+        if self._video is not None:
+            image = Image.fromarray(bgr[..., ::-1])
+        else:
+            image = Image.open(self._files[index]).convert("RGB")
+        if size is not None and image.size != size:
+            image = image.resize(size, Image.BILINEAR)
+        frame = np.asarray(image)
+
+        with self._lock:
+            self._frames[key] = frame
+            self._frames.move_to_end(key)
+            while len(self._frames) > DECODED_FRAME_CACHE:
+                self._frames.popitem(last=False)
+        return frame
+
+    def _file_size(self, index: int) -> Tuple[int, int]:
+        from PIL import Image
+
+        size = self._file_sizes.get(index)
+        if size is None:
+            with Image.open(self._files[index]) as image:
+                size = image.size
+            self._file_sizes[index] = size
+        return size
+
+    def capture_metadata(self) -> dict:
+        index = self._advance()
+        return {"FrameIndex": index, "SensorTimestamp": time.monotonic_ns()}
+
+    def capture_array(self, name: str = "main") -> np.ndarray:
+        index = self._advance()
+        if name == "lores":
+            return rgb_to_yuv420(self._decode(index, self._lores_size))
+        # Picamera2's RGB888 arrays are laid out as BGR
+        return self._decode(index, self._main_size)[..., ::-1]
+
+    def capture_file(self, output_path: str):
+        started = time.monotonic()
+        index = self._advance()
+        file_format = FILE_FORMATS.get(Path(output_path).suffix.lower(), "JPEG")
+        if (
+            self._video is None
+            and FILE_FORMATS[self._files[index].suffix.lower()] == file_format
+            and self._main_size in (None, self._file_size(index))
+        ):
+            # Recorded image already matches the configured size and format: hand it over untouched
+            shutil.copyfile(self._files[index], output_path)
+        else:
+            from PIL import Image
+
+            image = Image.fromarray(self._decode(index, self._main_size))
+            if file_format == "JPEG":
+                image.save(output_path, file_format, quality=95)
+            else:
+                image.save(output_path, file_format)
+        remaining = self.latency_ms / 1000.0 - (time.monotonic() - started)
+        if remaining > 0:
+            time.sleep(remaining)
@@ -0,0 +1,224 @@
+"""
+Disk-pressure retention engine.
+Watches free space on the storage volume and, once usage crosses a high watermark,
+evicts local copies of original images until usage is back under a low watermark.
+Only images the central server already has are eligible, and positives are kept.
+"""
+
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from src.database.core import SessionLocal
+from src.entities.evicted_image import EvictedImage
+from src.entities.test_result import TestResult, TestStatus, SyncStatus
+from .file_storage import FileStorageService, get_storage_service
+
+# Eviction order: negatives before inconclusives, each oldest first. Positives are never evicted.
+EVICTION_ORDER = (TestStatus.Negative, TestStatus.Inconclusive)
+
+
+class RetentionEngine:
+    """
+    Evicts synced, non-positive originals when the storage volume fills up.
+
+    Usage is measured as the used fraction of the filesystem holding the storage
+    directory (the same volume as SQLite on a Pi). Eviction starts at
+    `high_watermark` and stops once usage would be at or below `low_watermark`.
+    Pyramid levels are kept, and each eviction is recorded in EvictedImage so the
+    image endpoint can redirect to the central copy.
+
+    With the pack layout every check also compacts the pack store, so deleted
+    blobs are reclaimed without a separate job. `evict=False` keeps just that.
+    """
+
+    def __init__(
+        self,
+        storage: Optional[FileStorageService] = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        high_watermark: Optional[float] = None,
+        low_watermark: Optional[float] = None,
+        interval: Optional[float] = None,
+        batch_size: int = 100,
+        evict: bool = True,
+    ):
+        self.storage = storage or get_storage_service()
+        self.session_factory = session_factory
+        self.high_watermark = high_watermark or float(os.getenv("STORAGE_RETENTION_HIGH_WATERMARK", "0.90"))
+        self.low_watermark = low_watermark or float(os.getenv("STORAGE_RETENTION_LOW_WATERMARK", "0.80"))
+        if not 0 < self.low_watermark < self.high_watermark <= 1:
+            raise ValueError("Retention watermarks must satisfy 0 < low < high <= 1")
+        self.interval = interval or float(os.getenv("STORAGE_RETENTION_INTERVAL_SECONDS", "300"))
+        self.batch_size = batch_size
+        self.evict = evict
+        self.compact_min_dead_ratio = float(os.getenv("STORAGE_PACK_COMPACT_MIN_DEAD_RATIO", "0.5"))
+        self.last_run: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def disk_usage(self) -> float:
+        """Used fraction of the storage volume."""
+        usage = shutil.disk_usage(self.storage.base_path)
+        return usage.used / usage.total
+
+    def _is_protected(self, db: Session, image_path: str) -> bool:
+        """Whether any result sharing this image is unsynced or positive."""
+        return db.query(TestResult.id).filter(
+            TestResult.image_path == image_path,
+            or_(TestResult.sync_status != SyncStatus.Synced, TestResult.result == TestStatus.Positive),
+        ).first() is not None
+
+    def _candidates(self, db: Session, status: TestStatus):
+        """Yield (image_path, test_date, id) of evictable results, oldest first, in keyset pages."""
+        last = None
+        while True:
+            query = db.query(TestResult.image_path, TestResult.test_date, TestResult.id).filter(
+                TestResult.sync_status == SyncStatus.Synced,
+                TestResult.result == status,
+                ~TestResult.image_path.in_(select(EvictedImage.image_path)),
+            )
+            if last is not None:
+                query = query.filter(or_(
+                    TestResult.test_date > last[1],
+                    and_(TestResult.test_date == last[1], TestResult.id > last[2]),
+                ))
+            page = query.order_by(TestResult.test_date, TestResult.id).limit(self.batch_size).all()
+            if not page:
+                return
+            yield from page
+            last = page[-1]
+
+    def run_once(self, db: Optional[Session] = None) -> Dict:
+        """
+        Check usage and evict images if it is above the high watermark.
+
+        Returns:
+            Dictionary with usage before/after, images evicted and bytes freed
+        """
+        usage = shutil.disk_usage(self.storage.base_path)
+        stats = {
+            "usage_before": round(usage.used / usage.total, 4),
+            "triggered": self.evict and usage.used / usage.total >= self.high_watermark,
+            "evicted": 0,
+            "bytes_freed": 0,
+            "skipped_protected": 0,
+        }
+        if stats["triggered"]:
+            own_session = db is None
+            db = db or self.session_factory()
+            try:
+                if self.storage.layout == "pack":
+                    self._evict_packed(db, stats)
+                else:
+                    to_free = usage.used - int(usage.total * self.low_watermark)
+                    stats["bytes_freed"] = self._evict(db, to_free, stats, set())
+            finally:
+                if own_session:
+                    db.close()
+            logging.warning(f"Disk usage {stats['usage_before']:.0%} above high watermark: evicted "
+                            f"{stats['evicted']} images, freed {stats['bytes_freed'] / (1024 * 1024):.1f} MB")
+        elif self.storage.layout == "pack":
+            stats["compaction"] = self.storage.compact_pack(self.compact_min_dead_ratio)
+
+        stats["usage_after"] = round(self.disk_usage(), 4)
+        stats["checked_at"] = datetime.now(timezone.utc).isoformat()
+        self.last_run = stats
+        return stats
+
+    def _evict(self, db: Session, to_free: int, stats: Dict, seen: set) -> int:
+        """Evict candidates until `to_free` bytes are released. Returns the bytes released."""
+        released = 0
+        for status in EVICTION_ORDER:
+            for image_path, _, _ in self._candidates(db, status):
+                if released >= to_free:
+                    return released
+                if image_path in seen:
+                    continue
+                seen.add(image_path)
+                if self._is_protected(db, image_path):
+                    stats["skipped_protected"] += 1
+                    continue
+
+                # End the read transaction so the re-check under the blob lock sees
+                # results committed by uploads that deduplicated onto this image since
+                db.commit()
+                size = self.storage.evict_original(image_path, lambda: self._is_protected(db, image_path))
+                if size == 0:
+                    continue
+                # Recorded after the file is gone, so a failure here leaves a plain 404 rather than a redirect
+                db.add(EvictedImage(image_path=image_path, size_bytes=size))
+                db.commit()
+                stats["evicted"] += 1
+                released += size
+        return released
+
+    def _evict_packed(self, db: Session, stats: Dict):
+        """
+        Evict from the pack store in rounds. Evicting only marks blobs dead, so each
+        round compacts the most-dead segments regardless of their dead ratio and
+        re-measures the volume; bytes_freed is the space actually returned. Stops
+        once usage is under the low watermark, or when a round's compaction frees
+        nothing (e.g. no room left to copy live blobs), so originals are not evicted
+        for space that cannot be reclaimed.
+        """
+        seen = set()
+        start = shutil.disk_usage(self.storage.base_path)
+        stats["compaction"] = {"segments_compacted": 0, "segments_skipped": 0, "blobs_moved": 0, "bytes_reclaimed": 0}
+        while True:
+            usage = shutil.disk_usage(self.storage.base_path)
+            to_free = usage.used - int(usage.total * self.low_watermark)
+            if to_free <= 0:
+                break
+            released = self._evict(db, to_free, stats, seen)
+            compaction = self.storage.compact_pack(min_dead_ratio=0, target_bytes=to_free)
+            for key, value in compaction.items():
+                stats["compaction"][key] += value
+            if compaction["bytes_reclaimed"] == 0 or released == 0:
+                break
+        stats["bytes_freed"] = max(0, start.used - shutil.disk_usage(self.storage.base_path).used)
+
+    # Background loop
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Retention check failed: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="storage-retention", daemon=True)
+            self._thread.start()
+            logging.info(f"Retention engine watching {self.storage.base_path} "
+                         f"({self.low_watermark:.0%}-{self.high_watermark:.0%} usage)")
+
+    def stop(self):
+        self._stop.set()
+
+
+# Singleton instance
+_retention_engine = None
+
+def start_retention_engine() -> Optional[RetentionEngine]:
+    """
+    Start the background retention engine if STORAGE_RETENTION is enabled (it is
+    off by default, since it deletes originals) and the backend keeps originals
+    locally. The pack layout always gets one, for compaction.
+    """
+    global _retention_engine
+    storage = get_storage_service()
+    evict = storage.evicts_originals and os.getenv("STORAGE_RETENTION", "false").lower() in ("1", "true", "yes")
+    if not evict and storage.layout != "pack":
+        return None
+    if _retention_engine is None:
+        _retention_engine = RetentionEngine(storage, evict=evict)
+        _retention_engine.start()
+    return _retention_engine
@@ -0,0 +1,215 @@
+"""
+S3-compatible object storage backend (AWS S3, MinIO, ...).
+Selected with STORAGE_BACKEND=s3. Images are content-addressed objects keyed like
+the local "cas" layout, so TestResult.image_path values are interchangeable with a
+local content-addressed archive. Requires boto3.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Tuple, Union
+
+from .file_storage import (
+    CHUNK_SIZE,
+    PYRAMID_LEVELS,
+    FileStorageService,
+    StagedUpload,
+    sniff_extension,
+)
+
+MB = 1024 * 1024
+CONTENT_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+
+class S3StorageService(FileStorageService):
+    """
+    FileStorageService storing images in an S3 bucket.
+
+    One client is shared by all requests; its connection pool (S3_MAX_POOL_CONNECTIONS)
+    is sized to cover the multipart upload threads. Files above
+    S3_MULTIPART_THRESHOLD_MB are uploaded as parallel multipart uploads, and originals
+    are served as a stream of chunks rather than read into memory. The local base path
+    only holds staged uploads and the storage statistics sidecar.
+
+    Credentials come from the standard AWS environment variables or config files.
+    """
+
+    evicts_originals = False
+
+    def __init__(
+        self,
+        bucket: Optional[str] = None,
+        endpoint_url: Optional[str] = None,
+        prefix: Optional[str] = None,
+        base_path: str = "./uploads",
+        client=None,
+    ):
+        super().__init__(base_path, layout="cas")
+        self.bucket = bucket or os.getenv("S3_BUCKET", "introspect-images")
+        self.prefix = prefix if prefix is not None else os.getenv("S3_PREFIX", "")
+        concurrency = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+        self.client = client or self._make_client(endpoint_url, concurrency)
+        self.transfer_config = self._make_transfer_config(concurrency)
+        logging.info(f"S3 storage using bucket {self.bucket} at {endpoint_url or os.getenv('S3_ENDPOINT_URL') or 'AWS'}")
+
+    @staticmethod
+    def _make_client(endpoint_url: Optional[str], concurrency: int):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+
+        return boto3.session.Session().client(
+            "s3",
+            endpoint_url=endpoint_url or os.getenv("S3_ENDPOINT_URL") or None,
+            region_name=os.getenv("S3_REGION") or None,
+            config=Config(
+                max_pool_connections=int(os.getenv("S3_MAX_POOL_CONNECTIONS", str(concurrency * 2))),
+                retries={"max_attempts": 5, "mode": "standard"},
+            ),
+        )
+
+    @staticmethod
+    def _make_transfer_config(concurrency: int):
+        try:
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            # Only reachable with an injected client; it applies its own transfer defaults
+            return None
+
+        return TransferConfig(
+            multipart_threshold=int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8")) * MB,
+            multipart_chunksize=int(os.getenv("S3_MULTIPART_CHUNK_MB", "8")) * MB,
+            max_concurrency=concurrency,
+            use_threads=True,
+        )
+
+    def _key(self, relative_path: str) -> str:
+        return f"{self.prefix}{relative_path}"
+
+    @staticmethod
+    def _is_missing(error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def _head(self, relative_path: str) -> Optional[dict]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(relative_path))
+        except self.client.exceptions.ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+    def _get(self, relative_path: str) -> dict:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(relative_path))
+        except self.client.exceptions.ClientError as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(relative_path)
+            raise
+
+    def _extra_args(self, relative_path: str) -> dict:
+        return {"ContentType": CONTENT_TYPES.get(Path(relative_path).suffix.lower(), "application/octet-stream")}
+
+    # Storage interface
+
+    def stores_files(self, relative_path: str) -> bool:
+        return False
+
+    def image_exists(self, relative_path: str) -> bool:
+        return self._head(relative_path) is not None
+
+    def read_image(self, relative_path: str) -> bytes:
+        return self._get(relative_path)["Body"].read()
+
+    def stream_image(self, relative_path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Stream an object in chunks.
+
+        Raises:
+            FileNotFoundError: Immediately, if the object does not exist
+        """
+        body = self._get(relative_path)["Body"]
+
+        def chunks():
+            try:
+                yield from body.iter_chunks(chunk_size)
+            finally:
+                body.close()
+
+        return chunks()
+
+    def _write_blob(self, relative_path: str, content: bytes):
+        self.client.upload_fileobj(
+            io.BytesIO(content), self.bucket, self._key(relative_path),
+            ExtraArgs=self._extra_args(relative_path), Config=self.transfer_config,
+        )
+        self.stats.record(relative_path, len(content), time.time())
+
+    def save_image(self, file_content: bytes, original_filename: str, clinic_id: str) -> Tuple[str, str]:
+        digest = hashlib.sha256(file_content).hexdigest()
+        extension = sniff_extension(file_content[:16], Path(original_filename).suffix)
+        relative_path = self.blob_relative_path(digest, extension)
+        if self.image_exists(relative_path):
+            logging.info(f"Image deduplicated: s3://{self.bucket}/{self._key(relative_path)}")
+        else:
+            self._write_blob(relative_path, file_content)
+            logging.info(f"Image uploaded: s3://{self.bucket}/{self._key(relative_path)}")
+            self.schedule_pyramid(relative_path)
+        return relative_path, Path(relative_path).name
+
+    def _commit_staged(self, staged: StagedUpload, clinic_id: str, keep_staged: bool) -> Tuple[str, str]:
+        relative_path = self.blob_relative_path(staged.sha256, staged.extension)
+        if self.image_exists(relative_path):
+            logging.info(f"Image deduplicated: s3://{self.bucket}/{self._key(relative_path)}")
+        else:
+            # upload_file switches to a parallel multipart upload above the threshold
+            self.client.upload_file(
+                str(staged.path), self.bucket, self._key(relative_path),
+                ExtraArgs=self._extra_args(relative_path), Config=self.transfer_config,
+            )
+            self.stats.record(relative_path, staged.size, time.time())
+            logging.info(f"Image uploaded: s3://{self.bucket}/{self._key(relative_path)}")
+            self.schedule_pyramid(relative_path)
+        if not keep_staged:
+            staged.path.unlink(missing_ok=True)
+            staged.committed = True
+        return relative_path, Path(relative_path).name
+
+    def resolve_image(self, relative_path: str, level: str = "original") -> Tuple[Union[bytes, Iterator[bytes]], str]:
+        """Originals are streamed from the bucket; pyramid levels are small and read whole."""
+        if level == "original":
+            return self.stream_image(relative_path), self.content_hash(relative_path)
+        return super().resolve_image(relative_path, level)
+
+    def delete_image(self, relative_path: str) -> bool:
+        try:
+            keys = [relative_path] + [self.pyramid_path(relative_path, level) for level in PYRAMID_LEVELS]
+            heads = {key: self._head(key) for key in keys}
+            if heads[relative_path] is None:
+                logging.warning(f"Image not found for deletion: s3://{self.bucket}/{self._key(relative_path)}")
+                return False
+            present = [key for key, head in heads.items() if head is not None]
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": self._key(key)} for key in present], "Quiet": True},
+            )
+            for key in present:
+                self.stats.record(key, heads[key]["ContentLength"], heads[key]["LastModified"].timestamp(), files=-1)
+            logging.info(f"Image deleted: s3://{self.bucket}/{self._key(relative_path)}")
+            return True
+        except Exception as e:
+            logging.error(f"Error deleting image: {str(e)}")
+            return False
+
+    def evict_original(self, relative_path: str, is_protected: Optional[Callable[[], bool]] = None) -> int:
+        # Object storage is the central copy; there is nothing local to evict
+        return 0
+
+    def start_stats_reconciler(self, interval: Optional[float] = None, workers: Optional[int] = None):
+        # Counters are maintained on upload and delete; the local disk scan does not apply
+        pass
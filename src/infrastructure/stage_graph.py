@@ -0,0 +1,111 @@
+"""
+Small DAG executor for multi-stage use cases.
+Stages declare the stages they depend on; each starts as soon as its dependencies
+have finished, so independent stages (storing an image while the model runs on
+it) overlap. Per-stage wall time is recorded, and on failure the stages that did
+complete are compensated in reverse order.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class _Skipped(Exception):
+    """A stage did not run because an earlier stage failed."""
+
+
+class _Stage:
+    def __init__(self, name: str, func: Callable, depends_on: Tuple[str, ...], compensate: Optional[Callable]):
+        self.name = name
+        self.func = func
+        self.depends_on = depends_on
+        self.compensate = compensate
+
+
+class StageGraph:
+    """
+    Stages run with a dict of their dependencies' results.
+
+    Synchronous stage functions run in a worker thread, coroutine functions on the
+    event loop. Dependencies must be added before the stages that use them, which
+    keeps the graph acyclic. Once a stage fails no further stages start, stages
+    already running are allowed to finish, every completed stage's `compensate`
+    is called with its result (latest first), and the original error is raised.
+    """
+
+    def __init__(self):
+        self._stages: Dict[str, _Stage] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable[[Dict[str, Any]], Any],
+        depends_on: Iterable[str] = (),
+        compensate: Optional[Callable[[Any], Any]] = None,
+    ) -> "StageGraph":
+        depends_on = tuple(depends_on)
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        for dependency in depends_on:
+            if dependency not in self._stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+        self._stages[name] = _Stage(name, func, depends_on, compensate)
+        return self
+
+    @staticmethod
+    async def _call(func: Callable, argument: Any) -> Any:
+        if asyncio.iscoroutinefunction(func):
+            return await func(argument)
+        return await asyncio.to_thread(func, argument)
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run every stage.
+
+        Returns:
+            Dictionary of stage name -> result
+        """
+        self.timings = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        completed: List[Tuple[_Stage, Any]] = []
+        errors: List[BaseException] = []
+
+        async def execute(stage: _Stage) -> Any:
+            inputs = {}
+            for dependency in stage.depends_on:
+                try:
+                    inputs[dependency] = await tasks[dependency]
+                except BaseException:
+                    raise _Skipped(stage.name)
+            if errors:
+                raise _Skipped(stage.name)
+            started = time.perf_counter()
+            try:
+                result = await self._call(stage.func, inputs)
+            except BaseException as e:
+                errors.append(e)
+                raise
+            finally:
+                self.timings[f"{stage.name}_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            completed.append((stage, result))
+            return result
+
+        for stage in self._stages.values():
+            tasks[stage.name] = asyncio.ensure_future(execute(stage))
+        await asyncio.wait(tasks.values())
+        for task in tasks.values():
+            task.exception()  # mark failures as retrieved; they are handled below
+
+        if errors:
+            for stage, result in reversed(completed):
+                if stage.compensate is None:
+                    continue
+                try:
+                    await self._call(stage.compensate, result)
+                except Exception as e:
+                    logging.error(f"Compensating stage {stage.name} failed: {str(e)}")
+            raise errors[0]
+        return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,266 @@
+"""
+Incrementally maintained storage statistics.
+Per-clinic, per-month file and byte counters are updated as files are written and
+removed and persisted to a small JSON sidecar, so reading them never walks the
+archive. A periodic reconciliation rebuilds them from disk with a parallel scan.
+
+Every process writing to the same directory (uvicorn workers, the CLI scripts) keeps
+its own pending deltas and merges them into the sidecar under a file lock, at most
+every STORAGE_STATS_FLUSH_SECONDS and at exit, so no writer's updates are lost.
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .pack_store import PACK_DIR
+
+STATS_FILE = ".stats.json"
+STATS_LOCK_FILE = ".stats.lock"
+CAS_DIR = "cas"
+
+Counters = Dict[str, Dict[str, Dict[str, int]]]
+
+# Indexes with deltas to flush when the process exits
+_open_indexes: "weakref.WeakSet[StorageStatsIndex]" = weakref.WeakSet()
+
+
+def stats_key(relative_path: str, mtime: float) -> Tuple[str, str]:
+    """
+    Bucket a stored file by (clinic, month).
+
+    Dated-layout files carry both in their path (<clinic>/<YYYY-MM>/...). Content-addressed
+    blobs are shared between clinics, so they are counted under "cas" by modification month.
+    """
+    parts = Path(relative_path).parts
+    if len(parts) >= 3 and parts[0] != CAS_DIR:
+        return parts[0], parts[1]
+    return parts[0] if len(parts) > 1 else "", datetime.fromtimestamp(mtime).strftime("%Y-%m")
+
+
+def _merge(target: Counters, source: Counters):
+    for clinic, months in source.items():
+        for month, counts in months.items():
+            bucket = target.setdefault(clinic, {}).setdefault(month, {"files": 0, "bytes": 0})
+            bucket["files"] += counts["files"]
+            bucket["bytes"] += counts["bytes"]
+
+
+def _prune(counters: Counters):
+    """Drop buckets whose files have all been removed."""
+    for clinic in list(counters):
+        for month in [m for m, counts in counters[clinic].items() if counts["files"] <= 0]:
+            del counters[clinic][month]
+        if not counters[clinic]:
+            del counters[clinic]
+
+
+class StorageStatsIndex:
+    """
+    File and byte counters for a storage directory, persisted next to the images.
+
+    record() only updates memory; the deltas are merged into the sidecar by flush(),
+    which runs on a timer (flush_interval seconds after the first unflushed change),
+    before every snapshot and at exit.
+    """
+
+    def __init__(self, base_path: Path, flush_interval: Optional[float] = None):
+        self.base_path = Path(base_path)
+        self.sidecar_path = self.base_path / STATS_FILE
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else float(os.getenv("STORAGE_STATS_FLUSH_SECONDS", "5"))
+        )
+        self.counters: Counters = {}
+        self.last_reconciled: Optional[str] = None
+        self._pending: Counters = {}
+        self._flush_timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self._load()
+        _open_indexes.add(self)
+
+    def _load(self):
+        try:
+            with open(self.sidecar_path) as f:
+                data = json.load(f)
+            self.counters = data.get("counters", {})
+            self.last_reconciled = data.get("last_reconciled")
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            logging.warning(f"Ignoring unreadable storage stats at {self.sidecar_path}: {str(e)}")
+
+    def _persist(self):
+        """Write the sidecar atomically. Caller holds the sidecar lock."""
+        temp_path = self.sidecar_path.with_name(f"{STATS_FILE}.{uuid.uuid4().hex}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump({"counters": self.counters, "last_reconciled": self.last_reconciled}, f)
+        os.replace(temp_path, self.sidecar_path)
+
+    def _sidecar_lock(self):
+        """Open and exclusively lock the sidecar lock file; closing it releases the lock."""
+        lock_file = open(self.base_path / STATS_LOCK_FILE, "a+b")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    @property
+    def needs_reconcile(self) -> bool:
+        return self.last_reconciled is None
+
+    def record(self, relative_path: str, size: int, mtime: float, files: int = 1):
+        """Add (files=1) or remove (files=-1) a file of `size` bytes."""
+        clinic, month = stats_key(relative_path, mtime)
+        with self._lock:
+            bucket = self._pending.setdefault(clinic, {}).setdefault(month, {"files": 0, "bytes": 0})
+            bucket["files"] += files
+            bucket["bytes"] += size * files
+            if self._flush_timer is None and self.flush_interval > 0:
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        """Merge this process's pending deltas into the sidecar and reload it. No-op when nothing is pending."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        if not pending:
+            return
+        try:
+            lock_file = self._sidecar_lock()
+        except OSError as e:
+            logging.warning(f"Could not flush storage stats to {self.sidecar_path}: {str(e)}")
+            return
+        try:
+            with self._lock:
+                self._load()
+                _merge(self.counters, pending)
+                _prune(self.counters)
+                self._persist()
+        finally:
+            lock_file.close()
+
+    def snapshot(self) -> dict:
+        """Totals and per-clinic/per-month breakdown, including other processes' flushed changes."""
+        self.flush()
+        with self._lock:
+            # The sidecar is replaced atomically, so reading it needs no lock file
+            self._load()
+            by_clinic = {clinic: {month: dict(counts) for month, counts in months.items()}
+                         for clinic, months in self.counters.items()}
+            last_reconciled = self.last_reconciled
+        total_files = sum(c["files"] for months in by_clinic.values() for c in months.values())
+        total_size = sum(c["bytes"] for months in by_clinic.values() for c in months.values())
+        return {
+            "total_files": total_files,
+            "total_size_bytes": total_size,
+            "by_clinic": by_clinic,
+            "last_reconciled": last_reconciled,
+        }
+
+    def _scan(self, directory: str) -> Counters:
+        """Count every regular file below `directory`, skipping hidden and temporary files."""
+        counters: Counters = {}
+        pending = [directory]
+        while pending:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        relative_path = os.path.relpath(entry.path, self.base_path)
+                        clinic, month = stats_key(relative_path, stat.st_mtime)
+                        bucket = counters.setdefault(clinic, {}).setdefault(month, {"files": 0, "bytes": 0})
+                        bucket["files"] += 1
+                        bucket["bytes"] += stat.st_size
+        return counters
+
+    def reconcile(self, workers: int = 4) -> dict:
+        """
+        Rebuild the counters from disk.
+
+        Top-level directories (and the fan-out directories of the content-addressed
+        store) are scanned in parallel with os.scandir.
+
+        Returns:
+            The new snapshot
+        """
+        if not self.base_path.exists():
+            roots: List[str] = []
+        else:
+            roots = []
+            for entry in os.scandir(self.base_path):
+                # Pack segments are accounted for by the pack store itself
+                if entry.name.startswith(".") or entry.name == PACK_DIR or not entry.is_dir(follow_symlinks=False):
+                    continue
+                if entry.name == CAS_DIR:
+                    roots.extend(e.path for e in os.scandir(entry.path) if e.is_dir(follow_symlinks=False))
+                else:
+                    roots.append(entry.path)
+
+        counters: Counters = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="storage-stats") as pool:
+            for partial in pool.map(self._scan, roots):
+                _merge(counters, partial)
+
+        # Writes made while scanning may be counted twice or missed; the next pass corrects them
+        self.base_path.mkdir(parents=True, exist_ok=True)
+        lock_file = self._sidecar_lock()
+        try:
+            with self._lock:
+                self._pending = {}
+                drift = self.counters != counters
+                self.counters = counters
+                self.last_reconciled = datetime.now().isoformat()
+                self._persist()
+        finally:
+            lock_file.close()
+        if drift:
+            logging.info(f"Storage stats reconciled with drift for {self.base_path}")
+        return self.snapshot()
+
+
+@atexit.register
+def _flush_open_indexes():
+    for index in list(_open_indexes):
+        index.flush()
+
+
+class StatsReconciler:
+    """Daemon thread reconciling a stats index every `interval` seconds."""
+
+    def __init__(self, index: StorageStatsIndex, interval: float, workers: int = 4):
+        self.index = index
+        self.interval = interval
+        self.workers = workers
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="storage-stats-reconciler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        if not self.index.needs_reconcile:
+            self._stop.wait(self.interval)
+        while not self._stop.is_set():
+            try:
+                self.index.reconcile(self.workers)
+            except Exception as e:
+                logging.error(f"Storage stats reconciliation failed: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,161 @@
+"""
+Synthetic blood smear generator for the mock camera.
+Renders cell-like blobs and optional parasite-like inclusions with NumPy, and keeps
+a pool of pre-encoded frames so mock captures cost no more than a file write.
+"""
+
+import io
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+BACKGROUND_COLOR = np.array([238, 222, 224], dtype=np.float32)
+CELL_COLOR = np.array([214, 150, 160], dtype=np.float32)
+PARASITE_COLOR = np.array([92, 40, 120], dtype=np.float32)
+
+
+def _smooth_noise(rng: np.random.Generator, height: int, width: int, cell: int = 64) -> np.ndarray:
+    """Low-frequency noise in [-1, 1] made by bilinearly upsampling a coarse random grid."""
+    from PIL import Image
+
+    coarse = rng.uniform(-1.0, 1.0, size=(height // cell + 2, width // cell + 2)).astype(np.float32)
+    return np.asarray(Image.fromarray(coarse).resize((width, height), Image.BILINEAR))
+
+
+def synthesize_smear(
+    resolution: Tuple[int, int],
+    seed: Optional[int] = None,
+    cell_count: Optional[int] = None,
+    parasitemia: float = 0.0,
+) -> Tuple[np.ndarray, Dict]:
+    """
+    Render a synthetic thin blood smear.
+
+    Cells are drawn as anti-aliased discs with a pale centre (central pallor). A
+    `parasitemia` fraction of cells receives a dark ring-form inclusion.
+
+    Args:
+        resolution: (width, height) of the image
+        seed: Seed for deterministic output
+        cell_count: Number of cells; defaults to a density typical of a 100x field
+        parasitemia: Fraction of cells carrying a parasite-like inclusion (0-1)
+
+    Returns:
+        Tuple of (HxWx3 RGB uint8 array, ground truth dict)
+    """
+    width, height = resolution
+    rng = np.random.default_rng(seed)
+    scale = min(width, height) / 1296.0
+    if cell_count is None:
+        cell_count = int(width * height / 11000)
+
+    # Background with gentle illumination falloff and staining variation
+    yy, xx = np.ogrid[0:height, 0:width]
+    vignette = 1.0 - 0.12 * (((xx - width / 2) / width) ** 2 + ((yy - height / 2) / height) ** 2)
+    shading = (vignette + 0.03 * _smooth_noise(rng, height, width)).astype(np.float32)
+    image = BACKGROUND_COLOR * shading[..., np.newaxis]
+
+    centers_x = rng.uniform(0, width, cell_count)
+    centers_y = rng.uniform(0, height, cell_count)
+    radii = rng.uniform(22, 34, cell_count) * scale
+    tints = rng.uniform(0.95, 1.05, (cell_count, 3)).astype(np.float32)
+    infected = rng.random(cell_count) < parasitemia
+
+    # Distance template shared by every cell; each cell only touches its bounding box
+    max_radius = int(np.ceil(radii.max())) + 2 if cell_count else 1
+    offsets = np.arange(-max_radius, max_radius + 1, dtype=np.float32)
+    template = np.sqrt(offsets[np.newaxis, :] ** 2 + offsets[:, np.newaxis] ** 2)
+
+    parasites: List[Dict] = []
+    for i in range(cell_count):
+        cx, cy, radius = int(centers_x[i]), int(centers_y[i]), radii[i]
+        x0, x1 = max(cx - max_radius, 0), min(cx + max_radius + 1, width)
+        y0, y1 = max(cy - max_radius, 0), min(cy + max_radius + 1, height)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        dist = template[
+            y0 - cy + max_radius:y1 - cy + max_radius,
+            x0 - cx + max_radius:x1 - cx + max_radius,
+        ]
+        alpha = np.clip(radius - dist + 0.5, 0.0, 1.0)[..., np.newaxis]
+        pallor = 1.0 + 0.18 * np.clip(1.0 - dist / (0.55 * radius), 0.0, 1.0)[..., np.newaxis]
+        color = CELL_COLOR * tints[i] * pallor
+
+        if infected[i]:
+            angle = rng.uniform(0, 2 * np.pi)
+            offset = rng.uniform(0.1, 0.4) * radius
+            px, py = cx + offset * np.cos(angle), cy + offset * np.sin(angle)
+            ring_radius = rng.uniform(0.22, 0.32) * radius
+            pdist = np.sqrt(
+                (np.arange(x0, x1, dtype=np.float32)[np.newaxis, :] - px) ** 2
+                + (np.arange(y0, y1, dtype=np.float32)[:, np.newaxis] - py) ** 2
+            )
+            ring = np.clip(1.0 - np.abs(pdist - ring_radius) / (0.09 * radius), 0.0, 1.0)[..., np.newaxis]
+            color = color * (1.0 - ring) + PARASITE_COLOR * ring
+            parasites.append({"x": float(px), "y": float(py), "radius": float(ring_radius)})
+
+        region = image[y0:y1, x0:x1]
+        image[y0:y1, x0:x1] = region * (1.0 - alpha) + color * alpha
+
+    image += rng.normal(0.0, 2.0, size=(height, width, 1)).astype(np.float32)
+    frame = np.clip(image, 0, 255).astype(np.uint8)
+
+    ground_truth = {
+        "cell_count": int(cell_count),
+        "infected_cells": int(infected.sum()),
+        "parasitemia": float(infected.sum() / cell_count) if cell_count else 0.0,
+        "parasites": parasites,
+        "seed": seed,
+    }
+    return frame, ground_truth
+
+
+class MockFramePool:
+    """
+    Pool of pre-rendered, pre-encoded synthetic smear frames served round-robin.
+    Building the pool is a one-off cost; each capture afterwards is a byte copy.
+    """
+
+    def __init__(
+        self,
+        resolution: Tuple[int, int],
+        size: int = 8,
+        seed: int = 0,
+        parasitemia: float = 0.02,
+        quality: int = 90,
+    ):
+        from PIL import Image
+
+        self.resolution = resolution
+        self.frames: List[bytes] = []
+        self.ground_truth: List[Dict] = []
+        for i in range(size):
+            frame, truth = synthesize_smear(resolution, seed=seed + i, parasitemia=parasitemia)
+            buffer = io.BytesIO()
+            Image.fromarray(frame).save(buffer, "JPEG", quality=quality)
+            self.frames.append(buffer.getvalue())
+            self.ground_truth.append(truth)
+        self._index = 0
+        self._lock = threading.Lock()
+        logging.info(f"Built mock frame pool: {size} frames at {resolution}")
+
+    def next_frame(self) -> Tuple[bytes, Dict]:
+        """Return the next encoded frame and its ground truth."""
+        with self._lock:
+            index = self._index
+            self._index = (self._index + 1) % len(self.frames)
+        return self.frames[index], self.ground_truth[index]
+
+
+@lru_cache(maxsize=4)
+def get_mock_frame_pool(
+    resolution: Tuple[int, int],
+    size: int = 8,
+    seed: int = 0,
+    parasitemia: float = 0.02,
+) -> MockFramePool:
+    """Get a shared frame pool for the given configuration."""
+    return MockFramePool(resolution, size=size, seed=seed, parasitemia=parasitemia)
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,18 +8,35 @@ from .entities.user import User
 from .entities.clinic import Clinic
 from .entities.patient import Patient
 from .entities.test_result import TestResult
+from .entities.evicted_image import EvictedImage
+from .entities.image_checksum import ImageChecksum
 from .api import register_routes
 from .app_logging import configure_logging, LogLevels
 from .frontend.controller import router as frontend_router
+from .upload_limit import UploadSizeLimitMiddleware
+from .pagination import NEXT_CURSOR_HEADER
+from .infrastructure.file_storage import BATCH_MAX_UPLOAD_BYTES, MAX_UPLOAD_BYTES
+from .infrastructure.retention import start_retention_engine
 from pathlib import Path
 
 
 configure_logging(LogLevels.info)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep the SD card from filling up by evicting synced images under disk pressure
+    retention = start_retention_engine()
+    yield
+    if retention is not None:
+        retention.stop()
+
+
 app = FastAPI(
     title="introspect - Malaria Diagnostics API",
     description="API for malaria diagnostics and surveillance using AI-powered blood smear analysis",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS for Flutter frontend
@@ -28,10 +46,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
+)
+
+# Abort oversized uploads while they stream in (allowance covers the other form fields)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/api/results/analyze": MAX_UPLOAD_BYTES + 64 * 1024,
+        "/api/results/analyze-batch": BATCH_MAX_UPLOAD_BYTES,
+    },
 )
 
 """ Create tables if they don't exist (for SQLite and local development) """
 Base.metadata.create_all(bind=engine)
+# create_all skips tables that already exist; add indexes introduced since they were created
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
 
 # Mount static files
 static_dir = Path(__file__).parent / "frontend" / "static"
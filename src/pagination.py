@@ -0,0 +1,147 @@
+"""
+Keyset pagination and column projection for the list endpoints.
+
+Pages are ordered by a unique key (a sort column plus the primary key). The next
+page starts after the last row of the previous one, which the client passes back as
+an opaque cursor, so every page costs one index range scan however deep the client
+pages, and rows inserted meanwhile never shift a page. `fields` selects only the
+requested columns instead of whole rows.
+"""
+
+import base64
+import json
+import os
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Type
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+from .exceptions import InvalidPageRequestError
+
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+MAX_PAGE_SIZE = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# (column, descending)
+SortKey = Tuple[Any, bool]
+
+
+class Page(list):
+    """One page of rows (ORM objects, or dicts when fields were projected) and the cursor of the next."""
+
+    def __init__(self, rows: Iterable = (), next_cursor: Optional[str] = None, fields: Optional[List[str]] = None):
+        super().__init__(rows)
+        self.next_cursor = next_cursor
+        self.fields = fields
+
+
+def parse_fields(fields: Optional[str], response_model: Type[BaseModel]) -> Optional[List[str]]:
+    """Split a comma-separated `fields` parameter, rejecting names the response does not have."""
+    if not fields:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in response_model.model_fields]
+    if unknown or not names:
+        raise InvalidPageRequestError(f"Unknown fields: {', '.join(unknown) or fields}")
+    return names
+
+
+def page_size(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """
+    Page size for a list request. Without `limit` or `cursor` the endpoint returns
+    every row, as it did before pagination; following a cursor defaults to
+    DEFAULT_PAGE_SIZE.
+    """
+    if limit is not None:
+        return limit
+    return DEFAULT_PAGE_SIZE if cursor else None
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(jsonable_encoder(list(values)), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence[SortKey]) -> List[Any]:
+    """Decode a cursor back into values of the key columns' Python types."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("wrong number of values")
+        return [_convert(value, column) for value, (column, _) in zip(values, keys)]
+    except (ValueError, TypeError) as e:
+        raise InvalidPageRequestError(f"Invalid cursor: {e}")
+
+
+def _convert(value: Any, column) -> Any:
+    python_type = column.type.python_type
+    if value is None or isinstance(value, python_type):
+        return value
+    if hasattr(python_type, "fromisoformat"):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def _after(keys: Sequence[SortKey], values: Sequence[Any]):
+    """WHERE clause selecting the rows that sort after `values`."""
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        equal = [keys[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column < values[i] if descending else column > values[i]))
+    return or_(*clauses)
+
+
+def keyset_page(
+    query: Query,
+    keys: Sequence[SortKey],
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+) -> Page:
+    """
+    Fetch one page of a query.
+
+    Args:
+        query: Filtered query over a single entity
+        keys: Sort columns, ending with a unique one (the primary key)
+        cursor: Cursor returned with the previous page, None for the first page
+        limit: Page size; None returns all remaining rows
+        fields: Columns to select; None loads whole rows
+
+    Returns:
+        Page of rows with the cursor of the next page (None on the last page)
+    """
+    if cursor:
+        query = query.filter(_after(keys, decode_cursor(cursor, keys)))
+    query = query.order_by(*(column.desc() if descending else column.asc() for column, descending in keys))
+
+    entity = query.column_descriptions[0]["entity"]
+    key_names = [column.key for column, _ in keys]
+    if fields is not None:
+        # Select the requested columns plus the keys the cursor is built from
+        columns = list(dict.fromkeys(fields + key_names))
+        query = query.with_entities(*(getattr(entity, name) for name in columns))
+
+    rows = query.limit(limit + 1).all() if limit is not None else query.all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], name) for name in key_names])
+
+    if fields is not None:
+        rows = [{name: getattr(row, name) for name in fields} for row in rows]
+    return Page(rows, next_cursor, fields)
+
+
+def page_response(page: Page, response):
+    """
+    Return value for a paginated route: the page itself, or a JSONResponse of the
+    projected rows (which the full response model would reject). Either way the
+    next cursor goes in the X-Next-Cursor header.
+    """
+    headers = {NEXT_CURSOR_HEADER: page.next_cursor} if page.next_cursor else {}
+    if page.fields is not None:
+        return JSONResponse(jsonable_encoder(list(page)), headers=headers)
+    response.headers.update(headers)
+    return page
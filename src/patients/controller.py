@@ -1,4 +1,4 @@
-from fastapi import APIRouter, status, Query
+from fastapi import APIRouter, status, Query, Response
 from typing import List, Optional
 from uuid import UUID
 
@@ -6,6 +6,7 @@ from ..database.core import DbSession
 from . import models
 from . import service
 from ..auth.service import CurrentUser
+from ..pagination import MAX_PAGE_SIZE, page_response, page_size, parse_fields
 
 router = APIRouter(
     prefix="/api/patients",
@@ -20,12 +21,22 @@ def create_patient(db: DbSession, patient: models.PatientCreate, current_user: C
 
 @router.get("/", response_model=List[models.PatientResponse])
 def get_patients(
+    response: Response,
     db: DbSession, 
     current_user: CurrentUser,
-    clinic_id: Optional[UUID] = Query(None, description="Filter by clinic ID")
+    clinic_id: Optional[UUID] = Query(None, description="Filter by clinic ID"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size (all rows without limit or cursor)"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
 ):
-    """Get all patients, optionally filtered by clinic."""
-    return service.get_patients(current_user, db, clinic_id)
+    """
+    Get patients ordered by last name, optionally filtered by clinic. With `limit` or
+    `cursor` one page is returned and the next page's cursor goes in the X-Next-Cursor header.
+    """
+    fields = parse_fields(fields, models.PatientResponse)
+    limit = page_size(limit, cursor)
+    page = service.get_patients(current_user, db, clinic_id, cursor, limit, fields)
+    return page_response(page, response)
 
 
 @router.get("/search", response_model=List[models.PatientResponse])
@@ -6,6 +6,7 @@ from . import models
 from src.entities.patient import Patient
 from src.auth.models import TokenData
 from src.exceptions import PatientNotFoundError, PatientCreationError
+from src.pagination import Page, keyset_page
 import logging
 
 def create_patient(current_user: TokenData, db: Session, patient: models.PatientCreate) -> Patient:
@@ -23,14 +24,21 @@ def create_patient(current_user: TokenData, db: Session, patient: models.Patient
         raise PatientCreationError(str(e))
 
 
-def get_patients(current_user: TokenData, db: Session, clinic_id: Optional[UUID] = None) -> List[Patient]:
-    """Get all patients, optionally filtered by clinic."""
+def get_patients(
+    current_user: TokenData,
+    db: Session,
+    clinic_id: Optional[UUID] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+) -> Page:
+    """Get a page of patients ordered by last name, optionally filtered by clinic."""
     query = db.query(Patient)
     
     if clinic_id:
         query = query.filter(Patient.clinic_id == clinic_id)
     
-    patients = query.all()
+    patients = keyset_page(query, [(Patient.last_name, False), (Patient.id, False)], cursor, limit, fields)
     logging.info(f"Retrieved {len(patients)} patients for user {current_user.get_uuid()}")
     return patients
 
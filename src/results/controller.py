@@ -1,4 +1,10 @@
-from fastapi import APIRouter, status, Query, UploadFile, File, Form
+from fastapi import APIRouter, status, Query, UploadFile, File, Form, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from itertools import chain
+import json
+from datetime import date, datetime
+from pathlib import Path
 from typing import List, Optional
 from uuid import UUID
 
@@ -7,6 +13,12 @@ from . import models
 from . import service
 from ..auth.service import CurrentUser
 from src.entities.test_result import TestStatus
+from src.infrastructure.file_storage import sniff_extension
+from ..pagination import MAX_PAGE_SIZE, page_response, page_size, parse_fields
+
+# Stored images never change under a given ETag, so clients may keep them for a year
+IMAGE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+IMAGE_MEDIA_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
 
 router = APIRouter(
     prefix="/api/results",
@@ -34,7 +46,7 @@ async def analyze_image(
         symptoms=symptoms
     )
 
-    test_result, confidence, processing_time = service.create_test_result_from_analysis(
+    test_result, confidence, processing_time = await service.create_test_result_from_analysis(
         current_user, db, analysis_request, image
     )
 
@@ -47,8 +59,30 @@ async def analyze_image(
     )
 
 
+@router.post("/analyze-batch", response_class=StreamingResponse)
+def analyze_batch(
+    db: DbSession,
+    current_user: CurrentUser,
+    clinic_id: UUID = Form(...),
+    images: Optional[List[UploadFile]] = File(None, description="Blood smear images"),
+    archive: Optional[UploadFile] = File(None, description="ZIP of images with a manifest.csv"),
+    patient_id: Optional[List[UUID]] = Form(None, description="One per image, or one for all images"),
+    notes: Optional[str] = Form(None),
+    symptoms: Optional[str] = Form(None),
+):
+    """
+    Upload and analyze many blood smear images in one request: either several
+    `images` with matching `patient_id` fields, or one ZIP `archive` whose
+    manifest.csv maps filenames to patient IDs.
+    Streams one NDJSON line per image as it is analyzed, then a summary line.
+    """
+    items = service.get_batch_items(images, archive, patient_id, notes, symptoms)
+    lines = (json.dumps(event) + "\n" for event in service.analyze_batch(current_user, db, clinic_id, items))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
 @router.post("/capture-and-analyze", response_model=models.AnalysisResponse, status_code=status.HTTP_201_CREATED)
-async def capture_and_analyze(
+def capture_and_analyze(
     db: DbSession,
     current_user: CurrentUser,
     patient_id: UUID = Form(...),
@@ -59,6 +93,7 @@ async def capture_and_analyze(
     """
     Capture an image from Raspberry Pi camera and analyze for malaria detection.
     This endpoint is designed for edge AI deployment on Raspberry Pi 5 with Camera Module 3.
+    Runs in the threadpool so concurrent requests can overlap in the capture pipeline.
     Returns the analysis result and creates a test result record.
     """
     analysis_request = models.AnalysisRequest(
@@ -83,20 +118,120 @@ async def capture_and_analyze(
 
 @router.get("/", response_model=List[models.TestResultResponse])
 def get_test_results(
+    response: Response,
     db: DbSession,
     current_user: CurrentUser,
     clinic_id: Optional[UUID] = Query(None, description="Filter by clinic ID"),
     patient_id: Optional[UUID] = Query(None, description="Filter by patient ID"),
     status: Optional[TestStatus] = Query(None, description="Filter by test status"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size (all rows without limit or cursor)"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
 ):
-    """Get test results with optional filters."""
-    return service.get_test_results(current_user, db, clinic_id, patient_id, status)
+    """
+    Get test results, newest first, with optional filters. With `limit` or `cursor`
+    one page is returned and the next page's cursor goes in the X-Next-Cursor header.
+    """
+    fields = parse_fields(fields, models.TestResultResponse)
+    limit = page_size(limit, cursor)
+    page = service.get_test_results(current_user, db, clinic_id, patient_id, status, cursor, limit, fields)
+    return page_response(page, response)
 
 
 @router.get("/pending-sync", response_model=List[models.TestResultResponse])
-def get_pending_sync_results(db: DbSession, current_user: CurrentUser):
-    """Get all test results pending synchronization."""
-    return service.get_pending_sync_results(current_user, db)
+def get_pending_sync_results(
+    response: Response,
+    db: DbSession,
+    current_user: CurrentUser,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size (all rows without limit or cursor)"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+):
+    """
+    Get test results pending synchronization, oldest first. With `limit` or `cursor`
+    one page is returned and the next page's cursor goes in the X-Next-Cursor header.
+    """
+    fields = parse_fields(fields, models.TestResultResponse)
+    limit = page_size(limit, cursor)
+    page = service.get_pending_sync_results(current_user, db, cursor, limit, fields)
+    return page_response(page, response)
+
+
+EXPORT_MEDIA_TYPES = {models.ExportFormat.NDJSON: "application/x-ndjson", models.ExportFormat.CSV: "text/csv"}
+
+
+@router.get("/export", response_class=StreamingResponse)
+def export_test_results(
+    db: DbSession,
+    current_user: CurrentUser,
+    format: models.ExportFormat = Query(models.ExportFormat.NDJSON, description="ndjson or csv"),
+    gzip: bool = Query(False, description="Compress the export with gzip"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to export (default: all)"),
+    clinic_id: Optional[UUID] = Query(None, description="Filter by clinic ID"),
+    patient_id: Optional[UUID] = Query(None, description="Filter by patient ID"),
+    status: Optional[TestStatus] = Query(None, description="Filter by test status"),
+    district: Optional[str] = Query(None, description="Filter by clinic district"),
+    date_from: Optional[date] = Query(None, description="First test date to include"),
+    date_to: Optional[date] = Query(None, description="Last test date to include"),
+):
+    """
+    Download every matching test result, oldest first, as NDJSON or CSV.
+    The extract is streamed as it is read from the database, so it can be any size.
+    """
+    fields = parse_fields(fields, models.TestResultResponse)
+    chunks = service.export_test_results(
+        current_user, db, format, gzip, fields, clinic_id, patient_id, status, district, date_from, date_to
+    )
+    filename = f"test-results-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{format.value}"
+    if gzip:
+        filename += ".gz"
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if gzip else EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.put("/bulk", response_model=models.BulkUpdateResponse)
+def bulk_update_test_results(db: DbSession, request: models.BulkUpdateRequest, current_user: CurrentUser):
+    """
+    Update many test results in one transaction, e.g. confirming a list of
+    inconclusive results after microscopy. Returns the outcome for each id.
+    """
+    return service.bulk_update_test_results(current_user, db, request)
+
+
+MONTH_PATTERN = r"^\d{4}-\d{2}$"
+
+
+@router.get("/snapshots", response_model=models.SnapshotIndex)
+def get_snapshot_index(
+    current_user: CurrentUser,
+    month_from: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="First month (YYYY-MM)"),
+    month_to: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="Last month (YYYY-MM)"),
+    district: Optional[str] = Query(None, description="Filter by district"),
+):
+    """List the month/district partitions of the Parquet snapshot of test results."""
+    return service.get_snapshot_index(current_user, month_from, month_to, district)
+
+
+@router.get("/snapshots/download", response_class=StreamingResponse)
+def download_snapshot(
+    current_user: CurrentUser,
+    month_from: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="First month (YYYY-MM)"),
+    month_to: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="Last month (YYYY-MM)"),
+    district: Optional[str] = Query(None, description="Filter by district"),
+):
+    """
+    Download the Parquet snapshot (or some of its partitions) as a ZIP that extracts
+    to a directory pandas, pyarrow or DuckDB read as one partitioned dataset.
+    """
+    chunks = service.stream_snapshot_archive(current_user, month_from, month_to, district)
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="test-results-parquet.zip"'},
+    )
 
 
 @router.get("/{result_id}", response_model=models.TestResultResponse)
@@ -105,6 +240,50 @@ def get_test_result(db: DbSession, result_id: UUID, current_user: CurrentUser):
     return service.get_test_result_by_id(current_user, db, result_id)
 
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+@router.get("/{result_id}/image", response_class=FileResponse)
+async def get_test_result_image(
+    request: Request,
+    db: DbSession,
+    result_id: UUID,
+    current_user: CurrentUser,
+    level: models.ImageLevel = Query(models.ImageLevel.Original, description="Original image or a pyramid level"),
+):
+    """
+    Serve the smear image of a test result, or its preview/thumbnail.
+    The ETag is derived from the image's SHA-256, and byte ranges are supported.
+    """
+    source, digest = await service.get_test_result_image(current_user, db, result_id, level)
+    etag = f'"{digest}"' if level == models.ImageLevel.Original else f'"{digest}-{level.value}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if isinstance(source, bytes):
+        # Packed images have no file of their own to hand to sendfile
+        media_type = IMAGE_MEDIA_TYPES.get(sniff_extension(source[:16]), "application/octet-stream")
+        return Response(content=source, media_type=media_type, headers=headers)
+    if not isinstance(source, Path):
+        # Object storage streams chunks; sniff the type from the first one
+        first = await run_in_threadpool(next, source, b"")
+        media_type = IMAGE_MEDIA_TYPES.get(sniff_extension(first[:16]), "application/octet-stream")
+        return StreamingResponse(chain([first], source), media_type=media_type, headers=headers)
+
+    return FileResponse(
+        source,
+        media_type=IMAGE_MEDIA_TYPES.get(source.suffix.lower(), "application/octet-stream"),
+        headers=headers,
+    )
+
+
 @router.put("/{result_id}", response_model=models.TestResultResponse)
 def update_test_result(
     db: DbSession,
@@ -1,5 +1,6 @@
+import enum
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 from uuid import UUID
 from pydantic import BaseModel, ConfigDict
 from src.entities.test_result import TestStatus, SyncStatus
@@ -20,6 +21,23 @@ class TestResultUpdate(BaseModel):
     notes: Optional[str] = None
     symptoms: Optional[str] = None
 
+class BulkUpdateItem(TestResultUpdate):
+    """Changes to one test result in a bulk update."""
+    id: UUID
+
+class BulkUpdateRequest(BaseModel):
+    updates: List[BulkUpdateItem]
+
+class BulkUpdateOutcome(str, enum.Enum):
+    Updated = "updated"
+    NotFound = "not_found"
+
+class BulkUpdateResponse(BaseModel):
+    """Counts, and the outcome for each requested id."""
+    updated: int
+    not_found: int
+    outcomes: Dict[UUID, BulkUpdateOutcome]
+
 class TestResultResponse(TestResultBase):
     id: UUID
     health_worker_id: UUID
@@ -35,6 +53,31 @@ class TestResultResponse(TestResultBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class ImageLevel(str, enum.Enum):
+    """Resolution of a stored smear image to serve."""
+    Original = "original"
+    Preview = "preview"
+    Thumb = "thumb"
+
+class ExportFormat(str, enum.Enum):
+    """Serialization of a test result export."""
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+class SnapshotPartition(BaseModel):
+    """One month/district file of the Parquet snapshot."""
+    month: str
+    district: Optional[str] = None
+    path: str
+    rows: int
+    bytes: int
+    written_at: datetime
+
+class SnapshotIndex(BaseModel):
+    """Partitions of the Parquet snapshot of test results."""
+    generated_at: Optional[datetime] = None
+    partitions: List[SnapshotPartition]
+
 class AnalysisRequest(BaseModel):
     """Request model for image analysis."""
     patient_id: UUID
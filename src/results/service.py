@@ -1,20 +1,40 @@
+import csv
+import io
+import os
+import posixpath
+import json
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from enum import Enum
 from uuid import UUID
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
 from fastapi import UploadFile
 from . import models
 from src.entities.test_result import TestResult, TestStatus, SyncStatus
+from src.entities.clinic import Clinic
 from src.auth.models import TokenData
+from src.database.core import SessionLocal
 from src.infrastructure.ai_inference import get_inference_service, InferenceResult
-from src.infrastructure.file_storage import get_storage_service
-from src.infrastructure.camera_service import get_camera_service
-from src.exceptions import TestResultNotFoundError, TestResultCreationError
+from src.infrastructure.file_storage import get_storage_service, name_digest
+from src.infrastructure.capture_pipeline import get_capture_pipeline
+from src.infrastructure.stage_graph import StageGraph
+from src.infrastructure.parquet_snapshots import get_parquet_snapshots
+from src.exceptions import TestResultError, TestResultNotFoundError, TestResultCreationError, InvalidImageError
+from src.exceptions import BatchUploadError, BulkUpdateError, CaptureTimeoutError, SnapshotNotFoundError
+from src.pagination import Page, keyset_page
+from src.exceptions import TestResultImageNotFoundError, TestResultImageEvictedError
+from src.entities.evicted_image import EvictedImage
+from src.entities.image_checksum import ImageChecksum
+from src.infrastructure.sync_service import get_sync_service
 import logging
-import tempfile
-import os
 
-def create_test_result_from_analysis(
+async def create_test_result_from_analysis(
     current_user: TokenData,
     db: Session,
     analysis_request: models.AnalysisRequest,
@@ -22,52 +42,40 @@ def create_test_result_from_analysis(
 ) -> tuple[TestResult, float, float]:
     """
     Create a test result by analyzing an uploaded image.
+    The upload is streamed into storage staging in chunks (hashed and size-checked
+    on the way in). The rest runs as a stage graph: validation and inference read
+    the staged file while it is committed to permanent storage, and the database
+    insert waits for both. If any stage fails, a stored image is released again.
     
     Returns:
         Tuple of (test_result, confidence_score, processing_time_ms)
     """
+    storage_service = get_storage_service()
+    staged = None
     try:
         # Get services
         inference_service = get_inference_service()
-        storage_service = get_storage_service()
         
-        # Read file content
-        file_content = image_file.file.read()
+        # Stream the upload into staging, rejecting it as soon as it is too large
+        staged = await storage_service.stage_upload_async(image_file, image_file.filename)
+        staged_path = str(staged.path)
         
-        # Save to temporary file for analysis
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(image_file.filename)[1]) as temp_file:
-            temp_file.write(file_content)
-            temp_path = temp_file.name
+        def validate(_):
+            if not inference_service.validate_image(staged_path):
+                raise InvalidImageError()
         
-        try:
-            # Validate image
-            if not inference_service.validate_image(temp_path):
-                raise ValueError("Invalid image file")
-            
-            # Run AI inference
-            inference_result, confidence, processing_time = inference_service.analyze_image(temp_path)
-            
-            # Map inference result to TestStatus
-            result_mapping = {
-                InferenceResult.POSITIVE: TestStatus.Positive,
-                InferenceResult.NEGATIVE: TestStatus.Negative,
-                InferenceResult.INCONCLUSIVE: TestStatus.Inconclusive,
-            }
-            test_status = result_mapping[inference_result]
-            
-            # Save image to permanent storage
-            image_path, image_filename = storage_service.save_image(
-                file_content,
-                image_file.filename,
-                str(analysis_request.clinic_id)
-            )
-            
-            # Create test result record
+        async def store(_):
+            # The staged file stays put for inference; discard_staged removes it below
+            return await storage_service.commit_staged_async(staged, str(analysis_request.clinic_id), keep_staged=True)
+        
+        def insert(inputs):
+            inference_result, confidence, processing_time = inputs["infer"]
+            image_path, image_filename = inputs["store"]
             new_result = TestResult(
                 patient_id=analysis_request.patient_id,
                 clinic_id=analysis_request.clinic_id,
                 health_worker_id=current_user.get_uuid(),
-                result=test_status,
+                result=RESULT_MAPPING[inference_result],
                 confidence_score=confidence,
                 image_path=image_path,
                 image_filename=image_filename,
@@ -77,108 +85,388 @@ def create_test_result_from_analysis(
                 symptoms=analysis_request.symptoms,
                 sync_status=SyncStatus.Pending,
             )
-            
-            db.add(new_result)
-            db.commit()
-            db.refresh(new_result)
-            
-            logging.info(f"Created test result {new_result.id} with status {test_status.value}")
-            return new_result, confidence, processing_time
-            
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+            if name_digest(image_path) is None:
+                # Content-addressed names carry their own checksum; record the others for the scrubber
+                db.add(ImageChecksum(image_path=image_path, sha256=staged.sha256, size_bytes=staged.size))
+            _insert_result(db, new_result)
+            return new_result
+        
+        graph = StageGraph()
+        graph.add("validate", validate)
+        graph.add("infer", lambda _: inference_service.analyze_image(staged_path), depends_on=["validate"])
+        graph.add("store", store, compensate=lambda stored: storage_service.release_image(db, stored[0], staged))
+        graph.add("insert", insert, depends_on=["infer", "store"])
+        outputs = await graph.run()
+        
+        new_result = outputs["insert"]
+        _, confidence, processing_time = outputs["infer"]
+        logging.info(
+            f"Created test result {new_result.id} with status {new_result.result.value} (stages: {graph.timings})"
+        )
+        return new_result, confidence, processing_time
                 
     except Exception as e:
         logging.error(f"Failed to create test result from analysis. Error: {str(e)}")
         db.rollback()
+        if isinstance(e, TestResultError):
+            raise
         raise TestResultCreationError(str(e))
+    finally:
+        storage_service.discard_staged(staged)
 
 
-def create_test_result_from_camera_capture(
+def _insert_result(db: Session, new_result: TestResult):
+    try:
+        db.add(new_result)
+        db.commit()
+    except Exception:
+        # Leave the session usable for compensating stages
+        db.rollback()
+        raise
+    db.refresh(new_result)
+
+
+RESULT_MAPPING = {
+    InferenceResult.POSITIVE: TestStatus.Positive,
+    InferenceResult.NEGATIVE: TestStatus.Negative,
+    InferenceResult.INCONCLUSIVE: TestStatus.Inconclusive,
+}
+
+
+# Most images accepted by one batch upload
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_MANIFEST = "manifest.csv"
+
+
+class BatchItem:
+    """One image of a batch upload; `open` returns a fresh stream of its bytes."""
+
+    def __init__(
+        self,
+        filename: str,
+        open: Callable[[], BinaryIO],
+        patient_id: str,
+        notes: Optional[str] = None,
+        symptoms: Optional[str] = None,
+    ):
+        self.filename = filename
+        self.open = open
+        self.patient_id = patient_id
+        self.notes = notes
+        self.symptoms = symptoms
+
+
+def get_batch_items(
+    images: Optional[List[UploadFile]],
+    archive: Optional[UploadFile],
+    patient_ids: Optional[List[UUID]],
+    notes: Optional[str] = None,
+    symptoms: Optional[str] = None,
+) -> List[BatchItem]:
+    """List the items of a batch upload, rejecting a malformed batch before any image is processed."""
+    if (archive is None) == (not images):
+        raise BatchUploadError("Send either images or an archive")
+    if archive is not None:
+        return batch_items_from_archive(archive)
+    if not patient_ids:
+        raise BatchUploadError("patient_id is required with images")
+    return batch_items_from_uploads(images, patient_ids, notes, symptoms)
+
+
+def batch_items_from_uploads(
+    images: List[UploadFile],
+    patient_ids: List[UUID],
+    notes: Optional[str] = None,
+    symptoms: Optional[str] = None,
+) -> List[BatchItem]:
+    """
+    Pair uploaded images with patients: one patient ID per image, or a single
+    patient ID for all of them.
+    """
+    if len(patient_ids) == 1:
+        patient_ids = patient_ids * len(images)
+    if len(patient_ids) != len(images):
+        raise BatchUploadError(f"Got {len(images)} images but {len(patient_ids)} patient IDs")
+    _check_batch_size(len(images))
+    return [
+        BatchItem(image.filename, lambda image=image: image.file, str(patient_id), notes, symptoms)
+        for image, patient_id in zip(images, patient_ids)
+    ]
+
+
+def batch_items_from_archive(archive: UploadFile) -> List[BatchItem]:
+    """
+    Read the manifest of a ZIP upload.
+
+    The archive must contain a manifest.csv (at its root or in one top-level folder)
+    with `filename` and `patient_id` columns and optional `notes` and `symptoms`.
+    Filenames are relative to the manifest. Members are only decompressed when their
+    item is processed, straight into staging, so the archive is never unpacked whole.
+    """
+    try:
+        zf = zipfile.ZipFile(archive.file)
+    except zipfile.BadZipFile:
+        raise BatchUploadError("Archive is not a valid ZIP file")
+
+    manifests = sorted(
+        (name for name in zf.namelist() if posixpath.basename(name) == BATCH_MANIFEST),
+        key=lambda name: name.count("/"),
+    )
+    if not manifests:
+        raise BatchUploadError(f"Archive has no {BATCH_MANIFEST}")
+    folder = posixpath.dirname(manifests[0])
+
+    with zf.open(manifests[0]) as f:
+        reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
+        missing = {"filename", "patient_id"} - set(reader.fieldnames or [])
+        if missing:
+            raise BatchUploadError(f"{BATCH_MANIFEST} is missing columns: {', '.join(sorted(missing))}")
+        rows = list(reader)
+    _check_batch_size(len(rows))
+
+    members = set(zf.namelist())
+    items = []
+    for row in rows:
+        filename = (row["filename"] or "").strip()
+        member = posixpath.join(folder, filename) if folder else filename
+        items.append(BatchItem(
+            filename,
+            lambda member=member: _open_member(zf, members, member),
+            (row["patient_id"] or "").strip(),
+            row.get("notes") or None,
+            row.get("symptoms") or None,
+        ))
+    return items
+
+
+def _open_member(zf: zipfile.ZipFile, members: set, member: str) -> BinaryIO:
+    if member not in members:
+        raise BatchUploadError(f"{member} is listed in {BATCH_MANIFEST} but not in the archive")
+    return zf.open(member)
+
+
+def _check_batch_size(count: int):
+    if count == 0:
+        raise BatchUploadError("Batch contains no images")
+    if count > BATCH_MAX_ITEMS:
+        raise BatchUploadError(f"Batch contains {count} images; at most {BATCH_MAX_ITEMS} are accepted")
+
+
+def analyze_batch(
     current_user: TokenData,
     db: Session,
-    analysis_request: models.AnalysisRequest,
-) -> tuple[TestResult, float, float]:
+    clinic_id: UUID,
+    items: List[BatchItem],
+) -> Iterator[Dict]:
     """
-    Create a test result by capturing an image from Raspberry Pi camera and analyzing it.
+    Analyze a batch of uploaded images, yielding a status dict per item as it finishes.
 
-    Returns:
-        Tuple of (test_result, confidence_score, processing_time_ms)
+    Items are processed in chunks of the inference batch size. Each image is streamed
+    into staging and validated; the chunk then goes through the model in one batched
+    call while the staged files are committed to permanent storage alongside, and the
+    chunk's results are inserted with a single commit. A bad image fails only its own
+    item; a failed inference or insert fails its chunk and releases the stored images.
+    Ends with a summary dict.
     """
-    try:
-        # Get services
-        camera_service = get_camera_service()
-        inference_service = get_inference_service()
-        storage_service = get_storage_service()
+    storage_service = get_storage_service()
+    inference_service = get_inference_service()
+    started = time.perf_counter()
+    summary = {"status": "complete", "total": len(items), "created": 0, "failed": 0}
+
+    def failed(index: int, item: BatchItem, error: Exception) -> Dict:
+        summary["failed"] += 1
+        message = error.detail if isinstance(error, TestResultError) else str(error)
+        logging.warning(f"Batch item {index} ({item.filename}) failed: {message}")
+        return {"index": index, "filename": item.filename, "status": "failed", "error": message}
 
-        # Capture image from camera
-        temp_image_path = camera_service.capture_image()
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="batch-store") as store_pool:
+        for start in range(0, len(items), inference_service.batch_size):
+            staged = []  # (index, item, patient UUID, StagedUpload)
+            try:
+                for index, item in enumerate(items[start:start + inference_service.batch_size], start):
+                    upload = None
+                    try:
+                        patient_id = UUID(item.patient_id)
+                        with item.open() as stream:
+                            upload = storage_service.stage_upload(stream, item.filename)
+                        if not inference_service.validate_image(str(upload.path)):
+                            raise InvalidImageError()
+                        staged.append((index, item, patient_id, upload))
+                    except Exception as e:
+                        storage_service.discard_staged(upload)
+                        yield failed(index, item, e)
+                if staged:
+                    yield from _analyze_chunk(
+                        current_user, db, clinic_id, staged, storage_service, inference_service, store_pool,
+                        summary, failed,
+                    )
+            finally:
+                for _, _, _, upload in staged:
+                    storage_service.discard_staged(upload)
 
+    summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    logging.info(f"Batch analysis finished: {summary}")
+    yield summary
+
+
+def _analyze_chunk(current_user, db, clinic_id, staged, storage_service, inference_service, store_pool, summary, failed):
+    """Store, infer and insert one chunk of staged batch items."""
+    # Storage commits overlap with the batched inference call
+    stores = [
+        store_pool.submit(storage_service.commit_staged, upload, str(clinic_id), keep_staged=True)
+        for _, _, _, upload in staged
+    ]
+    try:
+        outcomes = inference_service.analyze_batch([str(upload.path) for _, _, _, upload in staged])
+        error = None
+    except Exception as e:
+        outcomes, error = None, e
+
+    stored = []
+    for (index, item, _, _), store in zip(staged, stores):
         try:
-            # Validate image
-            if not inference_service.validate_image(temp_image_path):
-                raise ValueError("Invalid image captured from camera")
-
-            # Run AI inference
-            inference_result, confidence, processing_time = inference_service.analyze_image(temp_image_path)
-
-            # Map inference result to TestStatus
-            result_mapping = {
-                InferenceResult.POSITIVE: TestStatus.Positive,
-                InferenceResult.NEGATIVE: TestStatus.Negative,
-                InferenceResult.INCONCLUSIVE: TestStatus.Inconclusive,
-            }
-            test_status = result_mapping[inference_result]
-
-            # Read captured image for storage
-            with open(temp_image_path, 'rb') as f:
-                file_content = f.read()
-
-            # Generate filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"camera_capture_{timestamp}.jpg"
-
-            # Save image to permanent storage
-            image_path, image_filename = storage_service.save_image(
-                file_content,
-                filename,
-                str(analysis_request.clinic_id)
-            )
+            stored.append(store.result())
+        except Exception as e:
+            stored.append(None)
+            error = error or e
 
-            # Create test result record
-            new_result = TestResult(
-                patient_id=analysis_request.patient_id,
-                clinic_id=analysis_request.clinic_id,
+    if error is None:
+        new_results = []
+        for (index, item, patient_id, upload), (image_path, image_filename), outcome in zip(staged, stored, outcomes):
+            inference_result, confidence, processing_time = outcome
+            new_results.append(TestResult(
+                patient_id=patient_id,
+                clinic_id=clinic_id,
                 health_worker_id=current_user.get_uuid(),
-                result=test_status,
+                result=RESULT_MAPPING[inference_result],
                 confidence_score=confidence,
                 image_path=image_path,
                 image_filename=image_filename,
                 model_version=inference_service.model_version,
                 processing_time_ms=processing_time,
-                notes=analysis_request.notes,
-                symptoms=analysis_request.symptoms,
+                notes=item.notes,
+                symptoms=item.symptoms,
                 sync_status=SyncStatus.Pending,
-            )
-
-            db.add(new_result)
+            ))
+            if name_digest(image_path) is None:
+                db.add(ImageChecksum(image_path=image_path, sha256=upload.sha256, size_bytes=upload.size))
+        try:
+            db.add_all(new_results)
+            db.flush()
+            # Read what the events need before the commit expires the rows
+            created = [(r.id, r.result.value, r.confidence_score, r.processing_time_ms) for r in new_results]
             db.commit()
-            db.refresh(new_result)
+        except Exception as e:
+            db.rollback()
+            error = e
+
+    if error is not None:
+        for image_path, (_, _, _, upload) in zip(stored, staged):
+            if image_path is not None:
+                storage_service.release_image(db, image_path[0], upload)
+        for index, item, _, _ in staged:
+            yield failed(index, item, error)
+        return
+
+    for (index, item, _, _), (result_id, result, confidence, processing_time) in zip(staged, created):
+        summary["created"] += 1
+        yield {
+            "index": index,
+            "filename": item.filename,
+            "status": "created",
+            "test_result_id": str(result_id),
+            "result": result,
+            "confidence_score": confidence,
+            "processing_time_ms": processing_time,
+        }
+
+
+CAPTURE_TIMEOUT_SECONDS = float(os.getenv("CAPTURE_TIMEOUT_SECONDS", "60"))
+
+
+def create_test_result_from_camera_capture(
+    current_user: TokenData,
+    db: Session,
+    analysis_request: models.AnalysisRequest,
+) -> tuple[TestResult, float, float]:
+    """
+    Create a test result by capturing an image from Raspberry Pi camera and analyzing it.
+    Capture, inference and storage run in the shared capture pipeline, so concurrent
+    requests overlap; the database insert happens here on the request's session.
+    Waits at most CAPTURE_TIMEOUT_SECONDS for the pipeline.
+
+    Returns:
+        Tuple of (test_result, confidence_score, processing_time_ms)
+    """
+    storage_service = get_storage_service()
+    image_path = staged = None
+    try:
+        inference_service = get_inference_service()
+        future = get_capture_pipeline().submit(str(analysis_request.clinic_id))
+        try:
+            outcome = future.result(timeout=CAPTURE_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            # The job may still finish; its image then belongs to nobody
+            future.add_done_callback(_release_abandoned_capture)
+            raise CaptureTimeoutError(CAPTURE_TIMEOUT_SECONDS)
+        image_path, staged = outcome["image_path"], outcome["staged"]
+
+        test_status = RESULT_MAPPING[outcome["inference_result"]]
+        confidence = outcome["confidence"]
+        processing_time = outcome["processing_time_ms"]
+
+        # Create test result record
+        new_result = TestResult(
+            patient_id=analysis_request.patient_id,
+            clinic_id=analysis_request.clinic_id,
+            health_worker_id=current_user.get_uuid(),
+            result=test_status,
+            confidence_score=confidence,
+            image_path=image_path,
+            image_filename=outcome["image_filename"],
+            model_version=inference_service.model_version,
+            processing_time_ms=processing_time,
+            notes=analysis_request.notes,
+            symptoms=analysis_request.symptoms,
+            sync_status=SyncStatus.Pending,
+        )
+        if name_digest(image_path) is None:
+            db.add(ImageChecksum(image_path=image_path, sha256=staged.sha256, size_bytes=staged.size))
 
-            logging.info(f"Created test result {new_result.id} from camera capture with status {test_status.value}")
-            return new_result, confidence, processing_time
+        db.add(new_result)
+        db.commit()
+        db.refresh(new_result)
 
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_image_path):
-                os.unlink(temp_image_path)
+        logging.info(
+            f"Created test result {new_result.id} from camera capture with status {test_status.value} "
+            f"(stages: {outcome['timings']})"
+        )
+        return new_result, confidence, processing_time
 
     except Exception as e:
         logging.error(f"Failed to create test result from camera capture. Error: {str(e)}")
         db.rollback()
+        if image_path is not None:
+            storage_service.release_image(db, image_path, staged)
+        if isinstance(e, TestResultError):
+            raise
         raise TestResultCreationError(str(e))
+    finally:
+        storage_service.discard_staged(staged)
+
+
+def _release_abandoned_capture(future):
+    """Done callback for a capture whose request timed out: release the stored image."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    outcome = future.result()
+    storage_service = get_storage_service()
+    db = SessionLocal()
+    try:
+        storage_service.release_image(db, outcome["image_path"], outcome["staged"])
+    finally:
+        db.close()
+        storage_service.discard_staged(outcome["staged"])
 
 
 def get_test_results(
@@ -187,22 +475,148 @@ def get_test_results(
     clinic_id: Optional[UUID] = None,
     patient_id: Optional[UUID] = None,
     status: Optional[TestStatus] = None,
-) -> List[TestResult]:
-    """Get test results with optional filters."""
-    query = db.query(TestResult)
-    
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+) -> Page:
+    """Get a page of test results, newest first, with optional filters."""
+    query = db.query(TestResult).filter(*_result_filters(clinic_id, patient_id, status))
+    results = keyset_page(query, [(TestResult.test_date, True), (TestResult.id, True)], cursor, limit, fields)
+    logging.info(f"Retrieved {len(results)} test results")
+    return results
+
+
+def _result_filters(
+    clinic_id: Optional[UUID] = None,
+    patient_id: Optional[UUID] = None,
+    status: Optional[TestStatus] = None,
+    district: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> list:
+    """WHERE clauses for the test result filters shared by the list and export endpoints."""
+    filters = []
     if clinic_id:
-        query = query.filter(TestResult.clinic_id == clinic_id)
-    
+        filters.append(TestResult.clinic_id == clinic_id)
     if patient_id:
-        query = query.filter(TestResult.patient_id == patient_id)
-    
+        filters.append(TestResult.patient_id == patient_id)
     if status:
-        query = query.filter(TestResult.result == status)
-    
-    results = query.order_by(TestResult.test_date.desc()).all()
-    logging.info(f"Retrieved {len(results)} test results")
-    return results
+        filters.append(TestResult.result == status)
+    if district:
+        filters.append(TestResult.clinic_id.in_(select(Clinic.id).where(Clinic.district == district)))
+    if date_from:
+        filters.append(TestResult.test_date >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        # Inclusive: everything before the start of the next day
+        filters.append(TestResult.test_date < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    return filters
+
+
+# Rows fetched from the database cursor per round trip while exporting
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+
+
+def export_test_results(
+    current_user: TokenData,
+    db: Session,
+    export_format: models.ExportFormat,
+    compress: bool = False,
+    fields: Optional[List[str]] = None,
+    clinic_id: Optional[UUID] = None,
+    patient_id: Optional[UUID] = None,
+    status: Optional[TestStatus] = None,
+    district: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> Iterator[bytes]:
+    """
+    Stream matching test results, oldest first, as NDJSON or CSV (optionally gzip'd).
+
+    Only the selected columns are fetched, as plain rows rather than ORM objects,
+    through a server-side cursor EXPORT_BATCH_ROWS at a time; each batch is encoded
+    (and compressed) and handed on before the next is read, so memory use does not
+    grow with the size of the extract.
+    """
+    fields = fields or list(models.TestResultResponse.model_fields)
+    statement = (
+        select(*(getattr(TestResult, name) for name in fields))
+        .where(*_result_filters(clinic_id, patient_id, status, district, date_from, date_to))
+        .order_by(TestResult.test_date, TestResult.id)
+        .execution_options(yield_per=EXPORT_BATCH_ROWS)
+    )
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    if export_format == models.ExportFormat.CSV:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+    rows = 0
+    for batch in db.execute(statement).partitions():
+        if export_format == models.ExportFormat.CSV:
+            writer.writerows([[_export_value(value) for value in row] for row in batch])
+            text = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            text = "".join(
+                json.dumps({name: _export_value(value) for name, value in zip(fields, row)}) + "\n" for row in batch
+            )
+        rows += len(batch)
+        chunk = encode(text)
+        if chunk:
+            yield chunk
+    if export_format == models.ExportFormat.CSV and rows == 0:
+        # Header only
+        chunk = encode(buffer.getvalue())
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+    logging.info(f"Exported {rows} test results as {export_format.value}{' (gzip)' if compress else ''}")
+
+
+def _export_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def get_snapshot_index(
+    current_user: TokenData,
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None,
+    district: Optional[str] = None,
+) -> models.SnapshotIndex:
+    """List the partitions of the Parquet snapshot, optionally filtered."""
+    snapshots = get_parquet_snapshots()
+    return models.SnapshotIndex(
+        generated_at=snapshots.load_state()["generated_at"],
+        partitions=snapshots.partitions(month_from, month_to, district),
+    )
+
+
+def stream_snapshot_archive(
+    current_user: TokenData,
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None,
+    district: Optional[str] = None,
+) -> Iterator[bytes]:
+    """Stream a ZIP of the matching Parquet snapshot partitions."""
+    snapshots = get_parquet_snapshots()
+    partitions = snapshots.partitions(month_from, month_to, district)
+    if not partitions:
+        raise SnapshotNotFoundError()
+    logging.info(f"Downloading {len(partitions)} snapshot partitions ({sum(p['bytes'] for p in partitions)} bytes)")
+    return snapshots.archive(partitions)
 
 
 def get_test_result_by_id(current_user: TokenData, db: Session, result_id: UUID) -> TestResult:
@@ -215,6 +629,33 @@ def get_test_result_by_id(current_user: TokenData, db: Session, result_id: UUID)
     return result
 
 
+async def get_test_result_image(
+    current_user: TokenData,
+    db: Session,
+    result_id: UUID,
+    level: models.ImageLevel = models.ImageLevel.Original,
+) -> Tuple[Union[Path, bytes, Iterator[bytes]], str]:
+    """
+    Locate the stored image for a test result. Storage lookups and on-demand
+    pyramid generation go through the async storage API.
+
+    Returns:
+        Tuple of (file path, or the content of a packed image, or a chunk stream of a
+        remote one, content hash of the original image)
+    Raises:
+        TestResultImageEvictedError: If the local copy was evicted; redirects to the central server
+    """
+    result = get_test_result_by_id(current_user, db, result_id)
+    try:
+        return await get_storage_service().resolve_image_async(result.image_path, level.value)
+    except FileNotFoundError:
+        if db.query(EvictedImage).filter(EvictedImage.image_path == result.image_path).first():
+            central_url = get_sync_service().central_server_url.rstrip("/")
+            raise TestResultImageEvictedError(f"{central_url}/api/results/{result_id}/image?level={level.value}")
+        logging.warning(f"Image for test result {result_id} missing at {result.image_path}")
+        raise TestResultImageNotFoundError(result_id)
+
+
 def update_test_result(
     current_user: TokenData,
     db: Session,
@@ -236,6 +677,91 @@ def update_test_result(
     return result
 
 
+# Most results changed by one bulk update, and ids per IN (...) list (under SQLite's bound-parameter limit)
+BULK_UPDATE_MAX_ITEMS = int(os.getenv("BULK_UPDATE_MAX_ITEMS", "5000"))
+BULK_UPDATE_CHUNK = 500
+
+
+def bulk_update_test_results(
+    current_user: TokenData,
+    db: Session,
+    request: models.BulkUpdateRequest,
+) -> models.BulkUpdateResponse:
+    """
+    Apply changes to many test results in one transaction.
+
+    Results receiving identical changes (the common case: confirming a list of
+    inconclusives as positive) are updated by a single set-based UPDATE ... WHERE
+    id IN (...). Results with changes of their own (per-row notes) are updated by
+    primary key in one executemany per set of changed columns, so a review of
+    hundreds of results costs a handful of statements instead of a fetch, commit
+    and refresh per row. Unknown ids are reported, not fatal; any database error
+    rolls the whole batch back.
+    """
+    items = request.updates
+    if len(items) > BULK_UPDATE_MAX_ITEMS:
+        raise BulkUpdateError(f"At most {BULK_UPDATE_MAX_ITEMS} results can be updated at once")
+    if len({item.id for item in items}) != len(items):
+        raise BulkUpdateError("Each result may appear only once")
+
+    ids = [item.id for item in items]
+    existing = set()
+    for start in range(0, len(ids), BULK_UPDATE_CHUNK):
+        chunk = ids[start:start + BULK_UPDATE_CHUNK]
+        existing.update(db.scalars(select(TestResult.id).where(TestResult.id.in_(chunk))))
+
+    # Group ids by their exact change set: one UPDATE per distinct change
+    groups: Dict[tuple, List[UUID]] = {}
+    for item in items:
+        changes = item.model_dump(exclude_unset=True, exclude={"id"})
+        if "result" in changes and changes["result"] is None:
+            raise BulkUpdateError(f"Result {item.id}: result cannot be null")
+        if item.id in existing:
+            groups.setdefault(tuple(sorted(changes.items())), []).append(item.id)
+
+    # Changes applied to a single row are batched by the columns they set instead
+    per_row: Dict[tuple, List[dict]] = {}
+    for changes, group_ids in list(groups.items()):
+        if len(group_ids) == 1:
+            del groups[changes]
+            per_row.setdefault(tuple(column for column, _ in changes), []).append({"id": group_ids[0], **dict(changes)})
+
+    now = datetime.now(timezone.utc)
+    statements = 0
+    try:
+        for changes, group_ids in groups.items():
+            for start in range(0, len(group_ids), BULK_UPDATE_CHUNK):
+                db.execute(
+                    update(TestResult)
+                    .where(TestResult.id.in_(group_ids[start:start + BULK_UPDATE_CHUNK]))
+                    .values(**dict(changes), updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+                statements += 1
+        for rows in per_row.values():
+            for start in range(0, len(rows), BULK_UPDATE_CHUNK):
+                # ORM bulk UPDATE by primary key: one executemany per chunk
+                db.execute(
+                    update(TestResult).execution_options(synchronize_session=False),
+                    [{**row, "updated_at": now} for row in rows[start:start + BULK_UPDATE_CHUNK]],
+                )
+                statements += 1
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    # Rows already in the session were changed behind its back
+    db.expire_all()
+
+    outcomes = {
+        result_id: models.BulkUpdateOutcome.Updated if result_id in existing else models.BulkUpdateOutcome.NotFound
+        for result_id in ids
+    }
+    updated = sum(1 for result_id in ids if result_id in existing)
+    logging.info(f"Bulk updated {updated} test results in {statements} statements ({len(ids) - updated} not found)")
+    return models.BulkUpdateResponse(updated=updated, not_found=len(ids) - updated, outcomes=outcomes)
+
+
 def mark_as_synced(current_user: TokenData, db: Session, result_id: UUID) -> TestResult:
     """Mark a test result as synced."""
     result = get_test_result_by_id(current_user, db, result_id)
@@ -248,11 +774,16 @@ def mark_as_synced(current_user: TokenData, db: Session, result_id: UUID) -> Tes
     return result
 
 
-def get_pending_sync_results(current_user: TokenData, db: Session) -> List[TestResult]:
-    """Get all test results pending sync."""
-    results = db.query(TestResult).filter(
-        TestResult.sync_status == SyncStatus.Pending
-    ).all()
+def get_pending_sync_results(
+    current_user: TokenData,
+    db: Session,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+) -> Page:
+    """Get a page of test results pending sync, oldest first."""
+    query = db.query(TestResult).filter(TestResult.sync_status == SyncStatus.Pending)
+    results = keyset_page(query, [(TestResult.test_date, False), (TestResult.id, False)], cursor, limit, fields)
     logging.info(f"Retrieved {len(results)} pending sync results")
     return results
 
@@ -0,0 +1,59 @@
+from typing import Dict
+from fastapi.responses import JSONResponse
+from .exceptions import ImageTooLargeError
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects request bodies over a per-path byte limit before they are fully received.
+
+    A Content-Length over the limit is refused without reading the body. Otherwise
+    the body is counted as it streams in and the request is aborted with 413 as soon
+    as the limit is crossed, so oversized uploads never reach the handler or disk.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(scope, receive, send, limit)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise ImageTooLargeError(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except ImageTooLargeError:
+            if response_started:
+                raise
+            await self._reject(scope, receive, send, limit)
+
+    async def _reject(self, scope, receive, send, limit: int):
+        error = ImageTooLargeError(limit)
+        response = JSONResponse({"detail": error.detail}, status_code=error.status_code, headers={"Connection": "close"})
+        await response(scope, receive, send)
@@ -1,3 +1,4 @@
+import os
 import pytest
 import warnings
 from datetime import datetime, timezone
@@ -9,10 +10,15 @@ from src.entities.user import User
 from src.entities.clinic import Clinic
 from src.entities.patient import Patient
 from src.entities.test_result import TestResult
+from src.entities.evicted_image import EvictedImage
+from src.entities.image_checksum import ImageChecksum
 from src.auth.models import TokenData
 from src.auth.service import get_password_hash
 from src.rate_limiter import limiter
 
+# Tests must never evict images from the real storage directory
+os.environ.setdefault("STORAGE_RETENTION", "false")
+
 
 @pytest.fixture(scope="function")
 def db_session():
@@ -0,0 +1,35 @@
+from fastapi.testclient import TestClient
+from src.camera.controller import _mjpeg_frames
+from src.infrastructure.camera_service import CameraService
+
+
+def test_preview_frame_requires_auth(client: TestClient):
+    response = client.get("/api/camera/preview/frame")
+    assert response.status_code == 401
+
+
+def test_preview_frame(client: TestClient, auth_headers):
+    response = client.get("/api/camera/preview/frame", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.content[:2] == b"\xff\xd8"
+
+
+async def test_mjpeg_stream_shares_one_encoder(monkeypatch):
+    monkeypatch.setenv("CAMERA_STREAM_RESOLUTION", "320x240")
+    monkeypatch.setenv("CAMERA_PREVIEW_RESOLUTION", "160x120")
+    monkeypatch.setenv("CAMERA_PREVIEW_FPS", "20")
+    camera = CameraService(streaming=False)
+    preview = camera.get_preview()
+    first, second = _mjpeg_frames(preview), _mjpeg_frames(preview)
+    try:
+        part_a = await first.__anext__()
+        part_b = await second.__anext__()
+        assert preview.viewers == 2
+        assert part_a.startswith(b"--frame\r\nContent-Type: image/jpeg")
+        assert b"\xff\xd8" in part_b
+    finally:
+        await first.aclose()
+        await second.aclose()
+        camera.close()
+    assert preview.viewers == 0
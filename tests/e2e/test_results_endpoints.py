@@ -0,0 +1,470 @@
+import hashlib
+import io
+import json
+import pytest
+import zipfile
+from uuid import uuid4
+from fastapi.testclient import TestClient
+from PIL import Image
+from src.infrastructure import file_storage
+from src.infrastructure.file_storage import FileStorageService, MAX_UPLOAD_BYTES
+from tests.helpers import SlowCamera, SlowInference, fake_snapshot
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    service = FileStorageService(str(tmp_path / "uploads"))
+    monkeypatch.setattr(file_storage, "_storage_service", service)
+    return service
+
+
+def smear_jpeg(size=(320, 240)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (230, 200, 210)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def analyze(client, auth_headers, content: bytes, filename="smear.jpg"):
+    return client.post(
+        "/api/results/analyze",
+        headers=auth_headers,
+        data={"patient_id": str(uuid4()), "clinic_id": str(uuid4())},
+        files={"image": (filename, content, "image/jpeg")},
+    )
+
+
+def test_analyze_image(client: TestClient, auth_headers, storage):
+    response = analyze(client, auth_headers, smear_jpeg())
+    assert response.status_code == 201
+    assert response.json()["result"] in ("positive", "negative", "inconclusive")
+    assert len(list(storage.iter_originals())) == 1
+    assert not any((storage.base_path / ".staging").iterdir())
+
+
+def test_analyze_passes_inference_a_path_with_image_suffix(client: TestClient, auth_headers, storage, monkeypatch):
+    """The model picks its image loader by suffix, so staged files must keep one."""
+    from src.infrastructure.ai_inference import get_inference_service
+
+    inference = get_inference_service()
+    paths = []
+    analyze_image, analyze_batch_images = inference.analyze_image, inference.analyze_batch
+    monkeypatch.setattr(inference, "analyze_image", lambda path: paths.append(path) or analyze_image(path))
+    monkeypatch.setattr(inference, "analyze_batch", lambda batch: paths.extend(batch) or analyze_batch_images(batch))
+
+    assert analyze(client, auth_headers, smear_jpeg(), filename="smear").status_code == 201
+    png = io.BytesIO()
+    Image.new("RGB", (320, 240)).save(png, "PNG")
+    analyze_batch(client, auth_headers, [("images", ("slide", png.getvalue(), "image/png"))], {"patient_id": [str(uuid4())]})
+
+    assert {path[-4:] for path in paths} == {".jpg", ".png"}
+
+
+def test_analyze_rejects_oversized_upload(client: TestClient, auth_headers, storage):
+    content = b"\xff\xd8\xff" + b"\x00" * (MAX_UPLOAD_BYTES + 128 * 1024)
+    response = analyze(client, auth_headers, content)
+    assert response.status_code == 413
+    assert not list(storage.base_path.rglob("*.jpg"))
+
+
+def test_analyze_rejects_non_image(client: TestClient, auth_headers, storage):
+    response = analyze(client, auth_headers, b"GIF89a" + b"\x00" * 200, filename="smear.gif")
+    assert response.status_code == 400
+
+
+def test_analyze_releases_stored_image_when_validation_fails(client: TestClient, auth_headers, storage, monkeypatch):
+    from src.infrastructure.ai_inference import get_inference_service
+
+    monkeypatch.setattr(get_inference_service(), "validate_image", lambda path: False)
+    response = analyze(client, auth_headers, smear_jpeg())
+    assert response.status_code == 400
+    storage._get_pyramid_pool().shutdown(wait=True)
+    assert not list(storage.iter_originals())
+    assert not any((storage.base_path / ".staging").iterdir())
+
+
+def capture(client, auth_headers):
+    return client.post(
+        "/api/results/capture-and-analyze",
+        headers=auth_headers,
+        data={"patient_id": str(uuid4()), "clinic_id": str(uuid4())},
+    )
+
+
+def test_capture_records_checksum(client: TestClient, auth_headers, storage, db_session, tmp_path, monkeypatch):
+    from src.entities.image_checksum import ImageChecksum
+    from src.infrastructure.capture_pipeline import CapturePipeline
+    from src.results import service
+
+    pipeline = CapturePipeline(SlowCamera(tmp_path), SlowInference(), storage)
+    monkeypatch.setattr(service, "get_capture_pipeline", lambda: pipeline)
+    response = capture(client, auth_headers)
+    pipeline.close()
+
+    assert response.status_code == 201
+    (image_path,) = storage.iter_originals()
+    checksum = db_session.query(ImageChecksum).filter(ImageChecksum.image_path == image_path).one()
+    assert checksum.sha256 == hashlib.sha256(storage.get_image_path(image_path).read_bytes()).hexdigest()
+
+
+def test_capture_times_out_with_504(client: TestClient, auth_headers, storage, tmp_path, monkeypatch):
+    import threading
+    from src.infrastructure.capture_pipeline import CapturePipeline
+    from src.results import service
+
+    class HungCamera(SlowCamera):
+        released = threading.Event()
+
+        def capture_image(self):
+            self.released.wait(10)
+            return super().capture_image()
+
+    pipeline = CapturePipeline(HungCamera(tmp_path), SlowInference(), storage)
+    monkeypatch.setattr(service, "get_capture_pipeline", lambda: pipeline)
+    monkeypatch.setattr(service, "CAPTURE_TIMEOUT_SECONDS", 0.2)
+    response = capture(client, auth_headers)
+
+    assert response.status_code == 504
+    # When the camera recovers, the abandoned capture's image is released
+    HungCamera.released.set()
+    pipeline.close()
+    assert pipeline.stats()["completed"] == 1
+    assert not list(storage.iter_originals())
+
+
+def analyze_batch(client, auth_headers, files, data=None):
+    response = client.post(
+        "/api/results/analyze-batch",
+        headers=auth_headers,
+        data={"clinic_id": str(uuid4()), **(data or {})},
+        files=files,
+    )
+    assert response.headers["content-type"] == "application/x-ndjson"
+    *items, summary = [json.loads(line) for line in response.text.splitlines()]
+    # Items stream as they finish; failures can overtake their chunk
+    return sorted(items, key=lambda e: e["index"]), summary
+
+
+def test_analyze_batch_of_images(client: TestClient, auth_headers, storage):
+    patients = [str(uuid4()) for _ in range(3)]
+    files = [("images", (f"smear-{i}.jpg", smear_jpeg((320 + i, 240)), "image/jpeg")) for i in range(2)]
+    files.append(("images", ("notes.txt", b"not an image", "text/plain")))
+
+    items, summary = analyze_batch(client, auth_headers, files, {"patient_id": patients})
+
+    assert [e["status"] for e in items] == ["created", "created", "failed"]
+    assert items[2]["filename"] == "notes.txt"
+    assert summary["total"] == 3 and summary["created"] == 2 and summary["failed"] == 1
+    result = client.get(f"/api/results/{items[1]['test_result_id']}", headers=auth_headers).json()
+    assert result["patient_id"] == patients[1]
+    assert len(list(storage.iter_originals())) == 2
+    assert not any((storage.base_path / ".staging").iterdir())
+
+
+def test_analyze_batch_from_zip_manifest(client: TestClient, auth_headers, storage):
+    patient = str(uuid4())
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("slides/manifest.csv", f"filename,patient_id,notes\na.jpg,{patient},fever\nb.jpg,{patient},\nmissing.jpg,{patient},\n")
+        zf.writestr("slides/a.jpg", smear_jpeg())
+        zf.writestr("slides/b.jpg", smear_jpeg((300, 200)))
+
+    items, summary = analyze_batch(client, auth_headers, {"archive": ("slides.zip", buffer.getvalue(), "application/zip")})
+
+    assert [e["filename"] for e in items] == ["a.jpg", "b.jpg", "missing.jpg"]
+    assert [e["status"] for e in items] == ["created", "created", "failed"]
+    assert "not in the archive" in items[2]["error"]
+    assert summary["created"] == 2
+    result = client.get(f"/api/results/{items[0]['test_result_id']}", headers=auth_headers).json()
+    assert result["notes"] == "fever"
+
+
+def test_analyze_batch_rejects_malformed_batch(client: TestClient, auth_headers, storage):
+    files = [("images", ("smear.jpg", smear_jpeg(), "image/jpeg"))] * 2
+    response = client.post(
+        "/api/results/analyze-batch",
+        headers=auth_headers,
+        data={"clinic_id": str(uuid4()), "patient_id": [str(uuid4()) for _ in range(3)]},
+        files=files,
+    )
+    assert response.status_code == 400
+
+    response = client.post(
+        "/api/results/analyze-batch",
+        headers=auth_headers,
+        data={"clinic_id": str(uuid4())},
+        files={"archive": ("slides.zip", b"PK not really", "application/zip")},
+    )
+    assert response.status_code == 400
+
+
+def test_get_result_image_supports_etag_and_range(client: TestClient, auth_headers, storage):
+    content = smear_jpeg()
+    result_id = analyze(client, auth_headers, content).json()["test_result_id"]
+
+    response = client.get(f"/api/results/{result_id}/image", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "immutable" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+
+    cached = client.get(f"/api/results/{result_id}/image", headers={**auth_headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert not cached.content
+
+    partial = client.get(f"/api/results/{result_id}/image", headers={**auth_headers, "Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.content == content[:10]
+
+
+def test_get_result_image_thumbnail(client: TestClient, auth_headers, storage):
+    result_id = analyze(client, auth_headers, smear_jpeg((1600, 1200))).json()["test_result_id"]
+
+    response = client.get(f"/api/results/{result_id}/image?level=thumb", headers=auth_headers)
+    assert response.status_code == 200
+    assert Image.open(io.BytesIO(response.content)).size == (256, 192)
+    assert response.headers["etag"].endswith('-thumb"')
+
+
+def test_get_result_image_requires_auth(client: TestClient, storage):
+    response = client.get(f"/api/results/{uuid4()}/image")
+    assert response.status_code == 401
+
+
+def test_evicted_image_redirects_to_central_copy(client: TestClient, auth_headers, storage, db_session):
+    from src.entities.evicted_image import EvictedImage
+    from src.entities.test_result import TestResult
+
+    result_id = analyze(client, auth_headers, smear_jpeg()).json()["test_result_id"]
+    result = db_session.query(TestResult).first()
+    size = storage.evict_original(result.image_path)
+    db_session.add(EvictedImage(image_path=result.image_path, size_bytes=size))
+    db_session.commit()
+
+    response = client.get(f"/api/results/{result_id}/image", headers=auth_headers, follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"].endswith(f"/api/results/{result_id}/image?level=original")
+
+
+def add_results(db_session, count, **columns):
+    from datetime import datetime, timedelta
+    from src.entities.test_result import TestResult, TestStatus
+
+    # Pairs of results share a test_date so the id tie-breaker is exercised
+    start = datetime(2025, 3, 1, 8, 0)
+    results = [
+        TestResult(**{
+            "patient_id": uuid4(), "clinic_id": uuid4(), "health_worker_id": uuid4(),
+            "test_date": start + timedelta(minutes=i // 2), "result": TestStatus.Negative,
+            "image_path": f"clinic/2025-03/{i}.jpg", "image_filename": f"{i}.jpg", **columns,
+        })
+        for i in range(count)
+    ]
+    db_session.add_all(results)
+    db_session.commit()
+    return [str(r.id) for r in sorted(results, key=lambda r: (r.test_date, str(r.id)))]
+
+
+def fetch_pages(client, auth_headers, url, params):
+    items, cursor, pages = [], None, 0
+    while True:
+        response = client.get(url, headers=auth_headers, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        items.extend(response.json())
+        pages += 1
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return items, pages
+
+
+def test_list_results_pages_with_cursor(client: TestClient, auth_headers, db_session):
+    ids = add_results(db_session, 7)
+
+    items, pages = fetch_pages(client, auth_headers, "/api/results/", {"limit": 3})
+
+    assert pages == 3
+    assert [item["id"] for item in items] == list(reversed(ids))
+
+
+def test_list_results_without_limit_returns_every_row(client: TestClient, auth_headers, db_session):
+    ids = add_results(db_session, 105)
+
+    response = client.get("/api/results/", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert "x-next-cursor" not in response.headers
+    assert [item["id"] for item in response.json()] == list(reversed(ids))
+
+    # Following a cursor without a limit pages at PAGE_SIZE_DEFAULT
+    first = client.get("/api/results/", headers=auth_headers, params={"limit": 1})
+    items, pages = fetch_pages(client, auth_headers, "/api/results/", {"cursor": first.headers["x-next-cursor"]})
+    assert pages == 2
+    assert [item["id"] for item in first.json() + items] == list(reversed(ids))
+
+
+def test_list_results_projects_fields(client: TestClient, auth_headers, db_session):
+    add_results(db_session, 3)
+
+    response = client.get("/api/results/", headers=auth_headers, params={"limit": 2, "fields": "id,result"})
+
+    assert response.status_code == 200
+    assert [set(item) for item in response.json()] == [{"id", "result"}] * 2
+    assert response.json()[0]["result"] == "negative"
+    assert "x-next-cursor" in response.headers
+
+    bad = client.get("/api/results/", headers=auth_headers, params={"fields": "id,password_hash"})
+    assert bad.status_code == 400
+    bad = client.get("/api/results/", headers=auth_headers, params={"cursor": "not-a-cursor"})
+    assert bad.status_code == 400
+
+
+def test_pending_sync_pages_oldest_first(client: TestClient, auth_headers, db_session):
+    from src.entities.test_result import SyncStatus
+
+    pending = add_results(db_session, 5)
+    add_results(db_session, 2, sync_status=SyncStatus.Synced)
+
+    items, pages = fetch_pages(client, auth_headers, "/api/results/pending-sync", {"limit": 2, "fields": "id"})
+
+    assert pages == 3
+    assert [item["id"] for item in items] == pending
+
+
+def test_export_results_as_ndjson_filtered_by_district_and_date(client: TestClient, auth_headers, db_session, monkeypatch):
+    from src.entities.clinic import Clinic
+    from src.results import service
+
+    monkeypatch.setattr(service, "EXPORT_BATCH_ROWS", 2)
+    gulu = Clinic(name="Gulu HC IV", district="Gulu", region="Northern")
+    lira = Clinic(name="Lira HC III", district="Lira", region="Northern")
+    db_session.add_all([gulu, lira])
+    db_session.commit()
+    # test dates run from 2025-03-01 08:00, one minute per pair
+    ids = add_results(db_session, 5, clinic_id=gulu.id)
+    add_results(db_session, 3, clinic_id=lira.id)
+
+    response = client.get(
+        "/api/results/export",
+        headers=auth_headers,
+        params={"district": "Gulu", "date_from": "2025-03-01", "date_to": "2025-03-01", "fields": "id,result,test_date"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "attachment" in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == ids
+    assert rows[0] == {"id": ids[0], "result": "negative", "test_date": "2025-03-01T08:00:00"}
+
+    outside = client.get("/api/results/export", headers=auth_headers, params={"date_from": "2025-03-02"})
+    assert outside.text == ""
+
+
+def test_export_results_as_gzipped_csv(client: TestClient, auth_headers, db_session):
+    import csv
+    import gzip
+
+    ids = add_results(db_session, 3)
+
+    response = client.get("/api/results/export", headers=auth_headers, params={"format": "csv", "gzip": "true"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert response.headers["content-disposition"].endswith('.csv.gz"')
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode())))
+    assert [row["id"] for row in rows] == ids
+    assert rows[0]["sync_status"] == "pending"
+    assert rows[0]["notes"] == ""
+
+
+def test_export_empty_csv_has_header(client: TestClient, auth_headers, db_session):
+    response = client.get("/api/results/export", headers=auth_headers, params={"format": "csv", "fields": "id,result"})
+
+    assert response.text.strip() == "id,result"
+
+
+def test_snapshot_download(client: TestClient, auth_headers, tmp_path, monkeypatch):
+    import zipfile as zf_module
+    from src.infrastructure import parquet_snapshots
+
+    monkeypatch.setattr(parquet_snapshots, "_parquet_snapshots", fake_snapshot(tmp_path))
+
+    index = client.get("/api/results/snapshots", headers=auth_headers, params={"district": "Gulu"})
+    assert index.status_code == 200
+    assert [p["month"] for p in index.json()["partitions"]] == ["2025-02", "2025-03"]
+
+    response = client.get("/api/results/snapshots/download", headers=auth_headers, params={"month_from": "2025-03"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert len(zf_module.ZipFile(io.BytesIO(response.content)).namelist()) == 3
+
+    missing = client.get("/api/results/snapshots/download", headers=auth_headers, params={"month_from": "2026-01"})
+    assert missing.status_code == 404
+    bad = client.get("/api/results/snapshots", headers=auth_headers, params={"month_from": "March"})
+    assert bad.status_code == 422
+
+
+def test_bulk_update_results(client: TestClient, auth_headers, db_session):
+    from src.entities.test_result import TestResult
+
+    ids = add_results(db_session, 4)
+    missing = str(uuid4())
+    updates = [{"id": result_id, "result": "positive"} for result_id in ids[:3]]
+    updates.append({"id": ids[3], "notes": "Confirmed by microscopy"})
+    updates.append({"id": missing, "result": "positive"})
+
+    response = client.put("/api/results/bulk", headers=auth_headers, json={"updates": updates})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["updated"] == 4 and body["not_found"] == 1
+    assert body["outcomes"][missing] == "not_found"
+    assert body["outcomes"][ids[0]] == "updated"
+    results = {str(r.id): r for r in db_session.query(TestResult).all()}
+    assert [results[i].result.value for i in ids] == ["positive", "positive", "positive", "negative"]
+    assert results[ids[3]].notes == "Confirmed by microscopy"
+    assert all(results[i].updated_at is not None for i in ids)
+
+
+def test_bulk_update_batches_per_row_changes(client: TestClient, auth_headers, db_session):
+    from sqlalchemy import event
+    from src.entities.test_result import TestResult
+
+    ids = add_results(db_session, 9)
+    updates = [{"id": result_id, "result": "positive"} for result_id in ids[:3]]
+    updates += [{"id": result_id, "notes": f"Slide {i}"} for i, result_id in enumerate(ids[3:])]
+    executed = []
+
+    def count_updates(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("UPDATE"):
+            executed.append(executemany)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", count_updates)
+    try:
+        response = client.put("/api/results/bulk", headers=auth_headers, json={"updates": updates})
+    finally:
+        event.remove(engine, "before_cursor_execute", count_updates)
+
+    assert response.status_code == 200
+    assert response.json()["updated"] == 9
+    # One UPDATE ... WHERE id IN (...) for the shared change, one executemany for the notes
+    assert executed == [False, True]
+    results = {str(r.id): r for r in db_session.query(TestResult).all()}
+    assert [results[i].notes for i in ids[3:]] == [f"Slide {i}" for i in range(6)]
+
+
+def test_bulk_update_rejects_invalid_batch(client: TestClient, auth_headers, db_session):
+    from src.entities.test_result import TestResult
+
+    ids = add_results(db_session, 2)
+
+    duplicate = client.put("/api/results/bulk", headers=auth_headers, json={"updates": [
+        {"id": ids[0], "result": "positive"}, {"id": ids[0], "notes": "again"},
+    ]})
+    assert duplicate.status_code == 400
+    null_result = client.put("/api/results/bulk", headers=auth_headers, json={"updates": [
+        {"id": ids[0], "result": "positive"}, {"id": ids[1], "result": None},
+    ]})
+    assert null_result.status_code == 400
+    assert {r.result.value for r in db_session.query(TestResult).all()} == {"negative"}
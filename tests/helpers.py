@@ -0,0 +1,55 @@
+"""Test doubles shared by the unit and end-to-end tests."""
+
+import json
+import time
+from src.infrastructure.ai_inference import InferenceResult
+from src.infrastructure.parquet_snapshots import SNAPSHOT_STATE_FILE, ParquetSnapshots
+
+STAGE_SECONDS = 0.1
+
+
+class SlowCamera:
+    """Camera stub that takes a fixed time per capture."""
+    capture_best_enabled = False
+
+    def __init__(self, tmp_path):
+        self.tmp_path = tmp_path
+        self.count = 0
+
+    def capture_image(self):
+        time.sleep(STAGE_SECONDS)
+        self.count += 1
+        path = self.tmp_path / f"capture_{self.count}.jpg"
+        path.write_bytes(b"\xff\xd8\xfffake-jpeg-%d" % self.count)
+        return str(path)
+
+
+class SlowInference:
+    """Inference stub that takes a fixed time per image."""
+    model_version = "test"
+
+    def __init__(self, valid=True):
+        self.valid = valid
+
+    def validate_image(self, path):
+        return self.valid
+
+    def analyze_image(self, path):
+        time.sleep(STAGE_SECONDS)
+        return InferenceResult.NEGATIVE, 0.9, STAGE_SECONDS * 1000
+
+
+def fake_snapshot(tmp_path) -> ParquetSnapshots:
+    """A snapshot tree written by hand, for the parts that do not need pyarrow."""
+    store = ParquetSnapshots(str(tmp_path / "snapshots"))
+    state = {"watermark": None, "generated_at": "2025-04-01T02:00:00", "partitions": {}}
+    for month, district in [("2025-02", "Gulu"), ("2025-03", "Gulu"), ("2025-03", "Fort Portal"), ("2025-03", None)]:
+        relative = store.partition_path(month, district)
+        path = store.base_path / relative
+        path.parent.mkdir(parents=True)
+        path.write_bytes(f"PAR1 {month} {district}".encode())
+        state["partitions"][store.partition_key(month, district)] = {
+            "path": str(relative), "rows": 1, "bytes": path.stat().st_size, "written_at": "2025-04-01T02:00:00",
+        }
+    (store.root / SNAPSHOT_STATE_FILE).write_text(json.dumps(state))
+    return store
@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import pytest
+from datetime import datetime, timedelta
+from uuid import uuid4
+from src.entities import test_result as entities
+from src.entities.clinic import Clinic
+from src.infrastructure.backup import EXPORT_STATE_FILE, BackupExporter
+from src.infrastructure.file_storage import FileStorageService
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    service = FileStorageService(str(tmp_path / "uploads"), layout="dated")
+    monkeypatch.setattr(service, "pyramid_enabled", False)
+    return service
+
+
+@pytest.fixture
+def clinic(db_session):
+    clinic = Clinic(name="Gulu HC IV", district="Gulu", region="Northern")
+    db_session.add(clinic)
+    db_session.commit()
+    return clinic.id
+
+
+def add_result(db_session, storage, clinic_id, content: bytes, created_at: datetime = None) -> str:
+    image_path, image_filename = storage.save_image(content, "smear.jpg", "clinic-1")
+    db_session.add(entities.TestResult(
+        patient_id=uuid4(),
+        clinic_id=clinic_id,
+        health_worker_id=uuid4(),
+        result=entities.TestStatus.Negative,
+        image_path=image_path,
+        image_filename=image_filename,
+        **({"created_at": created_at} if created_at else {}),
+    ))
+    db_session.commit()
+    return image_path
+
+
+def exporter(db_session, storage, target) -> BackupExporter:
+    return BackupExporter(target, storage, session_factory=lambda: db_session, workers=2, batch_size=2)
+
+
+def read_delta(target, stats):
+    with gzip.open(target / stats["db_delta"], "rt") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_export_copies_only_new_blobs(db_session, storage, clinic, tmp_path):
+    """Test that a repeat export copies only new images and only the rows changed since."""
+    target = tmp_path / "usb"
+    # Created well before the export, so outside the next export's overlap window
+    earlier = datetime(2025, 3, 1, 9)
+    first_images = [
+        add_result(db_session, storage, clinic, b"\xff\xd8\xff" + bytes([i]) * 500, created_at=earlier) for i in range(3)
+    ]
+    # Same content stored twice is one blob on the drive
+    add_result(db_session, storage, clinic, b"\xff\xd8\xff" + bytes([0]) * 500, created_at=earlier)
+
+    first = exporter(db_session, storage, target).run()
+
+    assert first["images"] == 4
+    assert first["blobs_copied"] + first["blobs_skipped"] == 4
+    assert len(list((target / "blobs").rglob("*.jpg"))) == 3
+    manifest = json.loads((target / first["manifest"]).read_text())
+    for path in first_images:
+        entry = manifest["images"][path]
+        assert hashlib.sha256((target / entry["blob"]).read_bytes()).hexdigest() == entry["sha256"]
+    assert first["db_rows"]["test_results"] == 4
+    assert first["db_rows"]["clinics"] == 1
+    assert {r["table"] for r in read_delta(target, first)} == {"test_results", "clinics"}
+
+    new_image = add_result(db_session, storage, clinic, b"\xff\xd8\xff" + b"new" * 200)
+    second = exporter(db_session, storage, target).run()
+
+    assert second["blobs_copied"] == 1
+    assert second["blobs_skipped"] == 4
+    assert [r["row"]["image_path"] for r in read_delta(target, second) if r["table"] == "test_results"] == [new_image]
+
+
+def test_interrupted_export_resumes(db_session, storage, clinic, tmp_path, monkeypatch):
+    """Test that an export interrupted mid-copy leaves no partial blobs and resumes without re-copying."""
+    target = tmp_path / "usb"
+    for i in range(4):
+        add_result(db_session, storage, clinic, b"\xff\xd8\xff" + bytes([i]) * 500)
+
+    copied = []
+    original_copy = BackupExporter._copy
+
+    def copy_then_fail(self, relative_path, entry, stats):
+        if len(copied) == 2:
+            raise OSError("No space left on device")
+        copied.append(relative_path)
+        return original_copy(self, relative_path, entry, stats)
+
+    monkeypatch.setattr(BackupExporter, "_copy", copy_then_fail)
+    with pytest.raises(OSError):
+        exporter(db_session, storage, target).run()
+    monkeypatch.setattr(BackupExporter, "_copy", original_copy)
+
+    assert not (target / EXPORT_STATE_FILE).exists()
+    assert len(list((target / "blobs").rglob("*.jpg"))) == 2
+
+    resumed = exporter(db_session, storage, target).run()
+
+    assert resumed["blobs_skipped"] == 2
+    assert resumed["blobs_copied"] == 2
+    assert resumed["db_rows"]["test_results"] == 4
+    assert not list(target.rglob("*.tmp"))
+
+
+def test_row_committed_after_export_is_in_next_delta(db_session, storage, clinic, tmp_path):
+    """Test that a row stamped before an export but committed after it is not lost."""
+    target = tmp_path / "usb"
+    add_result(db_session, storage, clinic, b"\xff\xd8\xff" + b"old" * 200, created_at=datetime(2025, 3, 1, 9))
+    exporter(db_session, storage, target).run()
+    until = datetime.fromisoformat(json.loads((target / EXPORT_STATE_FILE).read_text())["last_export_until"])
+
+    # Its transaction was still open while the previous export ran
+    late = add_result(db_session, storage, clinic, b"\xff\xd8\xff" + b"late" * 200, created_at=until - timedelta(seconds=5))
+    second = exporter(db_session, storage, target).run()
+
+    assert [r["row"]["image_path"] for r in read_delta(target, second) if r["table"] == "test_results"] == [late]
+
+
+def test_edited_clinic_without_new_results_is_exported(db_session, storage, clinic, tmp_path):
+    """Test that patients and clinics reach every delta, and same-second exports do not collide."""
+    from src.entities.patient import Gender, Patient
+
+    target = tmp_path / "usb"
+    add_result(db_session, storage, clinic, b"\xff\xd8\xff" + b"a" * 500, created_at=datetime(2025, 3, 1, 9))
+    first = exporter(db_session, storage, target).run()
+
+    row = db_session.get(Clinic, clinic)
+    row.district = "Amuru"
+    db_session.add(Patient(first_name="Jane", last_name="Akello", gender=Gender.Female, clinic_id=clinic))
+    db_session.commit()
+    second = exporter(db_session, storage, target).run()
+
+    rows = read_delta(target, second)
+    assert not [r for r in rows if r["table"] == "test_results"]
+    assert [r["row"]["district"] for r in rows if r["table"] == "clinics"] == ["Amuru"]
+    assert [r["row"]["first_name"] for r in rows if r["table"] == "patients"] == ["Jane"]
+    assert second["db_delta"] != first["db_delta"]
+    assert len(list((target / "db").glob("delta-*.jsonl.gz"))) == 2
@@ -0,0 +1,266 @@
+import time
+import pytest
+import numpy as np
+from PIL import Image
+from src.infrastructure.file_storage import sniff_extension
+from src.infrastructure.camera_service import CameraService, FrameRingBuffer, compute_sharpness, score_frames
+from src.infrastructure.synthetic_smear import MockFramePool, synthesize_smear
+from src.infrastructure.replay_camera import ReplayCamera
+
+
+@pytest.fixture
+def streaming_camera(monkeypatch):
+    """Create a mock camera streaming small frames into a ring buffer."""
+    monkeypatch.setenv("CAMERA_STREAM_RESOLUTION", "320x240")
+    monkeypatch.setenv("CAMERA_STREAM_BUFFER_SIZE", "3")
+    monkeypatch.setenv("CAMERA_STREAM_FPS", "50")
+    camera = CameraService(streaming=True)
+    yield camera
+    camera.close()
+
+
+def test_ring_buffer_overwrites_oldest_frame():
+    """Test that the ring buffer keeps a fixed number of frames."""
+    buffer = FrameRingBuffer(capacity=2, resolution=(8, 4))
+    for value in (10, 20, 30):
+        buffer.write(np.full((4, 8, 3), value, dtype=np.uint8), sharpness=value)
+
+    assert buffer.count == 3
+    assert buffer.frames.shape == (2, 4, 8, 3)
+    assert buffer.latest()[0, 0, 0] == 30
+    assert buffer.sharpest(window=2)[0, 0, 0] == 30
+
+
+def test_ring_buffer_sharpest_respects_window():
+    """Test that only the last N frames are considered for the sharpest frame."""
+    buffer = FrameRingBuffer(capacity=4, resolution=(8, 4))
+    for value, score in ((1, 100.0), (2, 5.0), (3, 1.0)):
+        buffer.write(np.full((4, 8, 3), value, dtype=np.uint8), sharpness=score)
+
+    assert buffer.sharpest(window=2)[0, 0, 0] == 2
+    assert buffer.sharpest(window=3)[0, 0, 0] == 1
+
+
+def test_compute_sharpness_prefers_detail():
+    """Test that a textured frame scores sharper than a flat one."""
+    flat = np.full((64, 64, 3), 128, dtype=np.uint8)
+    checker = (np.indices((64, 64)).sum(axis=0) // 4 % 2 * 255).astype(np.uint8)
+    textured = np.repeat(checker[:, :, None], 3, axis=2)
+
+    assert compute_sharpness(textured) > compute_sharpness(flat)
+
+
+def test_streaming_capture_returns_buffered_frame(streaming_camera, tmp_path):
+    """Test that a streaming capture writes the newest buffered frame."""
+    output = streaming_camera.capture_image(str(tmp_path / "capture.jpg"))
+
+    with Image.open(output) as image:
+        assert image.size == (320, 240)
+    assert streaming_camera.frame_buffer.capacity == 3
+
+
+def test_streaming_buffer_is_capped(monkeypatch):
+    """Test that the buffer capacity is reduced to fit the memory limit."""
+    monkeypatch.setenv("CAMERA_STREAM_RESOLUTION", "1024x1024")
+    monkeypatch.setenv("CAMERA_STREAM_BUFFER_SIZE", "10")
+    monkeypatch.setenv("CAMERA_STREAM_MAX_BUFFER_MB", "6")
+    camera = CameraService(streaming=True)
+    try:
+        assert camera.frame_buffer.capacity == 2
+        assert camera.frame_buffer.nbytes <= 6 * 1024 * 1024
+    finally:
+        camera.close()
+
+
+def test_score_frames_matches_single_frame_scores():
+    """Test that batch scoring agrees with per-frame scoring."""
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 255, size=(3, 32, 32, 3), dtype=np.uint8)
+
+    scores = score_frames(frames)
+
+    assert scores.shape == (3,)
+    assert np.allclose(scores, [compute_sharpness(f) for f in frames], rtol=1e-4)
+
+
+def test_capture_best_sweep_finds_mock_focus(monkeypatch, tmp_path):
+    """Test that a lens sweep keeps the frame taken closest to the mock focus."""
+    monkeypatch.setenv("CAMERA_STREAM_RESOLUTION", "320x240")
+    monkeypatch.setenv("CAMERA_FOCUS_RANGE", "0.0:10.0")
+    monkeypatch.setenv("CAMERA_MOCK_FOCUS_POSITION", "7.5")
+    camera = CameraService(streaming=False)
+
+    output = camera.capture_best(str(tmp_path / "best.jpg"), mode="sweep", steps=5)
+
+    assert camera.lens_position == pytest.approx(7.5)
+    with Image.open(output) as image:
+        assert image.size == (320, 240)
+
+
+def test_capture_best_rejects_unknown_mode():
+    """Test that an unknown capture mode raises an error."""
+    camera = CameraService(streaming=False)
+    with pytest.raises(ValueError):
+        camera.capture_best(mode="zigzag")
+
+
+def test_synthesize_smear_is_deterministic():
+    """Test that the same seed renders the same smear and ground truth."""
+    frame_a, truth_a = synthesize_smear((320, 240), seed=7, parasitemia=0.2)
+    frame_b, truth_b = synthesize_smear((320, 240), seed=7, parasitemia=0.2)
+
+    assert frame_a.shape == (240, 320, 3)
+    assert np.array_equal(frame_a, frame_b)
+    assert truth_a == truth_b
+    assert truth_a["infected_cells"] == len(truth_a["parasites"])
+
+
+def test_synthesize_smear_without_parasites():
+    """Test that zero parasitemia produces no inclusions."""
+    _, truth = synthesize_smear((320, 240), seed=1, parasitemia=0.0)
+    assert truth["infected_cells"] == 0
+    assert truth["parasites"] == []
+
+
+def test_mock_frame_pool_round_robin():
+    """Test that pooled frames are served in order and wrap around."""
+    pool = MockFramePool((160, 120), size=2, seed=3)
+    first, _ = pool.next_frame()
+    second, _ = pool.next_frame()
+    third, _ = pool.next_frame()
+
+    assert first != second
+    assert third == first
+    assert first[:2] == b"\xff\xd8"
+
+
+def test_mock_capture_records_ground_truth(monkeypatch, tmp_path):
+    """Test that mock captures come from the pool with known ground truth."""
+    monkeypatch.setenv("CAMERA_MOCK_POOL_SIZE", "2")
+    camera = CameraService(streaming=False)
+    camera.resolution = (320, 240)
+
+    output = camera.capture_image(str(tmp_path / "mock.jpg"))
+
+    with Image.open(output) as image:
+        assert image.size == (320, 240)
+    assert camera.last_mock_ground_truth["cell_count"] > 0
+
+
+def test_mock_preview_blurs_downscaled_frames(monkeypatch):
+    """Test that the mock preview simulates defocus on a preview-sized frame, not a full one."""
+    monkeypatch.setenv("CAMERA_STREAM_RESOLUTION", "640x480")
+    monkeypatch.setenv("CAMERA_PREVIEW_RESOLUTION", "160x120")
+    monkeypatch.setenv("CAMERA_MOCK_FOCUS_POSITION", "5.0")
+    camera = CameraService(streaming=False)
+    blurred_shapes = []
+    apply_focus = camera._apply_mock_focus
+
+    def recording_focus(frame, scale=1):
+        blurred_shapes.append(frame.shape)
+        return apply_focus(frame, scale)
+
+    monkeypatch.setattr(camera, "_apply_mock_focus", recording_focus)
+    camera.set_lens_position(5.0)
+    sharp = camera.capture_preview_frame()
+    camera.set_lens_position(0.0)
+    defocused = camera.capture_preview_frame()
+
+    assert sharp.shape == defocused.shape == (120, 160, 3)
+    assert blurred_shapes == [(120, 160, 3)] * 2
+    assert compute_sharpness(defocused) < compute_sharpness(sharp)
+
+
+@pytest.fixture
+def replay_dir(tmp_path):
+    """Create a directory of recorded smear images."""
+    directory = tmp_path / "recorded"
+    directory.mkdir()
+    for seed in range(3):
+        frame, _ = synthesize_smear((320, 240), seed=seed)
+        Image.fromarray(frame).save(directory / f"smear_{seed}.jpg")
+    return directory
+
+
+def test_replay_camera_loops_through_recorded_images(replay_dir, tmp_path):
+    """Test that the replay device hands back recorded images in order and loops."""
+    camera = ReplayCamera(str(replay_dir), fps=0)
+    camera.configure(camera.create_still_configuration(main={"size": (320, 240)}))
+    camera.start()
+
+    outputs = []
+    for i in range(4):
+        path = tmp_path / f"replay_{i}.jpg"
+        camera.capture_file(str(path))
+        outputs.append(path.read_bytes())
+
+    assert outputs[0] == (replay_dir / "smear_0.jpg").read_bytes()
+    assert outputs[3] == outputs[0]
+
+
+def test_replay_camera_encodes_captures_to_the_requested_format(tmp_path):
+    """Test that PNG recordings captured to a .jpg path are re-encoded, not copied."""
+    directory = tmp_path / "recorded_png"
+    directory.mkdir()
+    frame, _ = synthesize_smear((320, 240), seed=0)
+    Image.fromarray(frame).save(directory / "smear_0.png")
+    camera = ReplayCamera(str(directory), fps=0)
+    camera.configure(camera.create_still_configuration(main={"size": (320, 240)}))
+    camera.start()
+
+    jpeg_path, png_path = tmp_path / "capture.jpg", tmp_path / "capture.png"
+    camera.capture_file(str(jpeg_path))
+    camera.capture_file(str(png_path))
+
+    assert sniff_extension(jpeg_path.read_bytes()[:16]) == ".jpg"
+    assert png_path.read_bytes() == (directory / "smear_0.png").read_bytes()
+
+
+def test_replay_camera_frame_cache_is_bounded_and_cleared_on_close(replay_dir, monkeypatch):
+    """Test that decoded frames are cached per camera, evicted oldest first and dropped on close."""
+    from src.infrastructure import replay_camera
+
+    monkeypatch.setattr(replay_camera, "DECODED_FRAME_CACHE", 2)
+    camera = ReplayCamera(str(replay_dir), fps=0)
+    camera.configure(camera.create_video_configuration(main={"size": (320, 240)}, lores={"size": (160, 120)}))
+    camera.start()
+
+    first = camera._decode(0, (160, 120))
+    assert camera._decode(0, (160, 120)) is first
+    camera._decode(1, (160, 120))
+    camera._decode(2, (160, 120))
+    assert list(camera._frames) == [(1, (160, 120)), (2, (160, 120))]
+
+    camera.close()
+    assert not camera._frames
+
+
+def test_replay_camera_applies_latency_and_frame_rate(replay_dir, tmp_path):
+    """Test that captures honour the configured latency and frame rate."""
+    camera = ReplayCamera(str(replay_dir), fps=20, latency_ms=50)
+    camera.configure(camera.create_still_configuration(main={"size": (320, 240)}))
+    camera.start()
+
+    start = time.monotonic()
+    for i in range(3):
+        camera.capture_file(str(tmp_path / f"timed_{i}.jpg"))
+    elapsed = time.monotonic() - start
+
+    assert elapsed >= 0.15
+
+
+def test_camera_service_replay_backend(monkeypatch, replay_dir, tmp_path):
+    """Test that CAMERA_BACKEND=replay drives CameraService through the replay device."""
+    monkeypatch.setenv("CAMERA_BACKEND", "replay")
+    monkeypatch.setenv("CAMERA_REPLAY_SOURCE", str(replay_dir))
+    monkeypatch.setenv("CAMERA_REPLAY_FPS", "0")
+    monkeypatch.setenv("CAMERA_PREVIEW_RESOLUTION", "160x120")
+    monkeypatch.setenv("CAMERA_RESOLUTION", "320x240")
+    camera = CameraService(streaming=False)
+
+    assert not camera.use_mock
+    assert isinstance(camera.camera, ReplayCamera)
+    with Image.open(camera.capture_image(str(tmp_path / "capture.jpg"))) as image:
+        assert image.size == (320, 240)
+    assert camera.capture_preview_frame().shape == (120, 160, 3)
+    camera.close()
@@ -0,0 +1,92 @@
+import threading
+import time
+import pytest
+from src.infrastructure.camera_service import CameraService
+from src.infrastructure.capture_pipeline import CapturePipeline
+from src.infrastructure.file_storage import FileStorageService
+from tests.helpers import SlowCamera, SlowInference
+
+@pytest.fixture
+def storage(tmp_path):
+    return FileStorageService(str(tmp_path / "uploads"))
+
+
+def test_pipeline_overlaps_stages(tmp_path, storage):
+    """Test that capture of one test overlaps inference of the previous one."""
+    pipeline = CapturePipeline(SlowCamera(tmp_path), SlowInference(), storage)
+    start = time.perf_counter()
+    futures = [pipeline.submit("clinic-1") for _ in range(4)]
+    outcomes = [f.result(timeout=10) for f in futures]
+    elapsed = time.perf_counter() - start
+    pipeline.close()
+
+    # Serial execution would take 4 * 2 stages * STAGE_SECONDS = 0.8s
+    assert elapsed < 0.7
+    assert len({o["image_path"] for o in outcomes}) == 4
+    assert all(storage.get_image_path(o["image_path"]).exists() for o in outcomes)
+    assert not list(tmp_path.glob("capture_*.jpg"))
+    # Captures are staged and committed like uploads, hashed on the way in
+    assert all(o["staged"].sha256 and o["staged"].committed for o in outcomes)
+    assert not any((storage.base_path / ".staging").iterdir())
+    stats = pipeline.stats()
+    assert stats["completed"] == 4
+    assert stats["throughput_per_min"] > 0
+
+
+def test_pipeline_propagates_stage_failure(tmp_path, storage):
+    """Test that a failing stage resolves the job's future with the error."""
+    pipeline = CapturePipeline(SlowCamera(tmp_path), SlowInference(valid=False), storage)
+    future = pipeline.submit("clinic-1")
+    with pytest.raises(ValueError):
+        future.result(timeout=5)
+    pipeline.close()
+
+    assert pipeline.stats()["failed"] == 1
+    assert not list(tmp_path.glob("capture_*.jpg"))
+
+
+class RacyCamera:
+    """Picamera2 stub that records overlapping captures."""
+
+    def __init__(self):
+        self.started = False
+        self.active = 0
+        self.overlaps = 0
+        self.starts = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        time.sleep(0.01)
+        self.starts += 1
+        self.started = True
+
+    def capture_file(self, path):
+        with self._lock:
+            self.active += 1
+            if self.active > 1:
+                self.overlaps += 1
+        time.sleep(0.02)
+        with open(path, "wb") as f:
+            f.write(b"\xff\xd8")
+        with self._lock:
+            self.active -= 1
+
+
+def test_camera_session_serializes_hardware_access(tmp_path):
+    """Test that concurrent captures never overlap on the camera or double-start it."""
+    camera = CameraService(streaming=False)
+    camera.camera = RacyCamera()
+    camera.use_mock = False
+
+    threads = [
+        threading.Thread(target=camera.capture_image, args=(str(tmp_path / f"c{i}.jpg"),))
+        for i in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert camera.camera.overlaps == 0
+    assert camera.camera.starts == 1
+    assert len(list(tmp_path.glob("c*.jpg"))) == 6
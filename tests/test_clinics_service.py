@@ -114,3 +114,22 @@ def test_get_clinics_filtered_by_district(db_session: Session, test_user: TokenD
     assert any(c.id == clinic1.id for c in clinics)
     assert not any(c.id == clinic2.id for c in clinics)
 
+
+def test_get_clinics_pages_by_name(db_session: Session, test_user: TokenData):
+    """Test that clinics page by name with a cursor, ties broken by id."""
+    names = ["Bobonong", "Kanye", "Kanye", "Maun", "Serowe"]
+    db_session.add_all([Clinic(id=uuid4(), name=name, district="Test", region="Test") for name in names])
+    db_session.commit()
+
+    first = service.get_clinics(test_user, db_session, limit=3)
+    second = service.get_clinics(test_user, db_session, cursor=first.next_cursor, limit=3)
+
+    assert [c.name for c in first + second] == names
+    assert len({c.id for c in first + second}) == 5
+    assert second.next_cursor is None
+
+def test_get_clinics_projects_fields(db_session: Session, test_user: TokenData, test_clinic: Clinic):
+    """Test that a field projection returns only the requested columns."""
+    clinics = service.get_clinics(test_user, db_session, fields=["name", "district"])
+
+    assert clinics == [{"name": "Central Health Clinic", "district": "Gaborone"}]
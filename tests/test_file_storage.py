@@ -0,0 +1,502 @@
+import asyncio
+import hashlib
+import io
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import pytest
+from pathlib import Path
+from uuid import uuid4
+from sqlalchemy.orm import Session
+from src.entities import test_result as entities
+from src.entities.image_checksum import ImageChecksum
+from src.exceptions import ImageTooLargeError, InvalidImageError
+from src.infrastructure.file_storage import FileStorageService
+from src.infrastructure.storage_stats import StorageStatsIndex
+
+JPEG_BYTES = b"\xff\xd8\xff\xe0" + b"smear" * 100
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"slide" * 100
+
+
+@pytest.fixture
+def cas_storage(tmp_path):
+    return FileStorageService(str(tmp_path / "uploads"), layout="cas")
+
+
+@pytest.fixture
+def dated_storage(tmp_path):
+    return FileStorageService(str(tmp_path / "uploads"), layout="dated")
+
+
+def make_result(db_session: Session, image_path: str) -> entities.TestResult:
+    result = entities.TestResult(
+        patient_id=uuid4(),
+        clinic_id=uuid4(),
+        health_worker_id=uuid4(),
+        result=entities.TestStatus.Negative,
+        image_path=image_path,
+        image_filename=image_path.rsplit("/", 1)[-1],
+    )
+    db_session.add(result)
+    db_session.commit()
+    return result
+
+
+def test_content_addressed_save_deduplicates(cas_storage):
+    """Test that identical uploads are stored once under their hash."""
+    path_a, name_a = cas_storage.save_image(JPEG_BYTES, "first.JPG", "clinic-1")
+    path_b, _ = cas_storage.save_image(JPEG_BYTES, "retry.jpeg", "clinic-2")
+
+    assert path_a == path_b
+    assert path_a.startswith("cas/")
+    assert name_a.endswith(".jpg")
+    assert len(list(cas_storage.base_path.rglob("*.jpg"))) == 1
+
+
+def test_content_addressed_extension_comes_from_content(cas_storage):
+    """Test that the stored extension follows the magic bytes, not the filename."""
+    path, _ = cas_storage.save_image(PNG_BYTES, "mislabelled.jpg", "clinic-1")
+    assert path.endswith(".png")
+
+
+def test_release_image_keeps_referenced_blob(db_session: Session, cas_storage):
+    """Test that a shared blob survives until its last reference is gone."""
+    path, _ = cas_storage.save_image(JPEG_BYTES, "a.jpg", "clinic-1")
+    first = make_result(db_session, path)
+    make_result(db_session, path)
+
+    db_session.delete(first)
+    db_session.commit()
+    assert cas_storage.release_image(db_session, path) is False
+    assert cas_storage.get_image_path(path).exists()
+
+    db_session.query(entities.TestResult).delete()
+    db_session.commit()
+    assert cas_storage.release_image(db_session, path) is True
+    assert not cas_storage.get_image_path(path).exists()
+
+
+def test_migrate_to_content_addressed(db_session: Session, dated_storage):
+    """Test that migration moves files, repoints results and reclaims duplicates."""
+    path_a, _ = dated_storage.save_image(JPEG_BYTES, "a.jpg", "clinic-1")
+    path_b, _ = dated_storage.save_image(JPEG_BYTES, "b.jpg", "clinic-1")
+    path_c, _ = dated_storage.save_image(PNG_BYTES, "c.png", "clinic-2")
+    results = [make_result(db_session, p) for p in (path_a, path_b, path_c)]
+    make_result(db_session, "clinic-3/2024-01/missing.jpg")
+
+    dry = dated_storage.migrate_to_content_addressed(db_session, dry_run=True)
+    assert dry["duplicates"] == 1
+    assert dated_storage.get_image_path(path_a).exists()
+
+    stats = dated_storage.migrate_to_content_addressed(db_session, batch_size=2)
+
+    assert stats["files_migrated"] == 2
+    assert stats["duplicates"] == 1
+    assert stats["missing"] == 1
+    assert stats["bytes_reclaimed"] == len(JPEG_BYTES)
+    for result in results:
+        db_session.refresh(result)
+        assert result.image_path.startswith("cas/")
+        assert dated_storage.get_image_path(result.image_path).exists()
+    assert results[0].image_path == results[1].image_path
+    assert not dated_storage.get_image_path(path_a).exists()
+
+
+def test_migration_keeps_old_files_until_rows_are_committed(db_session: Session, dated_storage, monkeypatch):
+    """Test that a failed commit leaves every row pointing at a file, and checksums follow the rows."""
+    path, _ = dated_storage.save_image(JPEG_BYTES, "a.jpg", "clinic-1")
+    result = make_result(db_session, path)
+    db_session.add(ImageChecksum(image_path=path, sha256=hashlib.sha256(JPEG_BYTES).hexdigest(), size_bytes=len(JPEG_BYTES)))
+    db_session.commit()
+
+    def fail():
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr(db_session, "commit", fail)
+    with pytest.raises(RuntimeError):
+        dated_storage.migrate_to_content_addressed(db_session)
+    monkeypatch.undo()
+    db_session.rollback()
+    db_session.refresh(result)
+    assert result.image_path == path
+    assert dated_storage.get_image_path(path).exists()
+
+    dated_storage.migrate_to_content_addressed(db_session)
+
+    db_session.refresh(result)
+    assert not dated_storage.get_image_path(path).exists()
+    assert dated_storage.get_image_path(result.image_path).read_bytes() == JPEG_BYTES
+    # The content-addressed name carries the checksum now
+    assert db_session.query(ImageChecksum).count() == 0
+
+
+def test_release_image_keeps_blob_pinned_by_a_concurrent_upload(db_session: Session, cas_storage):
+    """Test that compensation cannot delete a blob another upload just deduplicated against."""
+    first = cas_storage.stage_upload(io.BytesIO(JPEG_BYTES), "a.jpg")
+    path, _ = cas_storage.commit_staged(first, "clinic-1", keep_staged=True)
+    second = cas_storage.stage_upload(io.BytesIO(JPEG_BYTES), "b.jpg")
+    assert cas_storage.commit_staged(second, "clinic-1", keep_staged=True)[0] == path
+
+    # The first upload fails; the second has not inserted its result yet
+    assert cas_storage.release_image(db_session, path, first) is False
+    cas_storage.discard_staged(first)
+    assert cas_storage.get_image_path(path).exists()
+
+    cas_storage.discard_staged(second)
+    assert cas_storage.release_image(db_session, path) is True
+
+
+def test_stage_upload_hashes_and_commits(cas_storage):
+    """Test that a streamed upload is hashed on the way in and committed without re-reading."""
+    staged = cas_storage.stage_upload(io.BytesIO(JPEG_BYTES), "upload.jpg")
+
+    assert staged.size == len(JPEG_BYTES)
+    assert staged.sha256 == hashlib.sha256(JPEG_BYTES).hexdigest()
+    path, _ = cas_storage.commit_staged(staged, "clinic-1")
+    assert path == cas_storage.blob_relative_path(staged.sha256, ".jpg")
+    assert cas_storage.get_image_path(path).read_bytes() == JPEG_BYTES
+    assert not staged.path.exists()
+
+
+def test_stage_upload_aborts_when_too_large(dated_storage):
+    """Test that an upload is abandoned once it exceeds the limit."""
+    class CountingStream(io.BytesIO):
+        reads = 0
+
+        def read(self, size=-1):
+            CountingStream.reads += 1
+            return super().read(size)
+
+    stream = CountingStream(b"\xff\xd8\xff" + b"\x00" * (4 * 1024 * 1024))
+    with pytest.raises(ImageTooLargeError):
+        dated_storage.stage_upload(stream, "huge.jpg", max_bytes=300 * 1024)
+
+    assert CountingStream.reads == 2
+    assert not any((dated_storage.base_path / ".staging").iterdir())
+
+
+def test_stage_upload_rejects_non_image(dated_storage):
+    """Test that uploads without an image signature are rejected from the first chunk."""
+    with pytest.raises(InvalidImageError):
+        dated_storage.stage_upload(io.BytesIO(b"%PDF-1.4 not an image"), "doc.jpg")
+
+
+def test_failed_sync_leaves_no_partial_image(dated_storage, monkeypatch):
+    """Test that a write whose fsync fails never appears under its final name."""
+    def failing_sync(*paths):
+        raise OSError("I/O error")
+
+    monkeypatch.setattr(dated_storage.syncer, "sync", failing_sync)
+    with pytest.raises(OSError):
+        dated_storage.save_image(JPEG_BYTES, "smear.jpg", "clinic-1")
+
+    assert not [p for p in dated_storage.base_path.rglob("*") if p.is_file() and not p.name.startswith(".stats.")]
+    assert dated_storage.get_storage_stats()["total_files"] == 0
+
+
+WRITER_SCRIPT = textwrap.dedent("""
+    import os, sys
+    from src.infrastructure.file_storage import FileStorageService
+
+    storage = FileStorageService(sys.argv[1], layout="cas")
+    storage.pyramid_enabled = False
+    for i in range(100000):
+        storage.save_image(b"\\xff\\xd8\\xff" + os.urandom(64 * 1024), "smear.jpg", "clinic-1")
+        if i == 20:
+            print("ready", flush=True)
+""")
+
+
+def test_killed_writer_leaves_only_complete_images(tmp_path):
+    """Test crash consistency: after SIGKILL mid-write every stored image is whole."""
+    base = tmp_path / "uploads"
+    writer = subprocess.Popen(
+        [sys.executable, "-c", WRITER_SCRIPT, str(base)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.PIPE,
+    )
+    try:
+        assert writer.stdout.readline().strip() == b"ready"
+    finally:
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+
+    blobs = list((base / "cas").rglob("*.jpg"))
+    assert len(blobs) > 20
+    for blob in blobs:
+        # Content-addressed names make any torn write detectable
+        assert hashlib.sha256(blob.read_bytes()).hexdigest() == blob.stem
+
+
+class AsyncStream:
+    """Minimal stand-in for UploadFile's async read()."""
+
+    def __init__(self, content: bytes):
+        self._buffer = io.BytesIO(content)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+def test_async_save_and_open(dated_storage, monkeypatch):
+    """Test that images saved through the async path read back through open_image_async."""
+    monkeypatch.setattr(dated_storage, "pyramid_enabled", False)
+
+    async def roundtrip():
+        relative_path, _ = await dated_storage.save_image_async(JPEG_BYTES, "smear.jpg", "clinic-1")
+        async with dated_storage.open_image_async(relative_path) as f:
+            return relative_path, await f.read()
+
+    relative_path, content = asyncio.run(roundtrip())
+    assert relative_path.endswith(".jpg")
+    assert content == JPEG_BYTES
+    assert dated_storage.get_storage_stats()["total_files"] == 1
+    assert not list(dated_storage.base_path.rglob("*.tmp"))
+    assert not list((dated_storage.base_path / ".staging").iterdir())
+
+
+def test_async_stage_upload_matches_sync(cas_storage):
+    """Test that async staging hashes, checks and commits like stage_upload."""
+    async def stage_and_commit():
+        staged = await cas_storage.stage_upload_async(AsyncStream(PNG_BYTES), "slide.png")
+        return staged, await cas_storage.commit_staged_async(staged, "clinic-1")
+
+    staged, (path, _) = asyncio.run(stage_and_commit())
+    assert path == cas_storage.blob_relative_path(hashlib.sha256(PNG_BYTES).hexdigest(), ".png")
+    assert cas_storage.read_image(path) == PNG_BYTES
+
+    with pytest.raises(InvalidImageError):
+        asyncio.run(cas_storage.stage_upload_async(AsyncStream(b"%PDF-1.4"), "doc.jpg"))
+    assert not any((cas_storage.base_path / ".staging").iterdir())
+
+
+def smear_jpeg(size=(1600, 1200)) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (214, 150, 160)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def test_save_generates_pyramid_in_background(cas_storage):
+    """Test that saving an image queues thumbnail and preview generation."""
+    relative_path, _ = cas_storage.save_image(smear_jpeg(), "slide.jpg", "clinic-1")
+    cas_storage._get_pyramid_pool().shutdown(wait=True)
+
+    from PIL import Image
+
+    with Image.open(cas_storage.get_image_path(cas_storage.pyramid_path(relative_path, "preview"))) as preview:
+        assert max(preview.size) == 1024
+    with Image.open(cas_storage.get_image_path(cas_storage.pyramid_path(relative_path, "thumb"))) as thumb:
+        assert thumb.size == (256, 192)
+
+
+def test_delete_image_removes_pyramid(cas_storage):
+    """Test that deleting an original also removes its derivatives."""
+    relative_path, _ = cas_storage.save_image(smear_jpeg(), "slide.jpg", "clinic-1")
+    levels = cas_storage.generate_pyramid(relative_path)
+
+    assert cas_storage.delete_image(relative_path)
+    assert not any(cas_storage.get_image_path(path).exists() for path in levels.values())
+
+
+def test_backfill_pyramids_skips_existing(dated_storage, monkeypatch):
+    """Test that the backfill job only processes images without derivatives."""
+    monkeypatch.setattr(dated_storage, "pyramid_enabled", False)
+    first, _ = dated_storage.save_image(smear_jpeg((640, 480)), "a.jpg", "clinic-1")
+    dated_storage.save_image(smear_jpeg((640, 480)), "b.jpg", "clinic-1")
+    dated_storage.generate_pyramid(first)
+
+    stats = dated_storage.backfill_pyramids()
+
+    assert stats == {"scanned": 2, "generated": 1, "failed": 0}
+    assert len(list(dated_storage.iter_originals())) == 2
+
+
+def test_storage_stats_track_saves_and_deletes(dated_storage, monkeypatch):
+    """Test that counters follow saves and deletes without scanning the archive."""
+    monkeypatch.setattr(dated_storage, "pyramid_enabled", False)
+    path_a, _ = dated_storage.save_image(JPEG_BYTES, "a.jpg", "clinic-1")
+    dated_storage.save_image(PNG_BYTES, "b.png", "clinic-2")
+    dated_storage.delete_image(path_a)
+
+    stats = dated_storage.get_storage_stats()
+    month = path_a.split("/")[1]
+
+    assert stats["total_files"] == 1
+    assert stats["total_size_bytes"] == len(PNG_BYTES)
+    assert stats["by_clinic"] == {"clinic-2": {month: {"files": 1, "bytes": len(PNG_BYTES)}}}
+
+
+def test_storage_stats_persist_and_reconcile(cas_storage, monkeypatch):
+    """Test that counters survive a restart and reconciliation repairs drift."""
+    monkeypatch.setattr(cas_storage, "pyramid_enabled", False)
+    relative_path, _ = cas_storage.save_image(JPEG_BYTES, "a.jpg", "clinic-1")
+    cas_storage.stats.flush()
+
+    reopened = FileStorageService(str(cas_storage.base_path), layout="cas")
+    assert reopened.get_storage_stats()["total_files"] == 1
+
+    # A file removed behind the service's back is only picked up by reconciliation
+    cas_storage.get_image_path(relative_path).unlink()
+    assert reopened.get_storage_stats()["total_files"] == 1
+    reopened.stats.reconcile(workers=2)
+
+    stats = reopened.get_storage_stats()
+    assert stats["total_files"] == 0
+    assert stats["last_reconciled"] is not None
+
+
+def test_storage_stats_merge_writers_sharing_a_directory(tmp_path):
+    """Test that counters are batched in memory and flushes from separate writers add up."""
+    worker_a = StorageStatsIndex(tmp_path, flush_interval=60)
+    worker_b = StorageStatsIndex(tmp_path, flush_interval=60)
+    worker_a.record("clinic-1/2025-01/a.jpg", 100, 0)
+    worker_a.record("clinic-1/2025-01/b.jpg", 50, 0)
+    worker_b.record("clinic-1/2025-01/c.jpg", 10, 0)
+
+    assert not (tmp_path / ".stats.json").exists()
+
+    worker_b.flush()
+    worker_a.record("clinic-1/2025-01/b.jpg", 50, 0, files=-1)
+    stats = worker_a.snapshot()
+
+    assert stats["by_clinic"] == {"clinic-1": {"2025-01": {"files": 2, "bytes": 110}}}
+    assert worker_b.snapshot() == stats
+
+
+def test_storage_stats_exit_flush_leaves_no_files_behind(tmp_path):
+    """Test that flushing without changes, or into a removed directory, creates nothing."""
+    from src.infrastructure.storage_stats import _flush_open_indexes
+
+    idle = StorageStatsIndex(tmp_path / "idle", flush_interval=60)
+    idle.flush()
+    idle.snapshot()
+    assert not (tmp_path / "idle").exists()
+
+    removed = StorageStatsIndex(tmp_path / "removed", flush_interval=60)
+    (tmp_path / "removed").mkdir()
+    removed.record("clinic-1/2025-01/a.jpg", 100, 0)
+    (tmp_path / "removed").rmdir()
+    _flush_open_indexes()
+    assert not (tmp_path / "removed").exists()
+
+
+def test_recompress_synced_images_to_webp(dated_storage, db_session, monkeypatch):
+    """Test that synced images are re-encoded as WebP and their results repointed."""
+    from PIL import Image
+
+    monkeypatch.setattr(dated_storage, "pyramid_enabled", False)
+    buffer = io.BytesIO()
+    Image.effect_noise((400, 300), 40).convert("RGB").save(buffer, "PNG")
+    relative_path, _ = dated_storage.save_image(buffer.getvalue(), "smear.png", "clinic-1")
+    synced = make_result(db_session, relative_path)
+    synced.sync_status = entities.SyncStatus.Synced
+    db_session.commit()
+    pending_path, _ = dated_storage.save_image(buffer.getvalue(), "pending.png", "clinic-1")
+    make_result(db_session, pending_path)
+
+    stats = dated_storage.recompress_aged_images(db_session, older_than_days=None, workers=1)
+
+    db_session.refresh(synced)
+    assert stats["recompressed"] == 1
+    assert stats["bytes_saved"] > 0
+    assert synced.image_path.endswith(".webp")
+    assert not dated_storage.get_image_path(relative_path).exists()
+    assert dated_storage.get_image_path(pending_path).exists()
+    with Image.open(dated_storage.get_image_path(synced.image_path)) as image:
+        assert image.size == (400, 300)
+    assert dated_storage.get_storage_stats()["total_files"] == 2
+
+
+def test_recompress_keeps_original_when_decode_check_fails(dated_storage, db_session, monkeypatch):
+    """Test that an unreadable source is reported and never replaced."""
+    monkeypatch.setattr(dated_storage, "pyramid_enabled", False)
+    relative_path, _ = dated_storage.save_image(JPEG_BYTES, "broken.jpg", "clinic-1")
+    result = make_result(db_session, relative_path)
+    result.sync_status = entities.SyncStatus.Synced
+    db_session.commit()
+
+    stats = dated_storage.recompress_aged_images(db_session, older_than_days=None, workers=1)
+
+    assert stats["failed"] == 1
+    assert dated_storage.get_image_path(relative_path).read_bytes() == JPEG_BYTES
+    assert not [p for p in dated_storage.base_path.rglob("*.tmp")]
+
+
+def noise_png() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.effect_noise((400, 300), 40).convert("RGB").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_recompress_keeps_original_pinned_by_a_concurrent_upload(cas_storage, db_session, monkeypatch):
+    """Test that an upload deduplicated onto the original during re-encoding keeps it alive."""
+    monkeypatch.setattr(cas_storage, "pyramid_enabled", False)
+    content = noise_png()
+    relative_path, _ = cas_storage.save_image(content, "smear.png", "clinic-1")
+    synced = make_result(db_session, relative_path)
+    synced.sync_status = entities.SyncStatus.Synced
+    db_session.commit()
+    staged = cas_storage.stage_upload(io.BytesIO(content), "again.png")
+    assert cas_storage.commit_staged(staged, "clinic-1")[0] == relative_path
+
+    stats = cas_storage.recompress_aged_images(db_session, older_than_days=None, include_synced=True, workers=1)
+
+    db_session.refresh(synced)
+    assert stats["recompressed"] == 1
+    assert synced.image_path.endswith(".webp")
+    assert cas_storage.get_image_path(relative_path).read_bytes() == content
+    cas_storage.discard_staged(staged)
+
+
+def test_failed_repoint_keeps_an_existing_recompressed_blob(cas_storage, db_session, monkeypatch):
+    """Test that a failed commit only removes the re-encode it created itself."""
+    monkeypatch.setattr(cas_storage, "pyramid_enabled", False)
+    shared_path, _ = cas_storage.save_image(b"RIFF\x00\x00\x00\x00WEBPshared", "shared.webp", "clinic-1")
+    make_result(db_session, shared_path)
+    original_path, _ = cas_storage.save_image(JPEG_BYTES, "a.jpg", "clinic-1")
+    make_result(db_session, original_path)
+    temp_target = cas_storage.base_path / "re-encode.tmp"
+    temp_target.write_bytes(b"RIFF\x00\x00\x00\x00WEBPshared")
+
+    def failing_commit():
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(db_session, "commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        cas_storage._replace_with_recompressed(db_session, original_path, temp_target, Path(shared_path).stem)
+
+    assert cas_storage.get_image_path(shared_path).exists()
+    assert cas_storage.get_image_path(original_path).exists()
+    assert not temp_target.exists()
+
+
+def test_pack_layout_saves_reads_and_deletes(tmp_path):
+    """Test that the pack layout works behind the same service interface."""
+    storage = FileStorageService(str(tmp_path / "uploads"), layout="pack")
+    relative_path, _ = storage.save_image(smear_jpeg((640, 480)), "a.jpg", "clinic-1")
+    staged = storage.stage_upload(io.BytesIO(PNG_BYTES), "b.png")
+    staged_path, _ = storage.commit_staged(staged, "clinic-1")
+    storage._get_pyramid_pool().shutdown(wait=True)
+
+    assert relative_path.startswith("pack/")
+    assert storage.read_image(staged_path) == PNG_BYTES
+
+    async def read_async():
+        async with storage.open_image_async(staged_path) as f:
+            return await f.read()
+    assert asyncio.run(read_async()) == PNG_BYTES
+
+    thumb, digest = storage.resolve_image(relative_path, "thumb")
+    assert thumb[:3] == b"\xff\xd8\xff"
+    assert digest == relative_path[5:-4]
+    assert storage.get_storage_stats()["pack"]["blobs"] == 4
+
+    assert storage.delete_image(relative_path)
+    assert not storage.image_exists(relative_path)
+    assert not list((tmp_path / "uploads").rglob("*.jpg"))
@@ -0,0 +1,59 @@
+import threading
+import pytest
+from src.infrastructure import group_commit
+from src.infrastructure.group_commit import GroupCommitSyncer
+
+
+@pytest.fixture
+def synced(monkeypatch):
+    calls = []
+    monkeypatch.setattr(group_commit, "fsync_path", lambda path: calls.append(str(path)))
+    return calls
+
+
+def test_concurrent_syncs_share_batches(tmp_path, synced):
+    """Test that writers arriving together are synced in one batch, each path once."""
+    syncer = GroupCommitSyncer(window=0.05)
+    barrier = threading.Barrier(8)
+
+    def write(i):
+        barrier.wait()
+        syncer.sync(tmp_path / f"{i}.jpg", tmp_path)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    syncer.close()
+
+    stats = syncer.stats()
+    assert stats["requests"] == 8
+    assert stats["batches"] < 8
+    assert synced.count(str(tmp_path)) == stats["batches"]
+    assert len(synced) == stats["fsyncs"] == 8 + stats["batches"]
+
+
+def test_sync_failure_is_raised_to_its_writer(tmp_path):
+    """Test that a path that cannot be synced fails only the writers that asked for it."""
+    syncer = GroupCommitSyncer(window=0)
+    (tmp_path / "ok.jpg").write_bytes(b"ok")
+
+    syncer.sync(tmp_path / "ok.jpg", tmp_path)
+    with pytest.raises(FileNotFoundError):
+        syncer.sync(tmp_path / "missing.jpg")
+    syncer.close()
+
+
+def test_off_and_immediate_modes(tmp_path, synced):
+    """Test that "off" skips fsync and "immediate" syncs inline without the thread."""
+    GroupCommitSyncer(mode="off").sync(tmp_path)
+    assert synced == []
+
+    syncer = GroupCommitSyncer(mode="immediate")
+    syncer.sync(tmp_path / "a.jpg", tmp_path / "a.jpg")
+    assert synced == [str(tmp_path / "a.jpg")]
+    assert syncer._thread is None
+
+    with pytest.raises(ValueError):
+        GroupCommitSyncer(mode="sometimes")
@@ -0,0 +1,142 @@
+import pytest
+from uuid import uuid4
+from src.entities import test_result as entities
+from src.entities.evicted_image import EvictedImage
+from src.entities.image_checksum import ImageChecksum
+from src.infrastructure import integrity
+from src.infrastructure.file_storage import FileStorageService
+from src.infrastructure.integrity import IntegrityScrubber, RateLimiter
+
+
+def smear(seed: bytes) -> bytes:
+    return b"\xff\xd8\xff" + seed * 200
+
+
+def make_storage(tmp_path, layout, monkeypatch):
+    storage = FileStorageService(str(tmp_path / layout), layout=layout)
+    monkeypatch.setattr(storage, "pyramid_enabled", False)
+    return storage
+
+
+def add_result(db_session, storage, content: bytes):
+    """Store an image with a result referencing it. Returns (image_path, result id)."""
+    image_path, image_filename = storage.save_image(content, "smear.jpg", "clinic-1")
+    result = entities.TestResult(
+        patient_id=uuid4(),
+        clinic_id=uuid4(),
+        health_worker_id=uuid4(),
+        result=entities.TestStatus.Negative,
+        image_path=image_path,
+        image_filename=image_filename,
+    )
+    db_session.add(result)
+    db_session.commit()
+    # The scrubber closes its session, which detaches the result
+    return image_path, str(result.id)
+
+
+def scrubber(db_session, storage, **kwargs) -> IntegrityScrubber:
+    kwargs.setdefault("min_orphan_age", 0)
+    return IntegrityScrubber(storage, session_factory=lambda: db_session, workers=2, batch_size=2, **kwargs)
+
+
+def test_scrub_records_then_verifies_checksums(db_session, tmp_path, monkeypatch):
+    """Test that checksums are recorded on the first scrub and tampering is caught on the next."""
+    storage = make_storage(tmp_path, "dated", monkeypatch)
+    results = [add_result(db_session, storage, smear(bytes([i]))) for i in range(3)]
+
+    first = scrubber(db_session, storage).run()
+    assert first["checksums_recorded"] == 3
+    assert db_session.query(ImageChecksum).count() == 3
+
+    storage.get_image_path(results[0][0]).write_bytes(smear(b"tampered"))
+    storage.get_image_path(results[1][0]).unlink()
+    second = scrubber(db_session, storage).run()
+
+    assert second["verified"] == 1
+    assert [c["image_path"] for c in second["corrupt"]] == [results[0][0]]
+    assert second["missing"] == [{"image_path": results[1][0], "result_ids": [results[1][1]]}]
+    assert not storage.base_path.joinpath(integrity.SCRUB_STATE_FILE).exists()
+
+
+def test_scrub_checks_content_addressed_names(db_session, tmp_path, monkeypatch):
+    """Test that content-addressed blobs are verified against their names without a checksum row."""
+    storage = make_storage(tmp_path, "cas", monkeypatch)
+    add_result(db_session, storage, smear(b"a"))
+    damaged, _ = add_result(db_session, storage, smear(b"b"))
+    storage.get_image_path(damaged).write_bytes(smear(b"bit rot"))
+
+    report = scrubber(db_session, storage).run()
+
+    assert report["verified"] == 1
+    assert report["checksums_recorded"] == 0
+    assert [c["image_path"] for c in report["corrupt"]] == [damaged]
+    assert report["corrupt"][0]["expected"] in damaged
+
+
+def test_scrub_reports_orphans_but_not_evicted_or_derivatives(db_session, tmp_path, monkeypatch):
+    """Test that unreferenced files are orphans while pyramid levels and evicted originals are not."""
+    storage = make_storage(tmp_path, "dated", monkeypatch)
+    kept, _ = add_result(db_session, storage, smear(b"k"))
+    evicted, _ = add_result(db_session, storage, smear(b"e"))
+    storage.get_image_path(storage.pyramid_path(kept, "thumb")).write_bytes(smear(b"t"))
+    storage.evict_original(evicted)
+    db_session.add(EvictedImage(image_path=evicted, size_bytes=603))
+    db_session.commit()
+    orphan_path, _ = storage.save_image(smear(b"o"), "stray.jpg", "clinic-2")
+
+    report = scrubber(db_session, storage).run()
+
+    assert report["missing"] == []
+    assert report["evicted"] == 1
+    assert [o["path"] for o in report["orphans"]] == [orphan_path]
+    assert report["files_scanned"] == 3
+
+
+def test_scrub_skips_recent_files_when_looking_for_orphans(db_session, tmp_path, monkeypatch):
+    """Test that files written moments ago are not reported while their result may still be pending."""
+    storage = make_storage(tmp_path, "dated", monkeypatch)
+    storage.save_image(smear(b"o"), "in-flight.jpg", "clinic-1")
+
+    report = scrubber(db_session, storage, min_orphan_age=3600).run()
+
+    assert report["orphans"] == []
+
+
+def test_interrupted_scrub_resumes_from_checkpoint(db_session, tmp_path, monkeypatch):
+    """Test that a scrub interrupted during the orphan scan does not re-check images."""
+    storage = make_storage(tmp_path, "dated", monkeypatch)
+    for i in range(3):
+        add_result(db_session, storage, smear(bytes([i])))
+
+    def interrupted(self, db, files, report):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr(IntegrityScrubber, "_find_orphans", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            scrubber(db_session, storage).run()
+    assert storage.base_path.joinpath(integrity.SCRUB_STATE_FILE).exists()
+
+    hashed = []
+    original_hash = IntegrityScrubber._hash
+    monkeypatch.setattr(IntegrityScrubber, "_hash", lambda self, path: hashed.append(path) or original_hash(self, path))
+    report = scrubber(db_session, storage).run()
+
+    assert hashed == []
+    assert report["images_checked"] == 3
+    assert report["checksums_recorded"] == 3
+
+
+def test_rate_limiter_throttles_reads(monkeypatch):
+    """Test that reads beyond the per-second budget wait for it to refill."""
+    waits = []
+    monkeypatch.setattr(integrity.time, "sleep", waits.append)
+    limiter = RateLimiter(1000)
+
+    limiter.acquire(500)
+    limiter.acquire(1000)
+
+    assert len(waits) == 2
+    assert waits[0] == pytest.approx(0.5, abs=0.01)
+    assert waits[1] == pytest.approx(1.5, abs=0.01)
@@ -0,0 +1,219 @@
+import io
+import pytest
+import zipfile
+from datetime import datetime, timedelta
+from uuid import UUID, uuid4
+from src.entities import test_result as entities
+from src.entities.clinic import Clinic
+from src.infrastructure import parquet_snapshots
+from src.infrastructure.parquet_snapshots import ParquetSnapshots
+from tests.helpers import fake_snapshot
+
+
+@pytest.fixture
+def clinics(db_session):
+    gulu = Clinic(name="Gulu HC IV", district="Gulu", region="Northern")
+    kampala = Clinic(name="Kisenyi HC IV", district="Kampala", region="Central")
+    db_session.add_all([gulu, kampala])
+    db_session.commit()
+    return {"Gulu": gulu.id, "Kampala": kampala.id}
+
+
+def add_result(db_session, clinic_id, test_date: datetime, created_at: datetime = None) -> str:
+    result = entities.TestResult(
+        patient_id=uuid4(),
+        clinic_id=clinic_id,
+        health_worker_id=uuid4(),
+        test_date=test_date,
+        result=entities.TestStatus.Positive,
+        image_path=f"{clinic_id}/{uuid4()}.jpg",
+        image_filename="smear.jpg",
+        **({"created_at": created_at} if created_at else {}),
+    )
+    db_session.add(result)
+    db_session.commit()
+    return str(result.id)
+
+
+def snapshots(db_session, tmp_path) -> ParquetSnapshots:
+    return ParquetSnapshots(str(tmp_path / "snapshots"), session_factory=lambda: db_session, batch_rows=2)
+
+
+def test_snapshot_partitions_by_month_and_district(db_session, clinics, tmp_path):
+    """Test that results land in one file per month and district, readable as one dataset."""
+    pytest.importorskip("pyarrow")
+    import pyarrow.dataset as ds
+
+    march = [add_result(db_session, clinics["Gulu"], datetime(2025, 3, day)) for day in (1, 2, 3)]
+    add_result(db_session, clinics["Kampala"], datetime(2025, 3, 5))
+    add_result(db_session, clinics["Gulu"], datetime(2025, 4, 1))
+
+    stats = snapshots(db_session, tmp_path).run()
+
+    assert stats["partitions_written"] == 3
+    assert stats["rows_written"] == 5
+    dataset = ds.dataset(tmp_path / "snapshots" / "test_results", format="parquet", partitioning="hive")
+    table = dataset.to_table(filter=(ds.field("month") == "2025-03") & (ds.field("district") == "Gulu"))
+    assert sorted(table.column("id").to_pylist()) == sorted(march)
+    assert set(table.column("region").to_pylist()) == {"Northern"}
+    assert set(table.column("result").to_pylist()) == {"positive"}
+
+
+def test_snapshot_rewrites_only_changed_partitions(db_session, clinics, tmp_path):
+    """Test that a repeat run rewrites just the partitions with new or edited results."""
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    # Created well before the run, so outside its overlap window
+    edited = add_result(db_session, clinics["Gulu"], datetime(2025, 3, 1), created_at=datetime(2025, 3, 1, 9))
+    add_result(db_session, clinics["Kampala"], datetime(2025, 3, 1), created_at=datetime(2025, 3, 1, 10))
+    first = snapshots(db_session, tmp_path)
+    first.run()
+    kampala_before = first.partitions(district="Kampala")[0]
+
+    add_result(db_session, clinics["Gulu"], datetime(2025, 3, 9))
+    result = db_session.get(entities.TestResult, UUID(edited))
+    result.notes = "Reviewed"
+    result.result = entities.TestStatus.Negative
+    db_session.commit()
+    stats = snapshots(db_session, tmp_path).run()
+
+    assert stats["partitions_written"] == 1
+    assert first.partitions(district="Kampala")[0] == kampala_before
+    gulu = pq.read_table(tmp_path / "snapshots" / first.partitions(district="Gulu")[0]["path"])
+    assert gulu.num_rows == 2
+    assert "negative" in gulu.column("result").to_pylist()
+
+
+def test_changed_partitions_since_watermark(db_session, clinics, tmp_path):
+    """Test that results changed after the watermark, less the overlap, mark their partitions changed."""
+    add_result(db_session, clinics["Gulu"], datetime(2025, 3, 1), created_at=datetime(2025, 3, 1, 9))
+    add_result(db_session, clinics["Kampala"], datetime(2025, 4, 2), created_at=datetime(2025, 4, 2, 10))
+    # A result whose clinic is unknown belongs to the NULL district
+    add_result(db_session, uuid4(), datetime(2025, 3, 5), created_at=datetime(2025, 3, 5, 11))
+    store = ParquetSnapshots(str(tmp_path / "snapshots"), session_factory=lambda: db_session, overlap_seconds=60)
+
+    changed, watermark = store._changed_partitions(db_session, None)
+    assert changed == {("2025-03", "Gulu"), ("2025-04", "Kampala"), ("2025-03", None)}
+    assert watermark == datetime(2025, 4, 2, 10)
+
+    # The overlap re-reads the newest result; older ones stay behind the watermark
+    add_result(db_session, clinics["Gulu"], datetime(2025, 5, 1), created_at=datetime(2025, 4, 2, 10, 30))
+    changed, watermark = store._changed_partitions(db_session, watermark)
+    assert changed == {("2025-04", "Kampala"), ("2025-05", "Gulu")}
+    assert watermark == datetime(2025, 4, 2, 10, 30)
+    assert store._changed_partitions(db_session, watermark + timedelta(minutes=2)) == (set(), watermark + timedelta(minutes=2))
+
+
+def test_incremental_runs_rewrite_only_changed_partitions(db_session, clinics, tmp_path, monkeypatch):
+    """Test the partitions run() rewrites, with the Parquet writer replaced by a row count."""
+    written = []
+
+    def count_rows(self, db, month, district):
+        written.append((month, district))
+        rows = sum(len(batch) for batch in self._partition_rows(db, month, district))
+        if not rows:
+            return None
+        return {"path": str(self.partition_path(month, district)), "rows": rows, "bytes": 0, "written_at": ""}
+
+    monkeypatch.setattr(parquet_snapshots, "_require_pyarrow", lambda: None)
+    monkeypatch.setattr(ParquetSnapshots, "_write_partition", count_rows)
+    store = ParquetSnapshots(
+        str(tmp_path / "snapshots"), session_factory=lambda: db_session, batch_rows=2, overlap_seconds=0
+    )
+
+    add_result(db_session, clinics["Gulu"], datetime(2025, 3, 1), created_at=datetime(2025, 3, 1, 9))
+    add_result(db_session, clinics["Kampala"], datetime(2025, 3, 1), created_at=datetime(2025, 3, 1, 10))
+    assert store.run()["rows_written"] == 2
+    # Clinics new to the state also recheck the NULL district their results had before
+    assert set(written) == {("2025-03", "Gulu"), ("2025-03", "Kampala"), ("2025-03", None)}
+
+    written.clear()
+    add_result(db_session, clinics["Kampala"], datetime(2025, 4, 1), created_at=datetime(2025, 4, 1, 9))
+    store.run()
+    assert written == [("2025-04", "Kampala")]
+
+    # A clinic moving district rewrites its old partition (now empty) and its new one
+    written.clear()
+    gulu = db_session.get(Clinic, clinics["Gulu"])
+    gulu.district = "Omoro"
+    db_session.commit()
+    stats = store.run()
+    assert set(written) == {("2025-03", "Gulu"), ("2025-03", "Omoro")}
+    assert (stats["partitions_written"], stats["partitions_removed"]) == (1, 1)
+    assert [(p["month"], p["district"]) for p in store.partitions()] == [
+        ("2025-03", "Kampala"), ("2025-03", "Omoro"), ("2025-04", "Kampala"),
+    ]
+
+    written.clear()
+    assert store.run()["partitions_written"] == 0
+    assert written == []
+
+
+def test_clinic_edits_invalidate_their_partitions(db_session, clinics, tmp_path):
+    """Test that renaming a clinic or moving it to another district marks its partitions changed."""
+    add_result(db_session, clinics["Gulu"], datetime(2025, 3, 1))
+    add_result(db_session, clinics["Gulu"], datetime(2025, 4, 1))
+    add_result(db_session, clinics["Kampala"], datetime(2025, 3, 1))
+    store = snapshots(db_session, tmp_path)
+    _, recorded = store._changed_clinic_partitions(db_session, {})
+
+    gulu = db_session.get(Clinic, clinics["Gulu"])
+    gulu.name = "Gulu Regional Referral"
+    db_session.commit()
+    renamed, recorded = store._changed_clinic_partitions(db_session, recorded)
+
+    gulu.district = "Omoro"
+    db_session.commit()
+    moved, recorded = store._changed_clinic_partitions(db_session, recorded)
+
+    assert renamed == {("2025-03", "Gulu"), ("2025-04", "Gulu")}
+    assert moved == {("2025-03", "Gulu"), ("2025-04", "Gulu"), ("2025-03", "Omoro"), ("2025-04", "Omoro")}
+    assert store._changed_clinic_partitions(db_session, recorded)[0] == set()
+
+
+def test_snapshot_rewrites_partitions_of_a_moved_clinic(db_session, clinics, tmp_path):
+    """Test that a clinic's results leave its old district's partition when it moves."""
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    add_result(db_session, clinics["Gulu"], datetime(2025, 3, 1), created_at=datetime(2025, 3, 1, 9))
+    add_result(db_session, clinics["Kampala"], datetime(2025, 3, 1), created_at=datetime(2025, 3, 1, 10))
+    store = snapshots(db_session, tmp_path)
+    store.run()
+
+    gulu = db_session.get(Clinic, clinics["Gulu"])
+    gulu.name = "Gulu Regional Referral"
+    gulu.district = "Omoro"
+    db_session.commit()
+    stats = store.run()
+
+    assert stats["partitions_written"] == 1
+    assert stats["partitions_removed"] == 1
+    assert [p["district"] for p in store.partitions()] == ["Kampala", "Omoro"]
+    omoro = pq.read_table(tmp_path / "snapshots" / store.partitions(district="Omoro")[0]["path"])
+    assert omoro.column("clinic_name").to_pylist() == ["Gulu Regional Referral"]
+
+
+def test_snapshot_requires_pyarrow(db_session, tmp_path, monkeypatch):
+    """Test that writing without pyarrow fails with an actionable message."""
+    def missing():
+        raise RuntimeError("Parquet snapshots require pyarrow (pip install pyarrow)")
+
+    monkeypatch.setattr(parquet_snapshots, "_require_pyarrow", missing)
+    with pytest.raises(RuntimeError, match="pip install pyarrow"):
+        snapshots(db_session, tmp_path).run()
+
+
+def test_partitions_filter_and_archive_keeps_hive_paths(tmp_path):
+    """Test partition filters and that the ZIP holds the files under their dataset paths."""
+    store = fake_snapshot(tmp_path)
+
+    march = store.partitions(month_from="2025-03")
+    assert [(p["month"], p["district"]) for p in march] == [("2025-03", "Fort Portal"), ("2025-03", "Gulu"), ("2025-03", None)]
+    assert march[0]["path"] == "test_results/month=2025-03/district=Fort%20Portal/data.parquet"
+    assert [p["month"] for p in store.partitions(month_to="2025-02", district="Gulu")] == ["2025-02"]
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(store.archive(march))))
+    assert archive.namelist() == [p["path"] for p in march]
+    assert archive.read(march[1]["path"]) == b"PAR1 2025-03 Gulu"
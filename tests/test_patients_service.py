@@ -161,3 +161,15 @@ def test_get_patients_filtered_by_clinic(db_session: Session, test_user: TokenDa
     assert any(p.id == patient1.id for p in patients)
     assert not any(p.id == patient2.id for p in patients)
 
+
+def test_get_patients_pages_by_last_name(db_session: Session, test_user: TokenData, test_clinic: Clinic):
+    """Test that patients page by last name with a cursor."""
+    for last_name in ["Molefe", "Dube", "Kgosi"]:
+        db_session.add(Patient(clinic_id=test_clinic.id, first_name="A", last_name=last_name, gender=Gender.Female))
+    db_session.commit()
+
+    first = service.get_patients(test_user, db_session, limit=2, fields=["last_name"])
+    second = service.get_patients(test_user, db_session, cursor=first.next_cursor, limit=2, fields=["last_name"])
+
+    assert first + second == [{"last_name": "Dube"}, {"last_name": "Kgosi"}, {"last_name": "Molefe"}]
+    assert second.next_cursor is None
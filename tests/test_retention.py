@@ -0,0 +1,183 @@
+import pytest
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from src.entities import test_result as entities
+from src.entities.evicted_image import EvictedImage
+from src.infrastructure import file_storage, retention
+from src.infrastructure.file_storage import FileStorageService
+from src.infrastructure.pack_store import PackStore
+from src.infrastructure.retention import RetentionEngine
+
+DiskUsage = namedtuple("DiskUsage", "total used free")
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    service = FileStorageService(str(tmp_path / "uploads"), layout="dated")
+    monkeypatch.setattr(service, "pyramid_enabled", False)
+    return service
+
+
+@pytest.fixture
+def full_disk(monkeypatch):
+    """Report a 1000-byte volume at 95% usage, shrinking as images are evicted."""
+    state = {"used": 950}
+
+    def disk_usage(path):
+        return DiskUsage(1000, state["used"], 1000 - state["used"])
+
+    monkeypatch.setattr(retention.shutil, "disk_usage", disk_usage)
+    return state
+
+
+def add_result(db_session, storage, status, synced=True, age_days=0, size=100, fill=b"x"):
+    image_path, image_filename = storage.save_image(b"\xff\xd8\xff" + fill * (size - 3), "smear.jpg", "clinic-1")
+    result = entities.TestResult(
+        patient_id=uuid4(),
+        clinic_id=uuid4(),
+        health_worker_id=uuid4(),
+        result=status,
+        image_path=image_path,
+        image_filename=image_filename,
+        sync_status=entities.SyncStatus.Synced if synced else entities.SyncStatus.Pending,
+        test_date=datetime.now(timezone.utc) - timedelta(days=age_days),
+    )
+    db_session.add(result)
+    db_session.commit()
+    return result
+
+
+def test_no_eviction_below_high_watermark(db_session, storage, full_disk):
+    """Test that nothing is evicted while usage is under the high watermark."""
+    full_disk["used"] = 500
+    result = add_result(db_session, storage, entities.TestStatus.Negative)
+
+    stats = RetentionEngine(storage, high_watermark=0.9, low_watermark=0.8).run_once(db_session)
+
+    assert not stats["triggered"]
+    assert storage.get_image_path(result.image_path).exists()
+
+
+def test_evicts_synced_negatives_oldest_first(db_session, storage, full_disk):
+    """Test eviction order and that unsynced and positive images are kept."""
+    old_negative = add_result(db_session, storage, entities.TestStatus.Negative, age_days=30)
+    new_negative = add_result(db_session, storage, entities.TestStatus.Negative, age_days=1)
+    inconclusive = add_result(db_session, storage, entities.TestStatus.Inconclusive, age_days=60)
+    positive = add_result(db_session, storage, entities.TestStatus.Positive, age_days=90)
+    unsynced = add_result(db_session, storage, entities.TestStatus.Negative, synced=False, age_days=90)
+
+    original_evict = storage.evict_original
+
+    def evict(path, is_protected=None):
+        size = original_evict(path, is_protected)
+        full_disk["used"] -= size
+        return size
+
+    storage.evict_original = evict
+    # Freeing 150 bytes takes both negatives but not the inconclusive image
+    stats = RetentionEngine(storage, high_watermark=0.9, low_watermark=0.8).run_once(db_session)
+
+    assert stats["evicted"] == 2
+    assert stats["bytes_freed"] == 200
+    for kept in (inconclusive, positive, unsynced):
+        assert storage.get_image_path(kept.image_path).exists()
+    evicted = {e.image_path for e in db_session.query(EvictedImage).all()}
+    assert evicted == {old_negative.image_path, new_negative.image_path}
+
+
+def test_shared_image_with_positive_is_protected(db_session, tmp_path, full_disk):
+    """Test that a deduplicated image is kept if any result using it is positive."""
+    storage = FileStorageService(str(tmp_path / "cas"), layout="cas")
+    negative = add_result(db_session, storage, entities.TestStatus.Negative)
+    add_result(db_session, storage, entities.TestStatus.Positive)
+
+    stats = RetentionEngine(storage, high_watermark=0.9, low_watermark=0.8).run_once(db_session)
+
+    assert stats["evicted"] == 0
+    assert stats["skipped_protected"] == 1
+    assert storage.get_image_path(negative.image_path).exists()
+
+
+def test_image_pinned_by_an_upload_is_not_evicted(db_session, tmp_path, full_disk):
+    """Test that an upload deduplicating onto a candidate keeps it on disk."""
+    import io
+
+    storage = FileStorageService(str(tmp_path / "cas"), layout="cas")
+    negative = add_result(db_session, storage, entities.TestStatus.Negative)
+    content = storage.read_image(negative.image_path)
+    staged = storage.stage_upload(io.BytesIO(content), "again.jpg")
+    storage.commit_staged(staged, "clinic-1")
+
+    stats = RetentionEngine(storage, high_watermark=0.9, low_watermark=0.8).run_once(db_session)
+    storage.discard_staged(staged)
+
+    assert stats["evicted"] == 0
+    assert storage.get_image_path(negative.image_path).exists()
+    assert db_session.query(EvictedImage).count() == 0
+
+
+def test_eviction_rechecks_references_under_the_blob_lock(db_session, storage, full_disk):
+    """Test that a reference gained after the candidate check prevents eviction."""
+    negative = add_result(db_session, storage, entities.TestStatus.Negative)
+    engine = RetentionEngine(storage, high_watermark=0.9, low_watermark=0.8)
+    checks = []
+
+    def is_protected(db, image_path):
+        # Unprotected when selected, referenced by an unsynced result by the time it is evicted
+        checks.append(image_path)
+        return len(checks) > 1
+
+    engine._is_protected = is_protected
+    stats = engine.run_once(db_session)
+
+    assert checks == [negative.image_path] * 2
+    assert stats["evicted"] == 0
+    assert storage.get_image_path(negative.image_path).exists()
+
+
+def test_pack_eviction_counts_only_space_returned_by_compaction(db_session, tmp_path, monkeypatch):
+    """Test that packed evictions are compacted away and measured on the volume, not assumed."""
+    monkeypatch.setattr(file_storage, "PackStore", lambda directory, segment_size, fsync: PackStore(directory, segment_size=1024))
+    storage = FileStorageService(str(tmp_path / "uploads"), layout="pack")
+    monkeypatch.setattr(storage, "pyramid_enabled", False)
+    pack_dir = storage.base_path / "pack"
+
+    def disk_usage(path):
+        used = 1600 + sum(p.stat().st_size for p in pack_dir.glob("*.pack"))
+        return DiskUsage(6000, used, 6000 - used)
+
+    monkeypatch.setattr(retention.shutil, "disk_usage", disk_usage)
+    # Two images per segment, each negative next to a positive that must stay
+    results = []
+    for age in range(8, 0, -1):
+        status = entities.TestStatus.Negative if age % 2 == 0 else entities.TestStatus.Positive
+        results.append(add_result(db_session, storage, status, age_days=age, size=400, fill=bytes([age])))
+    before = disk_usage(None)
+
+    stats = RetentionEngine(storage, high_watermark=0.9, low_watermark=0.8).run_once(db_session)
+
+    after = disk_usage(None)
+    assert stats["triggered"] and stats["evicted"] > 0
+    assert stats["bytes_freed"] == before.used - after.used > 0
+    assert after.used <= 6000 * 0.8
+    assert stats["compaction"]["segments_compacted"] > 0
+    for result in results:
+        if result.result == entities.TestStatus.Positive:
+            assert storage.read_image(result.image_path).startswith(b"\xff\xd8\xff")
+
+
+def test_retention_engine_is_opt_in_and_needs_local_originals(storage, monkeypatch):
+    """Test that retention only starts when enabled and the backend can evict originals."""
+    monkeypatch.setattr(retention, "_retention_engine", None)
+    monkeypatch.setattr(retention, "get_storage_service", lambda: storage)
+    monkeypatch.setattr(RetentionEngine, "start", lambda self: None)
+    monkeypatch.delenv("STORAGE_RETENTION", raising=False)
+    assert retention.start_retention_engine() is None
+
+    monkeypatch.setenv("STORAGE_RETENTION", "true")
+    monkeypatch.setattr(storage, "evicts_originals", False)
+    assert retention.start_retention_engine() is None
+
+    monkeypatch.setattr(storage, "evicts_originals", True)
+    assert retention.start_retention_engine().evict
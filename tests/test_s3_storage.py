@@ -0,0 +1,242 @@
+"""
+Tests for the S3 backend.
+
+The unit tests run against an in-memory stub client. The integration tests at the
+bottom run against MinIO:
+
+    docker compose --profile s3 up -d minio
+    S3_TEST_ENDPOINT_URL=http://localhost:9000 AWS_ACCESS_KEY_ID=minioadmin \
+        AWS_SECRET_ACCESS_KEY=minioadmin pytest tests/test_s3_storage.py
+"""
+
+import io
+import math
+import os
+import pytest
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from uuid import uuid4
+
+from src.infrastructure.file_storage import CHUNK_SIZE
+from src.infrastructure.s3_storage import MB, S3StorageService
+
+ENDPOINT = os.getenv("S3_TEST_ENDPOINT_URL")
+requires_minio = pytest.mark.skipif(not ENDPOINT, reason="S3_TEST_ENDPOINT_URL not set")
+
+JPEG_BYTES = b"\xff\xd8\xff\xe0" + b"smear" * 100
+
+
+class StubClientError(Exception):
+    """Mirrors botocore's ClientError: the error code is in response["Error"]["Code"]."""
+
+    def __init__(self, code: str, operation: str):
+        super().__init__(f"An error occurred ({code}) when calling the {operation} operation")
+        self.response = {"Error": {"Code": code}}
+
+
+class StubBody:
+    def __init__(self, content: bytes):
+        self._stream = io.BytesIO(content)
+        self.closed = False
+
+    def read(self) -> bytes:
+        return self._stream.read()
+
+    def iter_chunks(self, chunk_size: int):
+        while chunk := self._stream.read(chunk_size):
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class StubS3Client:
+    """In-memory stand-in for the boto3 S3 client calls S3StorageService makes."""
+
+    exceptions = SimpleNamespace(ClientError=StubClientError)
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = []
+        self.bodies = []
+        self.denied = False
+
+    def _check_access(self, operation: str):
+        if self.denied:
+            raise StubClientError("AccessDenied", operation)
+
+    def _put(self, bucket, key, content, extra_args, config, source):
+        self._check_access("PutObject")
+        parts = 1
+        if config is not None and len(content) >= config.multipart_threshold:
+            parts = math.ceil(len(content) / config.multipart_chunksize)
+        self.objects[(bucket, key)] = (content, datetime.now(timezone.utc))
+        self.uploads.append({"key": key, "source": source, "parts": parts, **(extra_args or {})})
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None):
+        self._put(Bucket, Key, Fileobj.read(), ExtraArgs, Config, "memory")
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None):
+        self._put(Bucket, Key, Path(Filename).read_bytes(), ExtraArgs, Config, "file")
+
+    def head_object(self, Bucket, Key):
+        self._check_access("HeadObject")
+        if (Bucket, Key) not in self.objects:
+            raise StubClientError("404", "HeadObject")
+        content, modified = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(content), "LastModified": modified}
+
+    def get_object(self, Bucket, Key):
+        self._check_access("GetObject")
+        if (Bucket, Key) not in self.objects:
+            raise StubClientError("NoSuchKey", "GetObject")
+        body = StubBody(self.objects[(Bucket, Key)][0])
+        self.bodies.append(body)
+        return {"Body": body}
+
+    def delete_objects(self, Bucket, Delete):
+        self._check_access("DeleteObjects")
+        for item in Delete["Objects"]:
+            self.objects.pop((Bucket, item["Key"]), None)
+        return {}
+
+
+@pytest.fixture
+def stub_storage(tmp_path, monkeypatch):
+    monkeypatch.setenv("S3_MULTIPART_THRESHOLD_MB", "5")
+    monkeypatch.setenv("S3_MULTIPART_CHUNK_MB", "5")
+    storage = S3StorageService(
+        bucket="introspect-test", prefix="images/", base_path=str(tmp_path / "uploads"), client=StubS3Client()
+    )
+    storage.pyramid_enabled = False
+    return storage
+
+
+def test_stub_save_read_and_delete(stub_storage):
+    """Test that images round-trip through the client, deduplicated and typed by content."""
+    client = stub_storage.client
+    path_a, _ = stub_storage.save_image(JPEG_BYTES, "a.png", "clinic-1")
+    path_b, _ = stub_storage.save_image(JPEG_BYTES, "b.jpg", "clinic-2")
+
+    assert path_a == path_b
+    assert path_a.endswith(".jpg")
+    assert list(client.objects) == [("introspect-test", f"images/{path_a}")]
+    assert [upload["ContentType"] for upload in client.uploads] == ["image/jpeg"]
+    assert stub_storage.read_image(path_a) == JPEG_BYTES
+    assert stub_storage.get_storage_stats()["total_files"] == 1
+
+    assert stub_storage.delete_image(path_a)
+    assert client.objects == {}
+    assert not stub_storage.image_exists(path_a)
+    assert stub_storage.get_storage_stats()["total_files"] == 0
+    with pytest.raises(FileNotFoundError):
+        stub_storage.read_image(path_a)
+
+
+def test_stub_stream_image_yields_chunks_and_closes_body(stub_storage):
+    """Test that originals are streamed in chunks and the response body is released."""
+    content = b"\xff\xd8\xff" + os.urandom(3 * CHUNK_SIZE)
+    relative_path, _ = stub_storage.save_image(content, "large.jpg", "clinic-1")
+
+    source, _ = stub_storage.resolve_image(relative_path)
+    chunks = list(source)
+
+    assert len(chunks) > 1
+    assert b"".join(chunks) == content
+    assert stub_storage.client.bodies[-1].closed
+
+
+def test_stub_missing_object_maps_to_not_found(stub_storage):
+    """Test that 404/NoSuchKey become FileNotFoundError up front, or False on delete."""
+    missing = stub_storage.blob_relative_path("0" * 64, ".jpg")
+
+    assert not stub_storage.image_exists(missing)
+    with pytest.raises(FileNotFoundError):
+        stub_storage.stream_image(missing)
+    assert not stub_storage.delete_image(missing)
+
+
+def test_stub_other_client_errors_propagate(stub_storage):
+    """Test that errors other than a missing key are not mistaken for a missing object."""
+    relative_path, _ = stub_storage.save_image(JPEG_BYTES, "a.jpg", "clinic-1")
+    stub_storage.client.denied = True
+
+    with pytest.raises(StubClientError):
+        stub_storage.image_exists(relative_path)
+    with pytest.raises(StubClientError):
+        stub_storage.read_image(relative_path)
+    with pytest.raises(StubClientError):
+        stub_storage.save_image(JPEG_BYTES + b"other", "b.jpg", "clinic-1")
+    assert not stub_storage.delete_image(relative_path)
+
+
+def test_stub_staged_upload_is_sent_from_disk(stub_storage):
+    """Test that a staged upload is uploaded from its file and the staging file removed."""
+    staged = stub_storage.stage_upload(io.BytesIO(JPEG_BYTES), "a.jpg", max_bytes=len(JPEG_BYTES))
+    relative_path, _ = stub_storage.commit_staged(staged, "clinic-1")
+    stub_storage.discard_staged(staged)
+
+    assert stub_storage.client.uploads[-1]["source"] == "file"
+    assert stub_storage.read_image(relative_path) == JPEG_BYTES
+    assert not staged.path.exists()
+
+
+def test_stub_multipart_threshold_comes_from_environment(stub_storage):
+    """Test that uploads above S3_MULTIPART_THRESHOLD_MB are split into S3_MULTIPART_CHUNK_MB parts."""
+    pytest.importorskip("boto3")
+    small = b"\xff\xd8\xff" + os.urandom(MB)
+    large = b"\xff\xd8\xff" + os.urandom(12 * MB)
+    stub_storage.save_image(small, "small.jpg", "clinic-1")
+    staged = stub_storage.stage_upload(io.BytesIO(large), "large.jpg", max_bytes=len(large))
+    stub_storage.commit_staged(staged, "clinic-1")
+
+    assert stub_storage.transfer_config.multipart_threshold == 5 * MB
+    assert [upload["parts"] for upload in stub_storage.client.uploads] == [1, 3]
+
+
+@pytest.fixture
+def s3_storage(tmp_path, monkeypatch):
+    pytest.importorskip("boto3")
+    monkeypatch.setenv("S3_MULTIPART_THRESHOLD_MB", "5")
+    monkeypatch.setenv("S3_MULTIPART_CHUNK_MB", "5")
+    bucket = f"introspect-test-{uuid4().hex[:8]}"
+    storage = S3StorageService(bucket=bucket, endpoint_url=ENDPOINT, base_path=str(tmp_path / "uploads"))
+    storage.pyramid_enabled = False
+    storage.client.create_bucket(Bucket=bucket)
+    yield storage
+    for page in storage.client.get_paginator("list_objects_v2").paginate(Bucket=bucket):
+        for item in page.get("Contents", []):
+            storage.client.delete_object(Bucket=bucket, Key=item["Key"])
+    storage.client.delete_bucket(Bucket=bucket)
+
+
+@requires_minio
+def test_save_read_and_delete(s3_storage):
+    """Test that images round-trip through the bucket and are deduplicated."""
+    path_a, _ = s3_storage.save_image(JPEG_BYTES, "a.jpg", "clinic-1")
+    path_b, _ = s3_storage.save_image(JPEG_BYTES, "b.jpg", "clinic-2")
+
+    assert path_a == path_b
+    assert s3_storage.read_image(path_a) == JPEG_BYTES
+    assert s3_storage.get_storage_stats()["total_files"] == 1
+
+    assert s3_storage.delete_image(path_a)
+    assert not s3_storage.image_exists(path_a)
+    with pytest.raises(FileNotFoundError):
+        s3_storage.read_image(path_a)
+
+
+@requires_minio
+def test_large_staged_upload_streams_back(s3_storage):
+    """Test that a multipart upload is streamed back intact in chunks."""
+    content = b"\xff\xd8\xff" + os.urandom(12 * 1024 * 1024)
+    staged = s3_storage.stage_upload(io.BytesIO(content), "large.jpg", max_bytes=len(content))
+    relative_path, _ = s3_storage.commit_staged(staged, "clinic-1")
+
+    source, digest = s3_storage.resolve_image(relative_path)
+    chunks = list(source)
+
+    assert len(chunks) > 1
+    assert b"".join(chunks) == content
+    assert digest == staged.sha256
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+import pytest
+from src.infrastructure.stage_graph import StageGraph
+
+
+def test_independent_stages_overlap():
+    """Test that stages without a dependency between them run at the same time."""
+    both_running = threading.Barrier(2, timeout=2)
+
+    def slow(name):
+        def stage(inputs):
+            both_running.wait()
+            time.sleep(0.1)
+            return name
+        return stage
+
+    graph = StageGraph()
+    graph.add("infer", slow("infer"))
+    graph.add("store", slow("store"))
+    graph.add("insert", lambda inputs: (inputs["infer"], inputs["store"]), depends_on=["infer", "store"])
+
+    started = time.perf_counter()
+    results = asyncio.run(graph.run())
+
+    assert results["insert"] == ("infer", "store")
+    assert time.perf_counter() - started < 0.18
+    assert set(graph.timings) == {"infer_ms", "store_ms", "insert_ms"}
+    assert graph.timings["infer_ms"] >= 100
+
+
+def test_failure_compensates_completed_stages_in_reverse():
+    """Test that completed stages are undone, latest first, and dependents never start."""
+    events = []
+
+    async def store(inputs):
+        await asyncio.sleep(0.02)
+        events.append("store")
+        return "image.jpg"
+
+    def infer(inputs):
+        time.sleep(0.05)
+        raise RuntimeError("model crashed")
+
+    graph = StageGraph()
+    graph.add("validate", lambda inputs: events.append("validate"), compensate=lambda _: events.append("undo validate"))
+    graph.add("store", store, compensate=lambda path: events.append(f"release {path}"))
+    graph.add("infer", infer, depends_on=["validate"])
+    graph.add("insert", lambda inputs: events.append("insert"), depends_on=["infer", "store"])
+
+    with pytest.raises(RuntimeError, match="model crashed"):
+        asyncio.run(graph.run())
+
+    assert "insert" not in events
+    assert events == ["validate", "store", "release image.jpg", "undo validate"]
+    assert "infer_ms" in graph.timings and "insert_ms" not in graph.timings
+
+
+def test_stages_after_a_failure_do_not_start():
+    """Test that a stage whose dependencies finish after another stage failed is skipped."""
+    ran = []
+
+    def slow_validate(inputs):
+        time.sleep(0.05)
+
+    def fail(inputs):
+        raise ValueError("not an image")
+
+    graph = StageGraph()
+    graph.add("validate", slow_validate)
+    graph.add("store", fail)
+    graph.add("infer", lambda inputs: ran.append("infer"), depends_on=["validate"])
+
+    with pytest.raises(ValueError):
+        asyncio.run(graph.run())
+    assert ran == []
+
+
+def test_dependencies_must_be_declared_first():
+    """Test that unknown dependencies are rejected, which keeps the graph acyclic."""
+    graph = StageGraph()
+    with pytest.raises(ValueError):
+        graph.add("insert", lambda inputs: None, depends_on=["infer"])